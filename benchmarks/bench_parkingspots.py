@@ -0,0 +1,117 @@
+""" Benchmark of the /parkingspots endpoint.
+
+Seeds a throwaway SQLite database with the parking spots from
+data/parkingspot_info and synthetic predictions at a multiple of today's
+volume (13 spots x 673 fifteen-minute slots), then compares the endpoint
+with the former implementation, which loaded the predictions of every
+parking spot through the ORM relationship.
+
+Usage: python -m benchmarks.bench_parkingspots --scale 10 --repeat 5
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+# the benchmark never touches the configured database
+_tmp_dir = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = os.getenv(
+    "BENCH_DATABASE_URL", "sqlite:///" + os.path.join(_tmp_dir.name, "bench.db"))
+
+import numpy as np
+import pandas as pd
+
+from project import app, db
+from project.bulk import insert_dataframe
+from project.models import Parkingspot, Prediction, PredictionRun
+from project.predictionRuns import current_prediction_run_id
+
+SLOTS_PER_SPOT = 673
+
+
+def seed(scale):
+    """ creates all tables, the parking spots and one published prediction run
+    Returns: number of predictions
+    """
+    db.drop_all()
+    db.create_all()
+    df = pd.read_csv(r'data/parkingspot_info/parkhaus_infos.csv')
+    for index, row in df.iterrows():
+        db.session.add(Parkingspot(name=row['Name'], max_occupancy=row['MaxAnzahl'],
+                                   lat=row['Lat'], lon=row['Lon'], open=row['OpeningHours'],
+                                   parkingspot_type=row['Type'], height_limit=row['HeightLimit'],
+                                   handicapped_spots=row['Handicapped'], women_spots=row['Women'],
+                                   parent_child_spots=row['ParentsChild'], address=row['Address'],
+                                   url=row['URL']))
+    run = PredictionRun(created=pd.Timestamp.now().to_pydatetime(), published=pd.Timestamp.now().to_pydatetime())
+    db.session.add(run)
+    db.session.commit()
+
+    timestamps = pd.date_range("2020-01-01", periods=int(SLOTS_PER_SPOT * scale), freq='15min')
+    rng = np.random.RandomState(0)
+    frames = [pd.DataFrame({"datetime": timestamps,
+                            "occupation": rng.randint(0, 500, len(timestamps)),
+                            "rmse": rng.uniform(0, 30, len(timestamps)),
+                            "parkingspot_id": parkingspot_id,
+                            "run_id": run.id})
+              for (parkingspot_id,) in db.session.query(Parkingspot.id)]
+    num_rows, seconds = insert_dataframe(pd.concat(frames, ignore_index=True), Prediction.__table__)
+    return num_rows
+
+
+def legacy_parkingspots():
+    """ former implementation: one query per parking spot and full ORM objects
+    """
+    parking_dict = dict()
+    run_id = current_prediction_run_id()
+    for parkingspot in Parkingspot.query.all():
+        prediction_dict = dict()
+        predictions = Prediction.query.filter_by(parkingspot_id=parkingspot.id, run_id=run_id)
+        for prediction in predictions:
+            prediction_dict.update({prediction.datetime.strftime("%Y-%m-%dT%H:%M:%S"): {
+                "occupation": prediction.occupation, "rmse": prediction.rmse}})
+        parking_dict.update({parkingspot.name: {
+            "lat": parkingspot.lat, "lon": parkingspot.lon, "openingHours": parkingspot.open,
+            "spots": parkingspot.max_occupancy, "type": parkingspot.parkingspot_type,
+            "heightLimit": parkingspot.height_limit, "handicappedSpots": parkingspot.handicapped_spots,
+            "womenSpots": parkingspot.women_spots, "parentChildSpots": parkingspot.parent_child_spots,
+            "address": parkingspot.address, "url": parkingspot.url, "predictions": prediction_dict}})
+    return app.response_class(json.dumps(parking_dict, sort_keys=True), mimetype='application/json')
+
+
+def measure(function, repeat):
+    """ runs a function repeat times after one warm up run
+    Returns: dict with min, median and max wall time in seconds
+    """
+    function()
+    timings = []
+    for i in range(repeat):
+        db.session.expire_all()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {"min": min(timings), "median": float(np.median(timings)), "max": max(timings)}
+
+
+def run(scale=10, repeat=5):
+    """ seeds the database and measures both implementations
+    Returns: dict with the benchmark results
+    """
+    client = app.test_client()
+    with app.app_context():
+        num_rows = seed(scale)
+        legacy = measure(legacy_parkingspots, repeat)
+        current = measure(lambda: client.get('/parkingspots'), repeat)
+        db.session.remove()
+    return {"benchmark": "parkingspots", "scale": scale, "predictions": num_rows,
+            "legacy_seconds": legacy, "current_seconds": current,
+            "speedup": legacy["median"] / current["median"]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.scale, args.repeat), indent=2))
@@ -0,0 +1,375 @@
+""" Offline benchmark suite for ingestion, features, inference and endpoints.
+
+Seeds a throwaway SQLite database (or BENCH_DATABASE_URL, e.g. a disposable
+PostgreSQL container) with synthetic parking spots, holidays and vacations,
+writes synthetic occupancy exports, dwd archives and a MOSMIX forecast file
+at the requested scale (spots x years) and measures:
+
+    historic_occupancies   historicOccupanciesToDataframe on the exports
+    occupancy_upsert       upsert of the parsed occupancies into an empty table
+    feature_df_cold        create_feature_df with an empty calendar feature store
+    feature_df             create_feature_df served from the store
+    inference              predict_parkingspot for every parking spot
+    predict                /predict until its background job has finished
+    parkingspots           /parkingspots with the predictions of /predict
+    weather_parse          zipfileToDataframe of both dwd archives
+    weather_update         run_weather_update into an empty table
+    weather_forecast       run_weather_forecast_update
+
+Nothing is downloaded: the dwd archives are served from an offline download
+cache and the forecast of K584 from a local http server. By default the models
+are small synthetic ones, --real-models uses the joblib files in data/models.
+
+Usage: python -m benchmarks.bench_suite --spots 13 --years 2 --repeat 3 --output bench.json
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+
+# the benchmark never touches the configured database, cache or models
+_tmp_dir = tempfile.TemporaryDirectory()
+_tmp_path = Path(_tmp_dir.name)
+os.environ["DATABASE_URL"] = os.getenv(
+    "BENCH_DATABASE_URL", "sqlite:///" + str(_tmp_path / "bench.db"))
+os.environ["DOWNLOAD_CACHE_DIR"] = str(_tmp_path / "download_cache")
+os.environ["DOWNLOAD_OFFLINE"] = "1"
+os.environ["CALENDAR_FEATURES_FILE"] = str(_tmp_path / "calendar_features" / "calendar_features.json")
+os.environ["MODELS_DIR"] = str(_tmp_path / "models")
+os.environ["RMSE_DIR"] = str(_tmp_path / "models")
+
+import joblib
+import numpy as np
+import pandas as pd
+from category_encoders.target_encoder import TargetEncoder
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.preprocessing import MinMaxScaler
+
+from project import app, calendar_features, db, download_cache, dwdForecast, model_registry, utils
+from project.bulk import upsert_dataframe
+from project.calendarFeatures import build_calendar_features
+from project.models import (HistoricOccupancy, HistoricWeather, HolidayHE, HolidayRLP, Parkingspot, VacationHE,
+                            VacationRLP)
+from project.utils import historicOccupanciesToDataframe, zipfileToDataframe
+from project.views import create_feature_df, predict_parkingspot, run_weather_forecast_update, run_weather_update
+
+BENCHMARKS = ["historic_occupancies", "occupancy_upsert", "feature_df_cold", "feature_df", "inference",
+              "predict", "parkingspots", "weather_parse", "weather_update", "weather_forecast"]
+
+STATION_ID = "03137"
+TEMPERATURE_URL = ("http://opendata.dwd.de/climate_environment/CDC/observations_germany/climate/hourly/"
+                   "air_temperature/recent/stundenwerte_TU_" + STATION_ID + "_akt.zip")
+PRECIPITATION_URL = ("http://opendata.dwd.de/climate_environment/CDC/observations_germany/climate/hourly/"
+                     "precipitation/recent/stundenwerte_RR_" + STATION_ID + "_akt.zip")
+
+
+# ## synthetic data
+
+
+def spot_names(spots):
+    return ["Spot {:03d}".format(i) for i in range(spots)]
+
+
+def seed(spots, years):
+    """ creates all tables with the parking spots, holidays and vacations
+    """
+    db.drop_all()
+    db.create_all()
+    rng = np.random.RandomState(0)
+    for name in spot_names(spots):
+        db.session.add(Parkingspot(name=name, max_occupancy=int(rng.randint(100, 1500)),
+                                   lat=49.99 + rng.uniform(-0.02, 0.02), lon=8.25 + rng.uniform(-0.03, 0.03),
+                                   open="24/7", parkingspot_type="Parkhaus", height_limit="2.00",
+                                   handicapped_spots="5", women_spots="10", parent_child_spots="2",
+                                   address="Synthetic", url="http://localhost"))
+    first_year = pd.Timestamp.today().year - years
+    for year in range(first_year, pd.Timestamp.today().year + 4):
+        for month, day in [(1, 1), (5, 1), (10, 3), (12, 25), (12, 26)]:
+            db.session.add(HolidayRLP(date=pd.Timestamp(year, month, day).to_pydatetime()))
+            db.session.add(HolidayHE(date=pd.Timestamp(year, month, day).to_pydatetime()))
+        for month, length in [(4, 14), (7, 42), (10, 14)]:
+            start = pd.Timestamp(year, month, 1).to_pydatetime()
+            db.session.add(VacationRLP(start=start, end=start + pd.Timedelta(days=length)))
+            start = start + pd.Timedelta(days=7)
+            db.session.add(VacationHE(start=start, end=start + pd.Timedelta(days=length)))
+    db.session.commit()
+
+
+def write_occupancy_exports(directory, spots, years):
+    """ writes one occupancy export per year in the format of data/parkingspot_occupancy
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    names = spot_names(spots)
+    rng = np.random.RandomState(1)
+    last_year = pd.Timestamp.today().year - 1
+    times = ["{:02d}:{:02d}".format(minute // 60, minute % 60) for minute in range(0, 24 * 60, 15)]
+    for year in range(last_year - years + 1, last_year + 1):
+        rows = [[""] + names + ["Gesamtergebnis"]]
+        for day in pd.date_range(str(year) + "-01-01", str(year) + "-12-31", freq="D"):
+            if day.dayofweek == 0 or day.dayofyear == 1:
+                rows.append(["KW {}".format(day.week)] + [""] * (spots + 1))
+            values = rng.randint(0, 500, (97, spots))
+            block = values.astype(str).tolist()
+            rows.append([day.strftime("%d.%m.%Y")] + block[0] + [str(values[0].sum())])
+            rows.extend([time] + row + [""] for time, row in zip(times, block[1:]))
+        pd.DataFrame(rows).to_csv(directory / "{} Auslastung 15min.csv".format(year), header=False, index=False)
+
+
+def write_weather_archives(years):
+    """ puts synthetic dwd archives of the last years into the offline download cache
+    """
+    hours = pd.date_range(end=pd.Timestamp.today().floor("H"), periods=int(years * 365 * 24), freq="H")
+    rng = np.random.RandomState(2)
+    dates = hours.strftime("%Y%m%d%H")
+    temperature = pd.DataFrame({"STATIONS_ID": 3137, "MESS_DATUM": dates, "QN_9": 3,
+                                "TT_TU": rng.uniform(-10, 35, len(hours)).round(1),
+                                "RF_TU": rng.uniform(30, 100, len(hours)).round(1), "eor": "eor"})
+    precipitation = pd.DataFrame({"STATIONS_ID": 3137, "MESS_DATUM": dates, "QN_8": 3,
+                                  "R1": rng.exponential(0.2, len(hours)).round(1), "RS_IND": 0, "WRTR": -999,
+                                  "eor": "eor"})
+    for url, df, name in [(TEMPERATURE_URL, temperature, "produkt_tu_stunde_" + STATION_ID + ".txt"),
+                          (PRECIPITATION_URL, precipitation, "produkt_rr_stunde_" + STATION_ID + ".txt")]:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip:
+            zip.writestr(name, df.to_csv(sep=";", index=False))
+        content = buffer.getvalue()
+        content_file, meta_file = download_cache.paths(url)
+        content_file.parent.mkdir(parents=True, exist_ok=True)
+        content_file.write_bytes(content)
+        meta_file.write_text(json.dumps({"url": url, "etag": None, "last_modified": None,
+                                         "sha256": hashlib.sha256(content).hexdigest()}))
+
+
+def forecast_kmz(elements=40, timesteps=247):
+    """ a MOSMIX_L like single station archive of K584 with hourly values of many elements
+    """
+    start = pd.Timestamp.utcnow().floor("H").tz_localize(None)
+    steps = "".join("<dwd:TimeStep>{}</dwd:TimeStep>".format(timestamp.strftime("%Y-%m-%dT%H:%M:%S.000Z"))
+                    for timestamp in pd.date_range(start, periods=timesteps, freq="H"))
+    rng = np.random.RandomState(3)
+    forecasts = "".join(
+        '<dwd:Forecast dwd:elementName="{}"><dwd:value>{}</dwd:value></dwd:Forecast>'.format(
+            element, " ".join("{:10.2f}".format(value) for value in rng.uniform(0, 300, timesteps)))
+        for element in ["TTT", "RR1c"] + ["E{:02d}".format(i) for i in range(elements - 2)])
+    kml = ('<?xml version="1.0" encoding="ISO-8859-1" standalone="yes"?>'
+           '<kml:kml xmlns:dwd="https://opendata.dwd.de/weather/lib/pointforecast_dwd_extension_V1_0.xsd" '
+           'xmlns:kml="http://www.opengis.net/kml/2.2"><kml:Document><kml:ExtendedData><dwd:ProductDefinition>'
+           '<dwd:Issuer>Deutscher Wetterdienst</dwd:Issuer><dwd:ProductID>MOSMIX</dwd:ProductID>'
+           '<dwd:GeneratingProcess>DWD MOSMIX hourly, Version 1.0</dwd:GeneratingProcess>'
+           '<dwd:IssueTime>{}</dwd:IssueTime><dwd:ForecastTimeSteps>{}</dwd:ForecastTimeSteps>'
+           '</dwd:ProductDefinition></kml:ExtendedData>'
+           '<kml:Placemark><kml:name>K584</kml:name><kml:description>MAINZ-LERCHENBERG</kml:description>'
+           '<kml:ExtendedData>{}</kml:ExtendedData><kml:Point><kml:coordinates>8.15,49.97,195.0'
+           '</kml:coordinates></kml:Point></kml:Placemark></kml:Document></kml:kml>').format(
+        start.strftime("%Y-%m-%dT%H:%M:%S.000Z"), steps, forecasts)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip:
+        zip.writestr("MOSMIX_L_LATEST_K584.kml", kml.encode("ISO-8859-1"))
+    return buffer.getvalue()
+
+
+def serve(content):
+    """ serves content on a local port
+    Returns: the server and its url
+    """
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:{}/{{0}}.kmz".format(server.server_port)
+
+
+def write_synthetic_models(names):
+    """ trains one small model on synthetic calendar features and stores it for every parking spot
+    """
+    e = pd.DataFrame({"start": pd.to_datetime([]), "end": pd.to_datetime([])})
+    h = pd.DataFrame({"date": pd.to_datetime([])})
+    features = build_calendar_features(pd.date_range("2019-01-01", periods=96 * 7 * 8, freq="15min"), e, e, h, h)
+    features = features.astype("int64")
+    features["Uhrzeit"] = features["Uhrzeit"].astype(float)
+    target = 200 + 150 * np.sin(features["Uhrzeit"] / 1440 * 2 * np.pi) - 20 * features["Wochentag"]
+    targetencoder = TargetEncoder(cols=["Wochentag", "KW", "Monat"]).fit(features, target)
+    encoded = targetencoder.transform(features)
+    scaler = MinMaxScaler().fit(encoded)
+    model = RandomForestRegressor(n_estimators=50, max_depth=12, random_state=0).fit(scaler.transform(encoded), target)
+    rmse = [[[float(hour)] for hour in range(24)] for day in range(7)]
+    models_dir = model_registry.models_dir
+    models_dir.mkdir(parents=True, exist_ok=True)
+    for name in names:
+        joblib.dump(targetencoder, models_dir / ("targetenc" + name + ".sav"))
+        joblib.dump(scaler, models_dir / ("scaler" + name + ".sav"))
+        joblib.dump(model, models_dir / (name + ".sav"))
+        joblib.dump(rmse, model_registry.rmse_dir / ("rmseAll" + name + ".sav"))
+        joblib.dump("RandomForestRegressor", model_registry.rmse_dir / ("leaderAll" + name + ".sav"))
+
+
+# ## measurements
+
+
+def measure(function, repeat, setup=None, warmup=True):
+    """ runs a function repeat times, optionally after one warm up run
+        setup runs before every run and is not measured
+    Returns: dict with min, median and max wall time in seconds
+    """
+    if warmup:
+        if setup is not None:
+            setup()
+        function()
+    timings = []
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        db.session.expire_all()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {"min": min(timings), "median": float(np.median(timings)), "max": max(timings), "repeat": repeat}
+
+
+def calendar_tables():
+    return (pd.read_sql(db.session.query(VacationRLP.start, VacationRLP.end).statement, db.session.bind),
+            pd.read_sql(db.session.query(VacationHE.start, VacationHE.end).statement, db.session.bind),
+            pd.read_sql(db.session.query(HolidayRLP).statement, db.session.bind),
+            pd.read_sql(db.session.query(HolidayHE).statement, db.session.bind))
+
+
+def wait_for_job(client, response):
+    """ polls the status url of a job response until the job is done
+    """
+    url = response.get_json()["url"]
+    while True:
+        job = client.get(url).get_json()
+        if job["status"] == "failed":
+            raise RuntimeError("job {} failed: {}".format(job["id"], job["message"]))
+        if job["status"] == "finished":
+            return job
+        time.sleep(0.01)
+
+
+def clear_table(model):
+    def clear():
+        db.session.query(model).delete()
+        db.session.commit()
+    return clear
+
+
+def clear_calendar_features():
+    for path in calendar_features.path.parent.glob("*"):
+        path.unlink()
+
+
+def run(spots=13, years=1, repeat=3, only=None, real_models=False, forecast_elements=40):
+    """ seeds the database, writes the synthetic inputs and runs the benchmarks
+    Returns: dict with the benchmark results
+    """
+    selected = [name for name in BENCHMARKS if only is None or name in only]
+    results = dict()
+    client = app.test_client()
+    with app.app_context():
+        seed(spots, years)
+        names = spot_names(spots)
+        if real_models:
+            model_registry.models_dir = Path(app.root_path).parent / "data/models/Joblib_ohneWetterUndHistData"
+            model_registry.rmse_dir = Path(app.root_path).parent / "data/models/Joblib_mitWetterUndHistData"
+            names = model_registry.names()
+            for parkingspot, name in zip(Parkingspot.query.order_by(Parkingspot.id), names):
+                parkingspot.name = name
+            db.session.commit()
+        else:
+            write_synthetic_models(names)
+        write_weather_archives(years)
+        server, dwdForecast.MOSMIX_SINGLE_STATION_URL = serve(forecast_kmz(forecast_elements))
+        tables = calendar_tables()
+
+        if "historic_occupancies" in selected or "occupancy_upsert" in selected:
+            exports_dir = _tmp_path / "parkingspot_occupancy"
+            write_occupancy_exports(exports_dir, spots, years)
+            df_occupancies = historicOccupanciesToDataframe(exports_dir)
+            results["historic_occupancies"] = dict(
+                measure(lambda: historicOccupanciesToDataframe(exports_dir), repeat), rows=int(df_occupancies.size))
+        if "occupancy_upsert" in selected:
+            ids = {name: parkingspot_id for parkingspot_id, name in db.session.query(Parkingspot.id, Parkingspot.name)}
+            df = df_occupancies.stack().rename("occupation").reset_index()
+            df.columns = ["datetime", "name", "occupation"]
+            df = pd.DataFrame({"datetime": df["datetime"], "occupation": df["occupation"].astype("int64"),
+                               "max_occupation": 1500, "parkingspot_id": df["name"].map(ids)})
+            results["occupancy_upsert"] = dict(measure(
+                lambda: upsert_dataframe(df, HistoricOccupancy.__table__, ["parkingspot_id", "datetime"]),
+                repeat, setup=clear_table(HistoricOccupancy), warmup=False), rows=len(df))
+        if "feature_df_cold" in selected:
+            results["feature_df_cold"] = measure(lambda: create_feature_df(*tables), repeat,
+                                                 setup=clear_calendar_features, warmup=False)
+        if "feature_df" in selected:
+            results["feature_df"] = measure(lambda: create_feature_df(*tables), repeat)
+        if "inference" in selected:
+            feature_df = create_feature_df(*tables)
+            results["inference"] = dict(measure(
+                lambda: [predict_parkingspot(name, feature_df) for name in names], repeat), spots=len(names))
+        if "predict" in selected or "parkingspots" in selected:
+            job = wait_for_job(client, client.get('/predict'))
+            results["predict"] = dict(measure(lambda: wait_for_job(client, client.get('/predict')), repeat),
+                                      rows=job["rows"])
+        if "parkingspots" in selected:
+            response = client.get('/parkingspots')
+            results["parkingspots"] = dict(measure(lambda: client.get('/parkingspots'), repeat),
+                                           bytes=len(response.get_data()))
+        if "weather_parse" in selected:
+            results["weather_parse"] = measure(
+                lambda: [zipfileToDataframe(url=url, seperator=";") for url in [TEMPERATURE_URL, PRECIPITATION_URL]],
+                repeat, setup=utils._parsed_frames.clear, warmup=False)
+        if "weather_update" in selected:
+            rows, message = run_weather_update()
+            results["weather_update"] = dict(measure(run_weather_update, repeat, setup=clear_table(HistoricWeather)),
+                                              rows=rows)
+        if "weather_forecast" in selected:
+            rows = run_weather_forecast_update()
+            results["weather_forecast"] = dict(measure(run_weather_forecast_update, repeat), rows=rows)
+        server.shutdown()
+        db.session.remove()
+
+    return {"benchmark": "suite", "commit": current_commit(), "database": db.engine.dialect.name,
+            "spots": spots, "years": years, "models": "real" if real_models else "synthetic",
+            "results": {name: results[name] for name in selected}}
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--spots", type=int, default=13)
+    parser.add_argument("--years", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", help="comma separated benchmarks, one of " + ", ".join(BENCHMARKS))
+    parser.add_argument("--real-models", action="store_true", help="use the models in data/models")
+    parser.add_argument("--forecast-elements", type=int, default=40, help="forecast elements per time step")
+    parser.add_argument("--output", help="write the results to this file instead of stdout")
+    args = parser.parse_args()
+    results = run(args.spots, args.years, args.repeat, args.only.split(",") if args.only else None,
+                  args.real_models, args.forecast_elements)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
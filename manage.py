@@ -1,3 +1,4 @@
+import click
 from flask.cli import FlaskGroup
 
 from project import app, db
@@ -5,11 +6,16 @@ from project.models import Parkingspot, HistoricOccupancy, HistoricWeather, Fore
 
 import pandas as pd
 import math
+import time
 import os
 import glob
 from datetime import datetime
 from pathlib import Path
 from project.utils import zipfileToDataframe, concatenateHistoricRecentData, historicOccupanciesToDataframe
+from project.bulk import upsert_dataframe
+from project.dwdForecast import getStationsAsDataframe
+from project.migrations import migrate, partition_historic_occupancy
+from project.occupancyRollups import refresh_occupancy_rollups
 import numpy
 from psycopg2.extensions import register_adapter, AsIs
 
@@ -42,6 +48,39 @@ def seed_db():
     seed_weather_historic()
     seed_weather_forecast()
 
+
+@cli.command("migrate_db")
+@click.option("--partition", is_flag=True, help="partition historic_occupancy by year (PostgreSQL only)")
+def migrate_db(partition):
+    """ applies new tables, columns and indexes of the models to an existing database
+    """
+    applied = migrate()
+    if partition:
+        applied += partition_historic_occupancy()
+    for step in applied:
+        print(step)
+    print("database is up to date" if not applied else "applied {} migration steps".format(len(applied)))
+
+
+@cli.command("refresh_rollups")
+@click.option("--full", is_flag=True, help="rebuild the rollups from all historic occupancies")
+def refresh_rollups(full):
+    """ recomputes the hourly, daily and weekday profile rollups touched since the last refresh
+    """
+    print("processed {} records for the occupancy rollups".format(refresh_occupancy_rollups(full=full)))
+
+
+@cli.command("update_stations")
+def update_stations():
+    """ downloads the coordinates of all MOSMIX stations into the station catalogue
+    """
+    stations = getStationsAsDataframe(spool_max_size=app.config["FORECAST_SPOOL_MAX_SIZE"])
+    path = Path(app.config["WEATHER_STATIONS_FILE"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    stations.to_csv(path, index=False)
+    print("saved {} stations to {}".format(len(stations), path))
+
+
 # ## Seed functions
 
 
@@ -71,35 +110,41 @@ def seed_occupancies_historic():
 
     df_occupancies = historicOccupanciesToDataframe(occupancies_dir)
     df_maxoccupancies = historicOccupanciesToDataframe(max_occupancies_dir)
+    # align capacities to the occupancy timestamps, missing timestamps become NaN
+    df_maxoccupancies = df_maxoccupancies.reindex(df_occupancies.index)
+    parkingspots = {parkingspot.name: parkingspot for parkingspot in Parkingspot.query.all()}
     parkingspotNames = list(df_occupancies)
     print("Parkingspots: " , parkingspotNames)
+    frames = []
     for parkingspotName in parkingspotNames:
-        print("seeding " + parkingspotName + " ...")
-        try:
-            parkingspot_db = Parkingspot.query.filter_by(
-                name=parkingspotName).first()
-            parkingspot_id = parkingspot_db.id
-            for index, row in df_occupancies.iterrows():
-                timestamp = index
-                occupation = row[parkingspotName]
-                try:
-                    maxOccupation = df_maxoccupancies.loc[timestamp,parkingspotName]
-                except:
-                    maxOccupation = parkingspot_db.max_occupancy
-                # check for missing values
-                if math.isnan(occupation):
-                    occupation = -999
-                if math.isnan(maxOccupation):
-                    maxOccupation = parkingspot_db.max_occupancy
-                historic_occupancy = HistoricOccupancy(
-                    datetime=timestamp, occupation=occupation, max_occupation= maxOccupation, parkingspot_id=parkingspot_id)
-                db.session.add(historic_occupancy)
-            #try:
-            db.session.commit()
-            #except:
-                #db.session.rollback()
-        except:
+        parkingspot_db = parkingspots.get(parkingspotName)
+        if parkingspot_db is None:
             print("Error: Parkingspot {} not found in DB".format(parkingspotName))
+            continue
+        print("seeding " + parkingspotName + " ...")
+        # check for missing values
+        occupation = pd.to_numeric(
+            df_occupancies[parkingspotName], errors="coerce").fillna(-999)
+        if parkingspotName in df_maxoccupancies:
+            maxOccupation = pd.to_numeric(
+                df_maxoccupancies[parkingspotName], errors="coerce").fillna(parkingspot_db.max_occupancy)
+        else:
+            maxOccupation = parkingspot_db.max_occupancy
+        frames.append(pd.DataFrame({
+            "datetime": df_occupancies.index,
+            "occupation": occupation.values.astype("int64"),
+            "max_occupation": pd.Series(maxOccupation, index=df_occupancies.index).values.astype("int64"),
+            "parkingspot_id": parkingspot_db.id}))
+    if not frames:
+        return
+    # existing (parkingspot_id, datetime) rows are skipped, so seeding can be repeated
+    start = time.perf_counter()
+    num_rows_added, num_rows_skipped = upsert_dataframe(
+        pd.concat(frames, ignore_index=True), HistoricOccupancy.__table__, ["parkingspot_id", "datetime"])
+    seconds = time.perf_counter() - start
+    print("added {} records, skipped {} existing records in {:.1f}s ({:.0f} rows/s)".format(
+        num_rows_added, num_rows_skipped, seconds, (num_rows_added + num_rows_skipped) / max(seconds, 1e-9)))
+    print("processed {} records for the occupancy rollups".format(refresh_occupancy_rollups()))
 
 
 def seed_predictions():
@@ -1,11 +1,25 @@
 from flask import Flask, jsonify
 from flask_sqlalchemy import SQLAlchemy
+from project.modelRegistry import ModelRegistry
+from project.downloadCache import DownloadCache
+from project.calendarFeatures import CalendarFeatureStore
+from project.metrics import RequestMetrics
 
 
 # ### Config
 app = Flask(__name__)
 app.config.from_object("project.config.Config")
 db = SQLAlchemy(app)
+model_registry = ModelRegistry(app.config["MODELS_DIR"], app.config["RMSE_DIR"],
+                               memory_budget=app.config["MODEL_MEMORY_BUDGET"],
+                               mmap_mode=app.config["MODEL_MMAP_MODE"])
+if app.config["PRELOAD_MODELS"]:
+    model_registry.preload()
+download_cache = DownloadCache(app.config["DOWNLOAD_CACHE_DIR"], offline=app.config["DOWNLOAD_OFFLINE"])
+calendar_features = CalendarFeatureStore(app.config["CALENDAR_FEATURES_FILE"],
+                                         years_ahead=app.config["CALENDAR_YEARS_AHEAD"])
+request_metrics = RequestMetrics(slow_request_seconds=app.config["METRICS_SLOW_REQUEST_SECONDS"])
+request_metrics.init_app(app)
 
 # import views
 from . import views
\ No newline at end of file
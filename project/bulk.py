@@ -0,0 +1,125 @@
+import io
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import and_, bindparam
+
+from project import db
+
+
+def insert_dataframe(df, table, chunksize=50000):
+    """ writes all rows of a dataframe into a table \n
+        uses COPY on PostgreSQL and batched executemany on other backends \n
+        the dataframe columns have to match the column names of the table
+    Returns: number of written rows and the elapsed time in seconds
+    """
+    start = time.perf_counter()
+    if db.engine.dialect.name == "postgresql":
+        connection = db.engine.raw_connection()
+        try:
+            _copy_dataframe(connection.cursor(), df, table.name, chunksize)
+            connection.commit()
+        except:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+    else:
+        with db.engine.begin() as connection:
+            for begin in range(0, len(df), chunksize):
+                connection.execute(table.insert(), dataframe_records(df.iloc[begin:begin + chunksize]))
+    return len(df), time.perf_counter() - start
+
+
+def upsert_dataframe(df, table, keys, update=False, chunksize=50000):
+    """ inserts all rows of a dataframe whose keys are not yet in the table \n
+        existing rows are skipped or, with update=True, overwritten. keys is a
+        column name or a list of column names covered by a unique index, of
+        duplicate keys within the frame the last row is used. On PostgreSQL the
+        rows are copied into a temporary table and merged with one
+        INSERT ... SELECT DISTINCT ON ... ON CONFLICT, other backends look up
+        the existing keys and bulk insert (and update) the rest
+    Returns: number of inserted rows and number of skipped (or updated) rows
+    """
+    if isinstance(keys, str):
+        keys = [keys]
+    if df.empty:
+        return 0, 0
+    if db.engine.dialect.name == "postgresql":
+        num_inserted = _upsert_postgresql(df, table, keys, update, chunksize)
+        return num_inserted, len(df) - num_inserted
+
+    num_rows = len(df)
+    df = df.drop_duplicates(keys, keep="last")
+    with db.engine.begin() as connection:
+        key_columns = [table.c[key] for key in keys]
+        lower, upper = dataframe_records(df[keys].agg(["min", "max"]))
+        existing = connection.execute(db.select(key_columns).where(and_(*[
+            column.between(lower[column.name], upper[column.name]) for column in key_columns]))).fetchall()
+        if existing:
+            existing = pd.MultiIndex.from_tuples([tuple(row) for row in existing])
+            is_new = ~pd.MultiIndex.from_frame(df[keys]).isin(existing)
+        else:
+            is_new = np.ones(len(df), dtype=bool)
+        for begin in range(0, int(is_new.sum()), chunksize):
+            connection.execute(table.insert(), dataframe_records(df.loc[is_new].iloc[begin:begin + chunksize]))
+        if update and not is_new.all():
+            statement = table.update().where(and_(*[
+                column == bindparam("b_" + column.name) for column in key_columns])).values(
+                {column: bindparam("b_" + column) for column in df.columns if column not in keys})
+            connection.execute(statement, [{"b_" + column: value for column, value in record.items()}
+                                           for record in dataframe_records(df.loc[~is_new])])
+    num_inserted = int(is_new.sum())
+    return num_inserted, num_rows - num_inserted
+
+
+def _upsert_postgresql(df, table, keys, update, chunksize):
+    columns = ", ".join(df.columns)
+    staging = "staging_" + table.name
+    if update:
+        conflict = "DO UPDATE SET " + ", ".join(
+            "{0} = EXCLUDED.{0}".format(column) for column in df.columns if column not in keys)
+    else:
+        conflict = "DO NOTHING"
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        # only the copied columns, defaults like the id sequence are left to the final insert
+        cursor.execute("CREATE TEMPORARY TABLE {0} ON COMMIT DROP AS SELECT {2}, 0::bigint AS staging_row "
+                       "FROM {1} WITH NO DATA".format(staging, table.name, columns))
+        _copy_dataframe(cursor, df.assign(staging_row=np.arange(len(df))), staging, chunksize)
+        # xmax is 0 for inserted rows and set for rows updated by ON CONFLICT
+        cursor.execute(
+            "WITH upserted AS (INSERT INTO {0} ({2}) SELECT DISTINCT ON ({3}) {2} FROM {1} "
+            "ORDER BY {3}, staging_row DESC ON CONFLICT ({3}) {4} RETURNING xmax = 0 AS inserted) "
+            "SELECT count(*) FROM upserted WHERE inserted".format(
+                table.name, staging, columns, ", ".join(keys), conflict))
+        num_inserted = cursor.fetchone()[0]
+        connection.commit()
+    except:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    return num_inserted
+
+
+def _copy_dataframe(cursor, df, table_name, chunksize):
+    statement = "COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(
+        table_name, ", ".join(df.columns))
+    # stream the frame in chunks to keep the csv buffer small
+    for begin in range(0, len(df), chunksize):
+        buffer = io.StringIO()
+        df.iloc[begin:begin + chunksize].to_csv(
+            buffer, header=False, index=False, date_format="%Y-%m-%d %H:%M:%S")
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+
+
+def dataframe_records(df):
+    """ converts a dataframe to a list of dicts with python scalars for the dbapi driver
+    """
+    columns = list(df.columns)
+    values = df.astype(object).where(pd.notnull(df), None)
+    return [dict(zip(columns, row)) for row in values.itertuples(index=False, name=None)]
@@ -0,0 +1,309 @@
+import datetime as datetime2
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# features of create_feature_df in model input order with their stored dtype
+CALENDAR_COLUMNS = [
+    ("Wochentag", "int8"), ("Uhrzeit", "int16"), ("KW", "int8"), ("Monat", "int8"),
+    ("bisFeiertagRlp", "int16"), ("bisFeiertagHe", "int16"),
+    ("nachFeiertagRlp", "int16"), ("nachFeiertagHe", "int16"),
+    ("SchulferienRlp", "int8"), ("SchulferienHe", "int8"), ("Weihnachten", "int8")]
+
+# columns which depend on a holiday or vacation table, all others only on the timestamp
+SOURCE_COLUMNS = {
+    "ferienRlp": ["SchulferienRlp"],
+    "ferienHe": ["SchulferienHe"],
+    "feiertageRlp": ["bisFeiertagRlp", "nachFeiertagRlp"],
+    "feiertageHe": ["bisFeiertagHe", "nachFeiertagHe"]}
+
+FREQ = pd.Timedelta(minutes=15)
+
+
+class CalendarFeatureStore(object):
+    """
+    A class used to serve the calendar features of create_feature_df by slicing
+
+    The features are materialized at 15 minute resolution from the start of
+    the year of the first request until years_ahead years after the last one
+    and kept in a memory-mapped .npy file, which all workers share. Every
+    column depending on a holiday or vacation table remembers a fingerprint
+    of that table, only the columns of changed tables are recomputed. The
+    range is rebuilt completely when a request does not fit into it.
+
+    The metadata file is replaced last, so readers always see a complete
+    array file.
+
+
+    Attributes
+    ----------
+    path : Path
+        metadata file, the array files are written next to it
+    years_ahead : int
+        years materialized after the requested range
+
+    Methods
+    -------
+    features(start, end, ferienRlp, ferienHe, feiertageRlp, feiertageHe)
+        returns the calendar features of every quarter hour from start to end
+    refresh(start, end, ferienRlp, ferienHe, feiertageRlp, feiertageHe)
+        brings the stored features up to date, returns the recomputed columns
+    """
+
+    def __init__(self, path, years_ahead=3):
+        self.path = Path(path)
+        self.years_ahead = years_ahead
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def features(self, start, end, ferienRlp, ferienHe, feiertageRlp, feiertageHe):
+        """ slices the stored features, refreshes them first if necessary
+        Returns: dataframe with one row per quarter hour from start to end (inclusive)
+        """
+        start = pd.Timestamp(start).floor(FREQ)
+        end = pd.Timestamp(end).ceil(FREQ)
+        with self._lock:
+            # the entry covering start and end, a later refresh swaps in a new one
+            self._refresh(start, end, ferienRlp, ferienHe, feiertageRlp, feiertageHe)
+            meta, values = self._entry
+        first = int((start - pd.Timestamp(meta["start"])) / FREQ)
+        last = int((end - pd.Timestamp(meta["start"])) / FREQ)
+        rows = values[first:last + 1]
+        return pd.DataFrame({name: rows[name] for name, dtype in CALENDAR_COLUMNS},
+                            index=pd.date_range(start, end, freq=FREQ))
+
+    def refresh(self, start, end, ferienRlp, ferienHe, feiertageRlp, feiertageHe):
+        """ recomputes the features of changed tables, the whole range if start or end is not covered
+        Returns: list of the recomputed columns
+        """
+        with self._lock:
+            return self._refresh(start, end, ferienRlp, ferienHe, feiertageRlp, feiertageHe)
+
+    def _refresh(self, start, end, ferienRlp, ferienHe, feiertageRlp, feiertageHe):
+        sources = {"ferienRlp": ferienRlp, "ferienHe": ferienHe,
+                   "feiertageRlp": feiertageRlp, "feiertageHe": feiertageHe}
+        fingerprints = {name: _fingerprint(frame) for name, frame in sources.items()}
+        meta, values = self._load()
+        if meta is None or pd.Timestamp(start) < pd.Timestamp(meta["start"]) or \
+                pd.Timestamp(end) > pd.Timestamp(meta["end"]):
+            first = pd.Timestamp(min(pd.Timestamp(start), pd.Timestamp.today()).year, 1, 1)
+            last = pd.Timestamp(max(pd.Timestamp(end).year, pd.Timestamp.today().year) + self.years_ahead + 1,
+                                1, 1) - FREQ
+            timestamps = pd.date_range(first, last, freq=FREQ)
+            values = _empty(len(timestamps))
+            columns = [name for name, dtype in CALENDAR_COLUMNS]
+        else:
+            timestamps = pd.date_range(meta["start"], meta["end"], freq=FREQ)
+            changed = [name for name in sources if meta["fingerprints"].get(name) != fingerprints[name]]
+            if not changed:
+                return []
+            values = np.array(values)
+            columns = [column for name in changed for column in SOURCE_COLUMNS[name]]
+
+        features = build_calendar_features(timestamps, columns=columns, **sources)
+        for column in columns:
+            values[column] = features[column]
+        self._save({"start": str(timestamps[0]), "end": str(timestamps[-1]),
+                    "fingerprints": fingerprints}, values)
+        return columns
+
+    def _load(self, force=False):
+        """ returns metadata and memory-mapped array, read again when the metadata file changes
+        """
+        while True:
+            try:
+                mtime = self.path.stat().st_mtime_ns
+            except FileNotFoundError:
+                return None, None
+            if not force and self._entry is not None and self._entry[0].get("mtime") == mtime:
+                return self._entry
+            with open(self.path, "r") as file:
+                meta = json.load(file)
+            meta["mtime"] = mtime
+            try:
+                values = np.load(self.path.with_name(meta["file"]), mmap_mode="r")
+            except FileNotFoundError:
+                # another process replaced the version in the meantime
+                continue
+            # swapped in at once, readers see either the old or the new entry
+            self._entry = (meta, values)
+            return self._entry
+
+    def _save(self, meta, values):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        old_meta, old_values = self._entry if self._entry is not None else (None, None)
+        # a new array file per version, readers of the old version keep their mapping
+        meta["file"] = "{}.{}.npy".format(self.path.stem, hashlib.sha256(values.tobytes()).hexdigest()[:16])
+        _replace_file(self.path.with_name(meta["file"]), lambda file: np.save(file, values), "wb")
+        _replace_file(self.path, lambda file: json.dump(meta, file), "w")
+        if old_meta is not None and old_meta["file"] != meta["file"]:
+            try:
+                os.remove(self.path.with_name(old_meta["file"]))
+            except OSError:
+                pass
+        # the mtime of the replaced file can equal the old one on coarse file systems
+        self._load(force=True)
+
+
+def _replace_file(path, write, mode):
+    """ writes a file next to path and moves it into place, the unique name works across threads and processes
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=str(path.parent), prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as file:
+            write(file)
+        os.replace(tmp_name, str(path))
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+
+
+def build_calendar_features(timestamps, ferienRlp, ferienHe, feiertageRlp, feiertageHe, columns=None):
+    """ computes calendar features for the given timestamps without the store
+    Returns: dataframe with the requested columns of CALENDAR_COLUMNS in their compact dtypes
+    """
+    timestamps = pd.DatetimeIndex(timestamps)
+    columns = [name for name, dtype in CALENDAR_COLUMNS] if columns is None else columns
+    compute = {
+        "Wochentag": lambda: timestamps.dayofweek,
+        "Uhrzeit": lambda: timestamps.hour * 60 + timestamps.minute,
+        "KW": lambda: calendarWeeks(timestamps),
+        "Monat": lambda: timestamps.month,
+        "bisFeiertagRlp": lambda: shoppingdaystonextfeiertag(timestamps, feiertageRlp),
+        "bisFeiertagHe": lambda: shoppingdaystonextfeiertag(timestamps, feiertageHe),
+        "nachFeiertagRlp": lambda: shoppingdaysafterfeiertag(timestamps, feiertageRlp),
+        "nachFeiertagHe": lambda: shoppingdaysafterfeiertag(timestamps, feiertageHe),
+        "SchulferienRlp": lambda: isschulferien(timestamps, ferienRlp),
+        "SchulferienHe": lambda: isschulferien(timestamps, ferienHe),
+        "Weihnachten": lambda: timestamps.month == 12}
+    dtypes = dict(CALENDAR_COLUMNS)
+    return pd.DataFrame({name: np.asarray(compute[name]()).astype(dtypes[name]) for name in columns},
+                        index=timestamps)
+
+
+def calendarWeeks(timestamps):
+    """ calculates the ISO calendar week of every timestamp, equals calcCalendarWeek
+    """
+    days = _to_days(timestamps)
+    # thursday of the same ISO week decides the year (1970-01-01 was a thursday)
+    weekday = (days.astype('int64') + 3) % 7
+    thursdays = days - weekday + 3
+    return (thursdays - thursdays.astype('datetime64[Y]').astype('datetime64[D]')).astype('int64') // 7 + 1
+
+
+def calcCalendarWeek(df):
+    """ calculates actual calender week.
+    """
+    now = df.date()
+    kw = datetime2.date(now.year, now.month, now.day).isocalendar()[1]
+    return kw
+
+
+# ### working days till next holiday
+SHOPPING_WEEKMASK = 'Mon Tue Wed Thu Fri Sat'
+
+
+def shoppingdaystonextfeiertag(timestamps, feiertage):
+    """ calculates workingdays till next holiday for every timestamp.
+
+        Every distinct day is computed once with sorted holidays and
+        np.searchsorted. Equals the minimum of all non-negative
+        np.busday_count(day, feiertag) values, 100 if no holiday is found.
+    """
+    days, inverse = np.unique(_to_days(timestamps), return_inverse=True)
+    feiertage = np.unique(_to_days(feiertage.date))
+    result = np.full(len(days), 100, dtype='int64')
+    if len(feiertage) > 0:
+        position = np.searchsorted(feiertage, days, side='left')
+        # first holiday on or after the day
+        has_next = position < len(feiertage)
+        next_feiertage = feiertage[np.minimum(position, len(feiertage) - 1)]
+        diff_next = np.busday_count(days, next_feiertage, weekmask=SHOPPING_WEEKMASK)
+        result = np.where(has_next, diff_next, result)
+        # an earlier holiday counts as 0 if only sundays lie in between
+        has_previous = position > 0
+        previous_feiertage = feiertage[np.maximum(position - 1, 0)]
+        diff_previous = np.busday_count(days, previous_feiertage, weekmask=SHOPPING_WEEKMASK)
+        result = np.where(has_previous & (diff_previous == 0), 0, result)
+    return result[inverse]
+
+
+# ## weekdays after holiday
+def shoppingdaysafterfeiertag(timestamps, feiertage):
+    """ calculates workingdays after last holiday for every timestamp.
+
+        Every distinct day is computed once with sorted holidays and
+        np.searchsorted. Equals the minimum of all non-negative
+        np.busday_count(feiertag, day) values, 100 if no holiday is found.
+    """
+    days, inverse = np.unique(_to_days(timestamps), return_inverse=True)
+    feiertage = np.unique(_to_days(feiertage.date))
+    result = np.full(len(days), 100, dtype='int64')
+    if len(feiertage) > 0:
+        position = np.searchsorted(feiertage, days, side='right')
+        # last holiday on or before the day
+        has_previous = position > 0
+        previous_feiertage = feiertage[np.maximum(position - 1, 0)]
+        diff_previous = np.busday_count(previous_feiertage, days, weekmask=SHOPPING_WEEKMASK)
+        result = np.where(has_previous, diff_previous, result)
+        # a later holiday counts as 0 if only sundays lie in between
+        has_next = position < len(feiertage)
+        next_feiertage = feiertage[np.minimum(position, len(feiertage) - 1)]
+        diff_next = np.busday_count(next_feiertage, days, weekmask=SHOPPING_WEEKMASK)
+        result = np.where(has_next & (diff_next == 0), 0, result)
+    return result[inverse]
+
+
+def _to_days(timestamps):
+    """ truncates timestamps to calendar days
+    """
+    return pd.DatetimeIndex(timestamps).values.astype('datetime64[D]')
+
+
+def isschulferien(timestamps, ferien):
+    """ flags timestamps within a vacation (start and end inclusive).
+
+        Vacations are sorted by start; a timestamp lies in a vacation if the
+        largest end of all vacations starting before it is not yet reached.
+    """
+    timestamps = pd.DatetimeIndex(timestamps).values
+    result = np.zeros(len(timestamps), dtype='int64')
+    if len(ferien) == 0:
+        return result
+    order = np.argsort(ferien['start'].values, kind='mergesort')
+    starts = pd.DatetimeIndex(ferien['start']).values[order]
+    ends = np.maximum.accumulate(pd.DatetimeIndex(ferien['end']).values[order])
+    position = np.searchsorted(starts, timestamps, side='right') - 1
+    in_ferien = (position >= 0) & (ends[np.maximum(position, 0)] >= timestamps)
+    result[in_ferien] = 1
+    return result
+
+
+def isweihnachten(series):
+    """ flags december as christmas month.
+    """
+    if series.month == 12:
+        return 1
+    else:
+        return 0
+
+
+def _fingerprint(frame):
+    """ sha256 of the timestamps of a holiday or vacation table, independent of row order and ids
+    """
+    columns = [column for column in frame.columns if column != "id"]
+    values = np.stack([pd.DatetimeIndex(frame[column]).values.astype('int64') for column in columns], axis=-1) \
+        if len(frame) else np.empty((0, len(columns)), dtype='int64')
+    values = np.unique(values, axis=0)
+    return hashlib.sha256(",".join(columns).encode("utf-8") + values.tobytes()).hexdigest()
+
+
+def _empty(num_rows):
+    return np.zeros(num_rows, dtype=[(name, dtype) for name, dtype in CALENDAR_COLUMNS])
@@ -4,4 +4,44 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 
 class Config(object):
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL")
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    MODELS_DIR = os.getenv("MODELS_DIR", "data/models/Joblib_ohneWetterUndHistData")
+    RMSE_DIR = os.getenv("RMSE_DIR", "data/models/Joblib_mitWetterUndHistData")
+    # load all models when the app is imported (use with gunicorn --preload)
+    PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "0") == "1"
+    # maximum size of loaded model files in bytes, 0 means unlimited
+    MODEL_MEMORY_BUDGET = int(os.getenv("MODEL_MEMORY_BUDGET", "0"))
+    MODEL_MMAP_MODE = os.getenv("MODEL_MMAP_MODE", "r") or None
+    # threads used by /predict to process the parking spots in parallel
+    PREDICT_WORKERS = int(os.getenv("PREDICT_WORKERS", "0")) or os.cpu_count() or 1
+    # background jobs for /predict and the weather endpoints
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+    # queued or running jobs older than this are considered dead (seconds)
+    JOB_TIMEOUT = int(os.getenv("JOB_TIMEOUT", "3600"))
+    # seconds between the heartbeats of the jobs queued or running in a worker process,
+    # jobs without a heartbeat for JOB_HEARTBEAT_TIMEOUT seconds belong to a dead worker
+    JOB_HEARTBEAT = int(os.getenv("JOB_HEARTBEAT", "10"))
+    JOB_HEARTBEAT_TIMEOUT = int(os.getenv("JOB_HEARTBEAT_TIMEOUT", "60"))
+    # unpublished prediction runs older than this (seconds) are abandoned and deleted with the old runs
+    PREDICTION_RUN_GRACE = int(os.getenv("PREDICTION_RUN_GRACE", "86400"))
+    # occupancies written or updated up to this many hours before the newest one still reach the rollups
+    ROLLUP_OVERLAP_HOURS = int(os.getenv("ROLLUP_OVERLAP_HOURS", "48"))
+    # longest range of /occupancy/aggregate in days, also the range without from or to
+    AGGREGATE_HOURLY_DAYS = int(os.getenv("AGGREGATE_HOURLY_DAYS", "31"))
+    AGGREGATE_DAILY_DAYS = int(os.getenv("AGGREGATE_DAILY_DAYS", "366"))
+    # downloaded dwd archives, revalidated with conditional requests
+    DOWNLOAD_CACHE_DIR = os.getenv("DOWNLOAD_CACHE_DIR", "data/download_cache")
+    # serve downloads from DOWNLOAD_CACHE_DIR only, e.g. for tests against a local mirror
+    DOWNLOAD_OFFLINE = os.getenv("DOWNLOAD_OFFLINE", "0") == "1"
+    # forecast archives larger than this (bytes) are spooled to a temporary file
+    FORECAST_SPOOL_MAX_SIZE = int(os.getenv("FORECAST_SPOOL_MAX_SIZE", str(64 * 1024 * 1024)))
+    # catalogue of the MOSMIX stations, see manage.py update_stations
+    WEATHER_STATIONS_FILE = os.getenv("WEATHER_STATIONS_FILE", "data/weather_stations/mosmix_stations.csv")
+    FORECAST_DEFAULT_STATION = os.getenv("FORECAST_DEFAULT_STATION", "K584")
+    # threads used to download the forecasts of several stations
+    FORECAST_WORKERS = int(os.getenv("FORECAST_WORKERS", "4"))
+    # materialized calendar features (metadata file, the arrays are stored next to it)
+    CALENDAR_FEATURES_FILE = os.getenv("CALENDAR_FEATURES_FILE", "data/calendar_features/calendar_features.json")
+    CALENDAR_YEARS_AHEAD = int(os.getenv("CALENDAR_YEARS_AHEAD", "3"))
+    # requests slower than this (seconds) are logged with their SQL statements, 0 disables the log
+    METRICS_SLOW_REQUEST_SECONDS = float(os.getenv("METRICS_SLOW_REQUEST_SECONDS", "0"))
\ No newline at end of file
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class DownloadCache(object):
+    """
+    A class used to keep downloaded files in a local directory
+
+    Every url is stored once with its ETag and Last-Modified header. Later
+    downloads are conditional requests over one pooled session, so unchanged
+    files (e.g. the static dwd _hist.zip archives) are not transferred again.
+    In offline mode the files are served from the cache directory only, which
+    can also be filled with a local mirror for tests.
+
+
+    Attributes
+    ----------
+    cache_dir : Path
+        directory with the cached files and their metadata
+    offline : bool
+        never touch the network, fail for urls that are not cached
+    timeout : int
+        timeout of a request in seconds
+
+    Methods
+    -------
+    fetch(url)
+        returns the path and the sha256 of the current content of an url
+    paths(url)
+        returns the content and metadata file of an url
+    """
+
+    def __init__(self, cache_dir, offline=False, timeout=60, session=None):
+        self.cache_dir = Path(cache_dir)
+        self.offline = offline
+        self.timeout = timeout
+        self.session = session if session is not None else _pooledSession()
+        self._lock = threading.Lock()
+
+    def paths(self, url):
+        """ returns the content and metadata file of an url
+        """
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.cache_dir / (key + ".bin"), self.cache_dir / (key + ".json")
+
+    def fetch(self, url):
+        """ downloads an url unless the cached copy is still current
+        Returns: path of the cached content and its sha256
+        """
+        content_file, meta_file = self.paths(url)
+        meta = _readMeta(meta_file) if content_file.exists() else None
+        if self.offline:
+            if meta is None:
+                raise FileNotFoundError("{} is not in the download cache (offline mode)".format(url))
+            return content_file, meta["sha256"]
+
+        headers = dict()
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            if meta is None:
+                raise
+            print("Warning: could not revalidate {}, using cached copy: {}".format(url, e))
+            return content_file, meta["sha256"]
+        if response.status_code == 304 and meta is not None:
+            return content_file, meta["sha256"]
+        response.raise_for_status()
+
+        meta = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "sha256": hashlib.sha256(response.content).hexdigest()
+        }
+        with self._lock:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            _writeAtomic(content_file, response.content)
+            _writeAtomic(meta_file, json.dumps(meta).encode("utf-8"))
+        return content_file, meta["sha256"]
+
+
+def _pooledSession(pool_size=8):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _readMeta(meta_file):
+    try:
+        with open(meta_file, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _writeAtomic(path, content):
+    tmp_file = path.with_name(path.name + ".tmp{}".format(threading.get_ident()))
+    with open(tmp_file, "wb") as file:
+        file.write(content)
+    os.replace(tmp_file, path)
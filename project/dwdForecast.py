@@ -5,18 +5,18 @@ Created on Wed Jan 29 20:23:52 2020
 most code from https://github.com/jlewis91/dwdbulk/blob/master/dwdbulk/
 """
 
+from contextlib import contextmanager
 from zipfile import ZipFile
-from urllib.parse import urlparse
 import shutil
-import requests
 import os
-from pathlib import Path
 from typing import List
 import pandas as pd
 import tempfile
 from lxml import etree
 import numpy as np
 
+from project import download_cache
+
 
 def parse_htmllist(baseurl, content, extension=None, full_url=True):
     class ListParser(HTMLParser):
@@ -51,156 +51,177 @@ def get_resource_index(url, extension="", full_url=True):
     :params str extension: String that should be matched in the link list; if "", all are returned
     """
 
-    response = requests.get(url)
+    response = download_cache.session.get(url, timeout=download_cache.timeout)
     if response.status_code != 200:
         raise ValueError(f"Fetching resource {url} failed")
     resource_list = parse_htmllist(url, response.text, extension, full_url)
     return resource_list
 
 
-def fetch_raw_forecast_xml(url, directory_path):
+@contextmanager
+def open_forecast_kml(url, max_size=64 * 1024 * 1024):
     """
-    Fetch weather forecast file (zipped xml) and extract xml into folder specified by xml_directory_path.
+    Fetch weather forecast file (zipped xml) and yield the xml as a binary stream.
+    The archive is kept in memory and only spilled to a temporary file if it is larger than max_size bytes.
+    It is requested over the pooled session and with the timeout of the download cache.
     """
-    directory_path = Path(directory_path)
-
-    if not os.path.exists(directory_path):
-        os.makedirs(directory_path)
+    r = download_cache.session.get(url, stream=True, timeout=download_cache.timeout)
+    r.raise_for_status()
+    r.raw.decode_content = True
+    with tempfile.SpooledTemporaryFile(max_size=max_size) as buffer:
+        shutil.copyfileobj(r.raw, buffer)
+        buffer.seek(0)
+        with ZipFile(buffer, "r") as zipObj:
+            with zipObj.open(zipObj.namelist()[0]) as kml_file:
+                yield kml_file
 
-    r = requests.get(url, stream=True)
-    file_name = urlparse(url).path.replace("/", "__")
 
-    if r.status_code == 200:
-        with open(directory_path / file_name, "wb") as f:
-            r.raw.decode_content = True
-            shutil.copyfileobj(r.raw, f)
+MOSMIX_ALL_STATIONS_URL = "http://opendata.dwd.de/weather/local_forecasts/mos/MOSMIX_S/all_stations/kml/MOSMIX_S_LATEST_240.kmz"
+MOSMIX_SINGLE_STATION_URL = "http://opendata.dwd.de/weather/local_forecasts/mos/MOSMIX_L/single_stations/{0}/kml/MOSMIX_L_LATEST_{0}.kmz"
 
-        with ZipFile(directory_path / file_name, "r") as zipObj:
-            # Extract all the contents of zip file in current directory
-            zipObj.extractall(path=directory_path)
-            return directory_path / zipObj.namelist()[0]
+PRODUCT_ITEMS = {
+    "product_id": "ProductID",
+    "generating_process": "GeneratingProcess",
+    "date_issued": "IssueTime",
+}
 
 
 def convert_xml_to_pandas(
         filepath,
         station_ids: List = None,
         parameters: List = None,
-        return_station_data=False):
+        return_station_data=False,
+        return_forecasts=True):
     """
-    Convert DWD XML Weather Forecast File of Type MOSMIX_S to parquet files.
+    Convert DWD XML Weather Forecast File of Type MOSMIX_S or MOSMIX_L to a dataframe.
+
+    The kml file (path or binary file object) is parsed as a stream. Values of
+    stations and parameters outside of station_ids and parameters are never
+    converted and every processed element is cleared, so memory stays bounded
+    by one station of the multi-station files. With return_forecasts=False no
+    values are converted at all and the forecast dataframe is None, e.g. when
+    only the station metadata is needed.
     """
-
-    tree = etree.parse(str(filepath))
-    root = tree.getroot()
-
-    prod_items = {
-        "product_id": "ProductID",
-        "generating_process": "GeneratingProcess",
-        "date_issued": "IssueTime",
-    }
-
-    # Get Basic Metadata
-    prod_definition = root.findall(
-        "kml:Document/kml:ExtendedData/dwd:ProductDefinition", root.nsmap
-    )[0]
-
-    metadata = {
-        k: prod_definition.find(f"{{{root.nsmap['dwd']}}}{v}").text
-        for k, v in prod_items.items()
-    }
-    metadata["date_issued"] = pd.Timestamp(metadata["date_issued"])
-
-    # Get Time Steps
-    timesteps = root.findall(
-        "kml:Document/kml:ExtendedData/dwd:ProductDefinition/dwd:ForecastTimeSteps",
-        root.nsmap,
-    )[0]
-    timesteps = [pd.Timestamp(i.text) for i in timesteps.getchildren()]
-
-    # Get Per Station Forecasts
-    forecast_items = root.findall("kml:Document/kml:Placemark", root.nsmap)
-
+    if isinstance(filepath, os.PathLike):
+        filepath = os.fspath(filepath)
+    if station_ids is not None:
+        station_ids = set(station_ids)
+
+    nsmap = dict()
+    tags = dict()
+    metadata = dict()
+    timesteps = None
+    station = None
+    measurements = dict()
     df_list = []
-
-    for station_forecast in forecast_items:
-        station_id = station_forecast.find("kml:name", root.nsmap).text
-
-        if (station_ids is None) or station_id in station_ids:
-            measurement_list = station_forecast.findall(
-                "kml:ExtendedData/dwd:Forecast", root.nsmap
-            )
-            df = pd.DataFrame({"date_start": timesteps})
-
-            for measurement_item in measurement_list:
-
-                measurement_parameter = measurement_item.get(
-                    f"{{{root.nsmap['dwd']}}}elementName"
-                )
-
+    station_list = []
+
+    for event, item in etree.iterparse(filepath, events=("start-ns", "start", "end"), huge_tree=True):
+        if event == "start-ns":
+            prefix, uri = item
+            nsmap[prefix] = uri
+            tags = {
+                "{%s}Placemark" % nsmap.get("kml"): "Placemark",
+                "{%s}name" % nsmap.get("kml"): "name",
+                "{%s}description" % nsmap.get("kml"): "description",
+                "{%s}coordinates" % nsmap.get("kml"): "coordinates",
+                "{%s}Forecast" % nsmap.get("dwd"): "Forecast",
+                "{%s}ProductDefinition" % nsmap.get("dwd"): "ProductDefinition",
+            }
+            continue
+        tag = tags.get(item.tag)
+        if event == "start":
+            if tag == "Placemark":
+                station = dict()
+                measurements = dict()
+            continue
+        if tag is None or (station is None and tag != "ProductDefinition"):
+            continue
+
+        if tag == "Forecast":
+            if station["selected"]:
+                measurement_parameter = item.get("{%s}elementName" % nsmap["dwd"])
                 if parameters is None or measurement_parameter in parameters:
+                    measurements[measurement_parameter] = _parse_values(item[0].text)
+        elif tag == "name":
+            station["station_id"] = item.text
+            station["selected"] = return_forecasts and (station_ids is None or item.text in station_ids)
+        elif tag == "description":
+            station["station_name"] = item.text
+        elif tag == "coordinates":
+            station["coordinates"] = item.text
+        elif tag == "Placemark":
+            if station["selected"]:
+                df_list.append(_station_dataframe(station["station_id"], measurements, timesteps, metadata))
+            if return_station_data:
+                station_list.append(station)
+            station = None
+        else:
+            # Get Basic Metadata and Time Steps
+            for k, v in PRODUCT_ITEMS.items():
+                metadata[k] = item.find("{%s}%s" % (nsmap["dwd"], v)).text
+            metadata["date_issued"] = pd.Timestamp(metadata["date_issued"])
+            timesteps = pd.to_datetime(
+                [step.text for step in item.find("{%s}ForecastTimeSteps" % nsmap["dwd"])])
+        # free the processed subtree and all siblings parsed before it
+        item.clear()
+        while item.getprevious() is not None:
+            del item.getparent()[0]
+
+    df = pd.concat(df_list, axis=0) if return_forecasts else None
 
-                    measurement_string = measurement_item.getchildren()[0].text
-
-                    measurement_values = " ".join(
-                        measurement_string.split()).split(" ")
-                    measurement_values = [
-                        np.nan if i == "-" else float(i) for i in measurement_values
-                    ]
+    if return_station_data:
+        station_df = pd.DataFrame([
+            {"station_id": s["station_id"], "station_name": s.get("station_name")} for s in station_list])
+        coordinates = np.array([s["coordinates"].split(",") for s in station_list], dtype=float).reshape(-1, 3)
+        station_df["geo_lon"] = coordinates[:, 0]
+        station_df["geo_lat"] = coordinates[:, 1]
+        station_df["height"] = coordinates[:, 2]
+        return df, station_df
+    else:
+        return df
 
-                    assert len(measurement_values) == len(
-                        timesteps
-                    ), "Number of timesteps does not match number of measurement values."
-                    df[measurement_parameter] = measurement_values
 
-            df["station_id"] = station_id
-            for k, v in metadata.items():
-                df[k] = v
+def getStationsAsDataframe(spool_max_size=64 * 1024 * 1024):
+    """
+    Fetch the coordinates of all MOSMIX stations from the all_stations forecast file.
+    """
+    with open_forecast_kml(MOSMIX_ALL_STATIONS_URL, max_size=spool_max_size) as kml_file:
+        df, station_df = convert_xml_to_pandas(kml_file, return_station_data=True, return_forecasts=False)
+    station_df = station_df.rename(columns={"geo_lat": "lat", "geo_lon": "lon"})
+    return station_df[["station_id", "station_name", "lat", "lon", "height"]]
 
-            df_list.append(df)
 
-    df = pd.concat(df_list, axis=0)
+def _parse_values(measurement_string):
+    """ converts a whitespace separated value string to floats, "-" is NaN
+    """
+    return np.asarray(pd.to_numeric(measurement_string.split(), errors="coerce"), dtype=float)
 
-    if return_station_data:
-        station_df = [
-            {
-                "coordinates": station_forecast.find(
-                    "kml:Point/kml:coordinates", root.nsmap
-                ).text.split(","),
-                "station_id": station_forecast.find("kml:name", root.nsmap).text,
-                "station_name": station_forecast.find(
-                    "kml:description", root.nsmap
-                ).text,
-            }
-            for station_forecast in forecast_items
-        ]
-        station_df = pd.DataFrame(station_df)
-        station_df["geo_lon"] = station_df["coordinates"].apply(
-            lambda x: float(x[0]))
-        station_df["geo_lat"] = station_df["coordinates"].apply(
-            lambda x: float(x[1]))
-        station_df["height"] = station_df["coordinates"].apply(
-            lambda x: float(x[2]))
-        del station_df["coordinates"]
 
-        return df, station_df
-    else:
-        return df
+def _station_dataframe(station_id, measurements, timesteps, metadata):
+    for measurement_values in measurements.values():
+        assert len(measurement_values) == len(
+            timesteps
+        ), "Number of timesteps does not match number of measurement values."
+    # build the frame in one step instead of inserting column by column
+    columns = {"date_start": timesteps}
+    columns.update(measurements)
+    columns["station_id"] = station_id
+    columns.update(metadata)
+    return pd.DataFrame(columns)
 
 
-def getForecastsAsDataframe():
+def getForecastsAsDataframe(station="K584", spool_max_size=64 * 1024 * 1024):
     # list with station names
     # https://www.dwd.de/EN/ourservices/met_application_mosmix/mosmix_stations.html
-    station = "K584"
-    url = "http://opendata.dwd.de/weather/local_forecasts/mos/MOSMIX_L/single_stations/" + \
-        str(station) + "/kml/MOSMIX_L_LATEST_" + str(station) + ".kmz"
+    url = MOSMIX_SINGLE_STATION_URL.format(station)
 
-    df = pd.DataFrame()
-    with tempfile.TemporaryDirectory() as tmp_dir_name:
-        kml_path = fetch_raw_forecast_xml(url, tmp_dir_name)
-        df = convert_xml_to_pandas(kml_path)
+    with open_forecast_kml(url, max_size=spool_max_size) as kml_file:
+        df = convert_xml_to_pandas(kml_file, station_ids=[station], parameters=['TTT', 'RR1c'])
 
     df.set_index('date_start', inplace=True)
     #convert Kelvin to °C
     df['TTT'] = df['TTT'] - 273.15
     df = df[['TTT', 'RR1c']]
     return df
+
@@ -0,0 +1,152 @@
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from project import app, db
+from project.models import Job
+
+QUEUED = "queued"
+RUNNING = "running"
+FINISHED = "finished"
+FAILED = "failed"
+PENDING = [QUEUED, RUNNING]
+
+_executor = ThreadPoolExecutor(max_workers=app.config["JOB_WORKERS"])
+# ids of the jobs queued or running in this process, kept alive by the heartbeat thread
+_active = set()
+_active_lock = threading.Lock()
+_heartbeat_thread = None
+
+
+def enqueue_job(name, function):
+    """ runs function in the background job pool \n
+        function is called inside an app context and returns the number of
+        written records, optionally together with a status message. A trigger while a job of the same name is queued or
+        running is coalesced into that job, across all worker processes: a partial unique index allows only one
+        pending job per name. A pending job whose worker stopped sending heartbeats is marked as failed.
+    Returns: the new or already pending Job
+    """
+    job = _pending_job(name)
+    if job is not None:
+        return job
+    now = datetime.now()
+    job = Job(name=name, status=QUEUED, created=now, worker=_worker(), heartbeat=now)
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # another process enqueued a job of the same name in the meantime
+        db.session.rollback()
+        return _pending_job(name)
+    with _active_lock:
+        _active.add(job.id)
+    _start_heartbeat()
+    _executor.submit(_run_job, job.id, function)
+    return job
+
+
+def job_to_dict(job):
+    """ formats a job for the json output
+    Returns: dict with status, timings and row counts
+    """
+    seconds = None
+    if job.started is not None and job.finished is not None:
+        seconds = (job.finished - job.started).total_seconds()
+    return {
+        "id": job.id,
+        "name": job.name,
+        "status": job.status,
+        "created": _isoformat(job.created),
+        "started": _isoformat(job.started),
+        "finished": _isoformat(job.finished),
+        "seconds": seconds,
+        "rows": job.rows,
+        "message": job.message,
+        "worker": job.worker
+    }
+
+
+def _run_job(job_id, function):
+    with app.app_context():
+        try:
+            _update_job(job_id, status=RUNNING, started=datetime.now())
+            result = function()
+            rows, message = result if isinstance(result, tuple) else (
+                result, "successfully updated {} records".format(result))
+            _update_job(job_id, status=FINISHED, finished=datetime.now(), rows=rows, message=message)
+        except Exception as e:
+            db.session.rollback()
+            print("Error: job {} failed: {}".format(job_id, e))
+            _update_job(job_id, status=FAILED, finished=datetime.now(), message=str(e))
+        finally:
+            db.session.remove()
+            with _active_lock:
+                _active.discard(job_id)
+
+
+def _pending_job(name):
+    """ the queued or running job of that name, a job of a dead worker is marked as failed
+    Returns: Job or None
+    """
+    job = db.session.query(Job).filter(Job.name == name, Job.status.in_(PENDING)).first()
+    if job is None:
+        return None
+    now = datetime.now()
+    if job.created < now - timedelta(seconds=app.config["JOB_TIMEOUT"]):
+        message = "timed out"
+    elif (job.heartbeat or job.created) < now - timedelta(seconds=app.config["JOB_HEARTBEAT_TIMEOUT"]):
+        message = "worker {} stopped".format(job.worker)
+    else:
+        return job
+    # conditional, a concurrent trigger may have failed the job already
+    db.session.query(Job).filter(Job.id == job.id, Job.status.in_(PENDING)).update(
+        {Job.status: FAILED, Job.finished: now, Job.message: message}, synchronize_session=False)
+    db.session.commit()
+    return None
+
+
+def _worker():
+    # evaluated per call, gunicorn --preload forks the workers after the import
+    return "{}:{}".format(socket.gethostname(), os.getpid())
+
+
+def _start_heartbeat():
+    global _heartbeat_thread
+    with _active_lock:
+        # a thread started before a fork is not alive in the forked process
+        if _heartbeat_thread is None or not _heartbeat_thread.is_alive():
+            _heartbeat_thread = threading.Thread(target=_send_heartbeats, daemon=True)
+            _heartbeat_thread.start()
+
+
+def _send_heartbeats():
+    while True:
+        time.sleep(app.config["JOB_HEARTBEAT"])
+        with _active_lock:
+            job_ids = list(_active)
+        if not job_ids:
+            continue
+        with app.app_context():
+            try:
+                db.session.query(Job).filter(Job.id.in_(job_ids)).update(
+                    {Job.heartbeat: datetime.now()}, synchronize_session=False)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print("Error: could not update the job heartbeats: {}".format(e))
+            finally:
+                db.session.remove()
+
+
+def _update_job(job_id, **values):
+    db.session.query(Job).filter(Job.id == job_id).update(values, synchronize_session=False)
+    db.session.commit()
+
+
+def _isoformat(value):
+    return value.isoformat(timespec='seconds') if value is not None else None
@@ -0,0 +1,239 @@
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from collections import defaultdict
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# upper bounds of the latency (seconds) and response size (bytes) histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# instances receiving the engine events, which are listened to once per process
+_instances = weakref.WeakSet()
+_instances_lock = threading.Lock()
+
+
+class RequestMetrics(object):
+    """
+    A class used to collect request and database metrics in Prometheus text format
+
+    Every request is timed from before_request until its teardown, so streamed
+    responses are measured until their last chunk. SQL statements are counted
+    by cursor events of all SQLAlchemy engines and attributed to the request
+    running in the same thread; statements of background jobs only show up in
+    the totals. Routes are labeled by their url rule, so the number of series
+    does not grow with the requested urls.
+
+    The metrics are kept per process, every gunicorn worker reports its own.
+
+
+    Attributes
+    ----------
+    slow_request_seconds : float
+        requests slower than this are logged with their statements, 0 disables the log
+
+    Methods
+    -------
+    init_app(app)
+        registers the request hooks of a flask app and the engine events
+    render()
+        returns all metrics in the Prometheus text exposition format
+    """
+
+    def __init__(self, slow_request_seconds=0, latency_buckets=LATENCY_BUCKETS, size_buckets=SIZE_BUCKETS):
+        self.slow_request_seconds = slow_request_seconds
+        self.latency_buckets = latency_buckets
+        self.size_buckets = size_buckets
+        self._requests = defaultdict(int)
+        self._latency = dict()
+        self._sizes = dict()
+        self._in_flight = defaultdict(int)
+        self._queries = defaultdict(lambda: [0, 0.0])
+        self._all_queries = [0, 0.0]
+        self._lock = threading.Lock()
+        # per instance, so several apps can be instrumented in one process
+        self._key = "_request_metrics_{}".format(id(self))
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        with _instances_lock:
+            _instances.add(self)
+            for name, listener in _ENGINE_EVENTS:
+                if not event.contains(Engine, name, listener):
+                    event.listen(Engine, name, listener)
+
+    def render(self):
+        """ formats all metrics, histogram buckets are cumulative
+        Returns: str in the Prometheus text exposition format
+        """
+        with self._lock:
+            lines = ["# HELP http_requests_total Number of finished requests.",
+                     "# TYPE http_requests_total counter"]
+            for (method, route, status), count in sorted(self._requests.items()):
+                lines.append(_sample("http_requests_total", {"method": method, "route": route, "status": status},
+                                     count))
+            lines += ["# HELP http_requests_in_flight Number of requests being processed.",
+                      "# TYPE http_requests_in_flight gauge"]
+            for (method, route), count in sorted(self._in_flight.items()):
+                lines.append(_sample("http_requests_in_flight", {"method": method, "route": route}, count))
+            lines += _histogram_lines("http_request_duration_seconds", "Request latency in seconds.",
+                                      self._latency)
+            lines += _histogram_lines("http_response_size_bytes", "Size of the response body in bytes.",
+                                      self._sizes)
+            lines += ["# HELP http_request_db_queries_total Number of SQL statements executed by requests.",
+                      "# TYPE http_request_db_queries_total counter"]
+            for (method, route), (count, seconds) in sorted(self._queries.items()):
+                lines.append(_sample("http_request_db_queries_total", {"method": method, "route": route}, count))
+            lines += ["# HELP http_request_db_query_seconds_total Time spent in SQL statements of requests.",
+                      "# TYPE http_request_db_query_seconds_total counter"]
+            for (method, route), (count, seconds) in sorted(self._queries.items()):
+                lines.append(_sample("http_request_db_query_seconds_total", {"method": method, "route": route},
+                                     seconds))
+            lines += ["# HELP db_queries_total Number of SQL statements, including background jobs.",
+                      "# TYPE db_queries_total counter",
+                      _sample("db_queries_total", {}, self._all_queries[0]),
+                      "# HELP db_query_seconds_total Time spent in SQL statements, including background jobs.",
+                      "# TYPE db_query_seconds_total counter",
+                      _sample("db_query_seconds_total", {}, self._all_queries[1])]
+        return "\n".join(lines) + "\n"
+
+    # ## request hooks
+
+    def _before_request(self):
+        labels = (request.method, request.url_rule.rule if request.url_rule is not None else "unmatched")
+        setattr(g, self._key, {"labels": labels, "start": time.perf_counter(), "status": None,
+                               "queries": 0, "query_seconds": 0.0, "statements": dict()})
+        with self._lock:
+            self._in_flight[labels] += 1
+
+    def _after_request(self, response):
+        state = g.get(self._key)
+        if state is None:
+            return response
+        state["status"] = str(response.status_code)
+        if not response.is_streamed:
+            self._observe(self._sizes, self.size_buckets, state["labels"], response.content_length or 0)
+        elif response.response is not None:
+            response.response = self._count_bytes(response.response, state["labels"])
+        return response
+
+    def _teardown_request(self, exception):
+        state = g.get(self._key)
+        if state is None:
+            return
+        setattr(g, self._key, None)
+        seconds = time.perf_counter() - state["start"]
+        status = state["status"] if state["status"] is not None else "500"
+        self._observe(self._latency, self.latency_buckets, state["labels"], seconds)
+        with self._lock:
+            self._in_flight[state["labels"]] -= 1
+            self._requests[state["labels"] + (status,)] += 1
+            queries = self._queries[state["labels"]]
+            queries[0] += state["queries"]
+            queries[1] += state["query_seconds"]
+        if self.slow_request_seconds and seconds >= self.slow_request_seconds:
+            self._log_slow_request(state, status, seconds)
+
+    def _count_bytes(self, chunks, labels):
+        num_bytes = 0
+        try:
+            for chunk in chunks:
+                num_bytes += len(chunk)
+                yield chunk
+            self._observe(self._sizes, self.size_buckets, labels, num_bytes)
+        finally:
+            # e.g. pops the request context of stream_with_context if the client disconnects
+            if hasattr(chunks, "close"):
+                chunks.close()
+
+    def _log_slow_request(self, state, status, seconds):
+        method, route = state["labels"]
+        lines = ["Warning: slow request {} {} ({}) took {:.3f}s, {} queries took {:.3f}s".format(
+            method, route, status, seconds, state["queries"], state["query_seconds"])]
+        statements = sorted(state["statements"].items(), key=lambda item: item[1][1], reverse=True)
+        for statement, (count, query_seconds) in statements[:10]:
+            lines.append("    {:5d}x {:8.3f}s  {}".format(count, query_seconds, statement))
+        print("\n".join(lines))
+
+    # ## engine events
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault(self._key, []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get(self._key)
+        if not starts:
+            return
+        seconds = time.perf_counter() - starts.pop()
+        with self._lock:
+            self._all_queries[0] += 1
+            self._all_queries[1] += seconds
+        state = g.get(self._key) if has_request_context() else None
+        if state is None:
+            return
+        state["queries"] += 1
+        state["query_seconds"] += seconds
+        if self.slow_request_seconds:
+            entry = state["statements"].setdefault(" ".join(statement.split())[:200], [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def _handle_error(self, exception_context):
+        # a failed statement never reaches after_cursor_execute
+        connection = exception_context.connection
+        starts = connection.info.get(self._key) if connection is not None else None
+        if starts:
+            starts.pop()
+
+    def _observe(self, histograms, buckets, labels, value):
+        with self._lock:
+            histogram = histograms.get(labels)
+            if histogram is None:
+                histogram = histograms[labels] = [[0] * (len(buckets) + 1), 0, buckets]
+            histogram[0][bisect_left(buckets, value)] += 1
+            histogram[1] += value
+
+
+def _dispatch(method_name):
+    def listener(*args):
+        with _instances_lock:
+            instances = list(_instances)
+        for instance in instances:
+            getattr(instance, method_name)(*args)
+    return listener
+
+
+_ENGINE_EVENTS = [("before_cursor_execute", _dispatch("_before_cursor_execute")),
+                  ("after_cursor_execute", _dispatch("_after_cursor_execute")),
+                  ("handle_error", _dispatch("_handle_error"))]
+
+
+def _histogram_lines(name, help, histograms):
+    lines = ["# HELP {} {}".format(name, help), "# TYPE {} histogram".format(name)]
+    for (method, route), (counts, total, buckets) in sorted(histograms.items()):
+        labels = {"method": method, "route": route}
+        cumulative = 0
+        for bound, count in zip(list(buckets) + ["+Inf"], counts):
+            cumulative += count
+            lines.append(_sample(name + "_bucket", dict(labels, le=str(bound)), cumulative))
+        lines.append(_sample(name + "_sum", labels, total))
+        lines.append(_sample(name + "_count", labels, cumulative))
+    return lines
+
+
+def _sample(name, labels, value):
+    if labels:
+        name += "{" + ",".join('{}="{}"'.format(key, _escape(value)) for key, value in labels.items()) + "}"
+    return "{} {}".format(name, repr(float(value)) if isinstance(value, float) else value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,180 @@
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from project import db
+from project.models import ForecastWeather, OccupancyRollupState
+
+# indexes replaced by newer ones of the models
+OBSOLETE_INDEXES = {
+    "historic_occupancy": ["ix_historic_occupancy_parkingspot_id_datetime"],
+}
+
+
+def migrate():
+    """ brings an existing database up to the current models \n
+        every step checks the schema first, so the migration can be run again
+    Returns: list with a description of every applied step
+    """
+    applied = []
+
+    # new tables, e.g. prediction_run and job
+    tables = inspect(db.engine).get_table_names()
+    missing = [table for table in db.metadata.sorted_tables if table.name not in tables]
+    if missing:
+        db.metadata.create_all(bind=db.engine, tables=missing)
+        applied.append("created tables " + ", ".join(table.name for table in missing))
+
+    # versioned predictions
+    if "run_id" not in _column_names("prediction"):
+        _execute("ALTER TABLE prediction ADD COLUMN run_id INTEGER REFERENCES prediction_run (id)")
+        applied.append("added column prediction.run_id")
+
+    # heartbeats of background jobs
+    for column, type_name in [("worker", "VARCHAR(100)"), ("heartbeat", "TIMESTAMP")]:
+        if column not in _column_names("job"):
+            _execute("ALTER TABLE job ADD COLUMN {} {}".format(column, type_name))
+            applied.append("added column job." + column)
+
+    # forecasts per station, the table is refilled on every forecast refresh
+    if "station_id" not in _column_names("forecast_weather"):
+        ForecastWeather.__table__.drop(bind=db.engine)
+        ForecastWeather.__table__.create(bind=db.engine)
+        applied.append("recreated table forecast_weather with column station_id")
+
+    # rollups refreshed by time per parking spot instead of by id, the next refresh rebuilds them
+    if "parkingspot_id" not in _column_names("occupancy_rollup_state"):
+        OccupancyRollupState.__table__.drop(bind=db.engine)
+        OccupancyRollupState.__table__.create(bind=db.engine)
+        applied.append("recreated table occupancy_rollup_state with columns parkingspot_id and refreshed_until")
+
+    for table in db.metadata.sorted_tables:
+        existing = _index_names(table.name)
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            if index.unique and index.dialect_options["postgresql"]["where"] is not None:
+                # partial index of pending jobs, older duplicates are failed instead of deleted
+                num_jobs_failed = _fail_duplicate_jobs()
+                if num_jobs_failed:
+                    applied.append("failed {} duplicate pending jobs".format(num_jobs_failed))
+            elif index.unique:
+                num_rows_deleted = _delete_duplicates(table.name, [column.name for column in index.columns])
+                if num_rows_deleted:
+                    applied.append("deleted {} duplicate rows from {}".format(num_rows_deleted, table.name))
+            index.create(bind=db.engine)
+            applied.append("created index " + index.name)
+        for name in OBSOLETE_INDEXES.get(table.name, []):
+            if name in existing:
+                _execute("DROP INDEX " + name)
+                applied.append("dropped index " + name)
+
+    return applied
+
+
+def partition_historic_occupancy(years_ahead=2):
+    """ converts historic_occupancy into a table partitioned by year (PostgreSQL only) \n
+        rows outside of the yearly partitions go to a default partition. On an
+        already partitioned table only the missing yearly partitions are added
+    Returns: list with a description of every applied step
+    """
+    if db.engine.dialect.name != "postgresql":
+        raise RuntimeError("partitioning of historic_occupancy needs PostgreSQL")
+    applied = []
+
+    with db.engine.begin() as connection:
+        is_partitioned = connection.execute(text(
+            "SELECT count(*) FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = 'historic_occupancy'")).scalar() > 0
+        first, last = connection.execute(text(
+            "SELECT min(datetime), max(datetime) FROM historic_occupancy")).fetchone()
+        current_year = datetime.now().year
+        years = range(first.year if first is not None else current_year,
+                      max(last.year if last is not None else current_year, current_year) + years_ahead + 1)
+
+        if not is_partitioned:
+            for name in ["uq_historic_occupancy_parkingspot_id_datetime"] + OBSOLETE_INDEXES["historic_occupancy"]:
+                connection.execute(text("DROP INDEX IF EXISTS " + name))
+            connection.execute(text("ALTER TABLE historic_occupancy RENAME TO historic_occupancy_unpartitioned"))
+            # the primary key of a partitioned table has to contain the partition key
+            connection.execute(text(
+                "CREATE TABLE historic_occupancy ("
+                "id INTEGER NOT NULL DEFAULT nextval('historic_occupancy_id_seq'), "
+                "datetime TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+                "occupation INTEGER NOT NULL, "
+                "max_occupation INTEGER NOT NULL, "
+                "parkingspot_id INTEGER REFERENCES parkingspot (id), "
+                "PRIMARY KEY (id, datetime)"
+                ") PARTITION BY RANGE (datetime)"))
+            connection.execute(text("ALTER SEQUENCE historic_occupancy_id_seq OWNED BY historic_occupancy.id"))
+            connection.execute(text("CREATE TABLE historic_occupancy_default PARTITION OF historic_occupancy DEFAULT"))
+            for year in years:
+                connection.execute(text(_create_partition(year)))
+            connection.execute(text(
+                "INSERT INTO historic_occupancy (id, datetime, occupation, max_occupation, parkingspot_id) "
+                "SELECT id, datetime, occupation, max_occupation, parkingspot_id FROM historic_occupancy_unpartitioned"))
+            connection.execute(text("DROP TABLE historic_occupancy_unpartitioned"))
+            connection.execute(text(
+                "CREATE UNIQUE INDEX uq_historic_occupancy_parkingspot_id_datetime "
+                "ON historic_occupancy (parkingspot_id, datetime)"))
+            applied.append("partitioned historic_occupancy by year ({}-{})".format(years[0], years[-1]))
+            return applied
+
+    for year in years:
+        name = "historic_occupancy_y{}".format(year)
+        if name in inspect(db.engine).get_table_names():
+            continue
+        try:
+            _execute(_create_partition(year))
+            applied.append("created partition " + name)
+        except Exception as e:
+            # e.g. rows of that year are already in the default partition
+            print("Error: could not create partition {}: {}".format(name, e))
+    return applied
+
+
+def _create_partition(year):
+    return ("CREATE TABLE IF NOT EXISTS historic_occupancy_y{0} PARTITION OF historic_occupancy "
+            "FOR VALUES FROM ('{0}-01-01') TO ('{1}-01-01')").format(year, year + 1)
+
+
+def _column_names(table_name):
+    return [column["name"] for column in inspect(db.engine).get_columns(table_name)]
+
+
+def _index_names(table_name):
+    if db.engine.dialect.name == "postgresql":
+        # pg_indexes also lists the indexes of partitioned tables
+        with db.engine.connect() as connection:
+            return {row[0] for row in connection.execute(
+                text("SELECT indexname FROM pg_indexes WHERE tablename = :table_name"),
+                table_name=table_name)}
+    return {index["name"] for index in inspect(db.engine).get_indexes(table_name)}
+
+
+def _delete_duplicates(table_name, columns):
+    """ keeps the row with the lowest id of every duplicate key
+    Returns: number of deleted rows
+    """
+    condition = " AND ".join("d.{0} = {1}.{0}".format(column, table_name) for column in columns)
+    with db.engine.begin() as connection:
+        return connection.execute(text(
+            "DELETE FROM {0} WHERE EXISTS (SELECT 1 FROM {0} AS d WHERE {1} AND d.id < {0}.id)".format(
+                table_name, condition))).rowcount
+
+
+def _fail_duplicate_jobs():
+    """ keeps the newest queued or running job of every name
+    Returns: number of failed jobs
+    """
+    with db.engine.begin() as connection:
+        return connection.execute(text(
+            "UPDATE job SET status = 'failed', finished = :now, message = 'superseded' "
+            "WHERE status IN ('queued', 'running') AND EXISTS (SELECT 1 FROM job AS d "
+            "WHERE d.name = job.name AND d.status IN ('queued', 'running') AND d.id > job.id)"),
+            now=datetime.now()).rowcount
+
+
+def _execute(statement):
+    with db.engine.begin() as connection:
+        connection.execute(text(statement))
@@ -0,0 +1,146 @@
+import threading
+from collections import OrderedDict, namedtuple
+from pathlib import Path
+
+import joblib
+import numpy as np
+
+# artifacts of one parking spot, rmse is reduced to a 7x24 grid (see rmse_grid)
+ParkingspotModels = namedtuple(
+    "ParkingspotModels", ["targetencoder", "scaler", "model", "rmse", "leader"])
+
+
+def rmse_grid(rmse):
+    """ reduces the validation errors per weekday and hour to one rmse each \n
+        rmse[dayOfWeek][hourOfDay] holds the errors of that hour (monday = 0)
+    Returns: 7x24 float array, -999 where no errors are available
+    """
+    grid = np.full((7, 24), -999.0)
+    for dayOfWeek in range(7):
+        for hourOfDay in range(24):
+            try:
+                grid[dayOfWeek, hourOfDay] = np.sqrt(np.mean(np.square(rmse[dayOfWeek][hourOfDay])))
+            except:
+                pass
+    return grid
+
+
+class ModelRegistry(object):
+    """
+    A class used to keep the joblib artifacts of every parking spot in memory
+
+    Artifacts are loaded once per process, either up front with preload() or
+    lazily on first use. If a memory budget is set, the least recently used
+    parking spots are evicted when the loaded artifacts exceed it. A parking
+    spot is reloaded as soon as the mtime of one of its files changes.
+
+    When the app is loaded with gunicorn --preload, preload() runs in the
+    master process and the workers share the loaded arrays copy-on-write.
+
+
+    Attributes
+    ----------
+    models_dir : Path
+        directory with target encoder, scaler and model of every parking spot
+    rmse_dir : Path
+        directory with rmse and leader of every parking spot
+    memory_budget : int
+        maximum size of the loaded artifact files in bytes, 0 means unlimited
+    mmap_mode : str
+        mmap_mode passed to joblib.load, None loads the arrays into memory
+
+    Methods
+    -------
+    get(name)
+        returns the ParkingspotModels of a parking spot
+    preload(names=None)
+        loads the artifacts of the given or all available parking spots
+    names()
+        returns the names of all parking spots with a model
+    """
+
+    def __init__(self, models_dir, rmse_dir, memory_budget=0, mmap_mode="r"):
+        self.models_dir = Path(models_dir)
+        self.rmse_dir = Path(rmse_dir)
+        self.memory_budget = memory_budget
+        self.mmap_mode = mmap_mode
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # one lock per parking spot, so cold loads of different spots run in parallel
+        self._name_locks = dict()
+
+    def paths(self, name):
+        """ returns the artifact files of a parking spot in ParkingspotModels order
+        """
+        return ParkingspotModels(
+            targetencoder=self.models_dir / ("targetenc" + name + ".sav"),
+            scaler=self.models_dir / ("scaler" + name + ".sav"),
+            model=self.models_dir / (name + ".sav"),
+            rmse=self.rmse_dir / ("rmseAll" + name + ".sav"),
+            leader=self.rmse_dir / ("leaderAll" + name + ".sav"))
+
+    def names(self):
+        """ returns the names of all parking spots with a target encoder
+        """
+        return sorted(path.name[len("targetenc"):-len(".sav")]
+                      for path in self.models_dir.glob("targetenc*.sav"))
+
+    def get(self, name):
+        """ returns the artifacts of a parking spot, loads them if necessary
+        Returns: ParkingspotModels
+        """
+        paths = self.paths(name)
+        stats = [path.stat() for path in paths]
+        mtimes = tuple(stat.st_mtime_ns for stat in stats)
+        with self._lock:
+            models = self._cached(name, mtimes)
+            if models is not None:
+                return models
+            name_lock = self._name_locks.setdefault(name, threading.Lock())
+        with name_lock:
+            # another thread may have loaded the parking spot while this one was waiting
+            with self._lock:
+                models = self._cached(name, mtimes)
+            if models is not None:
+                return models
+            models = ParkingspotModels(*[self._load(path) for path in paths])
+            models = models._replace(rmse=rmse_grid(models.rmse))
+            with self._lock:
+                self._entries[name] = (mtimes, sum(stat.st_size for stat in stats), models)
+                self._entries.move_to_end(name)
+                self._evict()
+            return models
+
+    def preload(self, names=None):
+        """ loads the artifacts of the given or all available parking spots
+        """
+        for name in (names if names is not None else self.names()):
+            try:
+                self.get(name)
+            except Exception as e:
+                print("Error: could not load models of {}: {}".format(name, e))
+
+    def _cached(self, name, mtimes):
+        entry = self._entries.get(name)
+        if entry is None or entry[0] != mtimes:
+            return None
+        self._entries.move_to_end(name)
+        return entry[2]
+
+    def _load(self, path):
+        if self.mmap_mode is None:
+            return joblib.load(path)
+        try:
+            return joblib.load(path, mmap_mode=self.mmap_mode)
+        except ValueError:
+            # e.g. compressed files can not be memory mapped
+            return joblib.load(path)
+
+    def _evict(self):
+        if not self.memory_budget:
+            return
+        size = sum(entry[1] for entry in self._entries.values())
+        # never evict the most recently used parking spot
+        while size > self.memory_budget and len(self._entries) > 1:
+            name, entry = self._entries.popitem(last=False)
+            size -= entry[1]
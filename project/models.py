@@ -101,6 +101,10 @@ class HistoricOccupancy(db.Model):
     
     """
     __tablename__ = "historic_occupancy"
+    __table_args__ = (
+        # one occupancy per parking spot and time, re-seeding skips existing rows
+        db.Index("uq_historic_occupancy_parkingspot_id_datetime", "parkingspot_id", "datetime", unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     datetime = db.Column(db.DateTime, nullable=False)
     occupation = db.Column(db.Integer, nullable=False)
@@ -153,8 +157,10 @@ class ForecastWeather(db.Model):
     ----------
     __tablename__ : str
         the name of the table
+    station_id : str
+        id of the MOSMIX station of the forecast - part of the primary key
     datetime : date
-        date and time of occupation - acts as primary key
+        date and time of occupation - part of the primary key
     temperature : float
         air temperature at 2m height [°C]
     precipation_last_hour : float
@@ -162,15 +168,47 @@ class ForecastWeather(db.Model):
     
     """
     __tablename__ = "forecast_weather"
+    station_id = db.Column(db.String(10), primary_key=True, nullable=False)
     datetime = db.Column(db.DateTime, primary_key=True, nullable=False)
     temperature = db.Column(db.Float, nullable=False)
     precipation_last_hour = db.Column(db.Float, nullable=False)
 
-    def __init__(self, datetime, temperature, precipation_last_hour):
+    def __init__(self, datetime, temperature, precipation_last_hour, station_id="K584"):
+        self.station_id = station_id
         self.datetime = datetime
         self.temperature = temperature
         self.precipation_last_hour = precipation_last_hour
 
+class PredictionRun(db.Model):
+    """
+    A class used to represent one version of the predictions in the database
+
+    Predictions of a run are written while 'published' is empty. Readers only
+    use the latest published run, so publishing switches all parking spots
+    to the new predictions at once.
+
+
+    Attributes
+    ----------
+    __tablename__ : str
+        the name of the table
+    id : int
+        primary key of the table
+    created : date
+        date and time the run was started
+    published : date
+        date and time the run was published, empty while it is written
+
+    """
+    __tablename__ = "prediction_run"
+    id = db.Column(db.Integer, primary_key=True, nullable=False)
+    created = db.Column(db.DateTime, nullable=False)
+    published = db.Column(db.DateTime, nullable=True)
+
+    def __init__(self, created, published=None):
+        self.created = created
+        self.published = published
+
 class Prediction(db.Model):
     """
     A class used to represent predicted occupation data in the database
@@ -190,20 +228,28 @@ class Prediction(db.Model):
         the rmse for each prediction
     parkingspot_id : int
         foreign key - reference to table 'parkingspot'
+    run_id : int
+        foreign key - reference to table 'prediction_run'
     
     """
     __tablename__ = "prediction"
+    __table_args__ = (
+        db.Index("ix_prediction_parkingspot_id_datetime", "parkingspot_id", "datetime"),
+        db.Index("uq_prediction_run_id_parkingspot_id_datetime", "run_id", "parkingspot_id", "datetime", unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     datetime = db.Column(db.DateTime, nullable=False)
     occupation = db.Column(db.Integer, nullable=False)
     rmse = db.Column(db.Float, nullable=False)
     parkingspot_id = db.Column(db.Integer, db.ForeignKey('parkingspot.id'))
+    run_id = db.Column(db.Integer, db.ForeignKey('prediction_run.id'), index=True)
 
-    def __init__(self, datetime, occupation, rmse, parkingspot_id):
+    def __init__(self, datetime, occupation, rmse, parkingspot_id, run_id=None):
         self.datetime = datetime
         self.occupation = occupation
         self.rmse = rmse
         self.parkingspot_id = parkingspot_id
+        self.run_id = run_id
 
 class VacationRLP(db.Model):
     """
@@ -299,3 +345,172 @@ class HolidayHE(db.Model):
     def __init__(self, date):
         self.date = date
 
+class Job(db.Model):
+    """
+    A class used to represent background jobs in the database
+
+
+    Attributes
+    ----------
+    __tablename__ : str
+        the name of the table
+    id : int
+        primary key of the table
+    name : str
+        the kind of job ('predict', 'weather_update', 'weather_forecast')
+    status : str
+        the state of the job ('queued', 'running', 'finished', 'failed')
+    created : date
+        date and time the job was enqueued
+    started : date
+        date and time the job was started
+    finished : date
+        date and time the job was finished or failed
+    rows : int
+        number of records the job has written
+    message : str
+        result or error message of the job
+    worker : str
+        host and process id of the worker the job was enqueued in
+    heartbeat : date
+        last sign of life of that worker, refreshed while the job is queued or running
+
+    """
+    __tablename__ = "job"
+    # at most one queued or running job per name, concurrent triggers are coalesced into it
+    __table_args__ = (
+        db.Index("uq_job_name_pending", "name", unique=True,
+                 postgresql_where=db.text("status IN ('queued', 'running')"),
+                 sqlite_where=db.text("status IN ('queued', 'running')")),
+    )
+    id = db.Column(db.Integer, primary_key=True, nullable=False)
+    name = db.Column(db.String(50), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False)
+    created = db.Column(db.DateTime, nullable=False)
+    started = db.Column(db.DateTime, nullable=True)
+    finished = db.Column(db.DateTime, nullable=True)
+    rows = db.Column(db.Integer, nullable=True)
+    message = db.Column(db.Text, nullable=True)
+    worker = db.Column(db.String(100), nullable=True)
+    heartbeat = db.Column(db.DateTime, nullable=True)
+
+    def __init__(self, name, status, created, worker=None, heartbeat=None):
+        self.name = name
+        self.status = status
+        self.created = created
+        self.worker = worker
+        self.heartbeat = heartbeat
+
+class OccupancyHourly(db.Model):
+    """
+    A class used to represent hourly aggregated occupancies in the database
+
+    Rows are derived from 'historic_occupancy' (see occupancyRollups), missing
+    values (-999) are left out.
+
+
+    Attributes
+    ----------
+    __tablename__ : str
+        the name of the table
+    parkingspot_id : int
+        foreign key - reference to table 'parkingspot' - part of the primary key
+    period_start : date
+        start of the hour - part of the primary key
+    num_values : int
+        number of 15 minute values in the hour
+    occupation_mean : float
+        mean occupation
+    occupation_min : int
+        minimum occupation
+    occupation_max : int
+        maximum occupation
+    rate_mean : float
+        mean of occupation / max_occupation, empty without capacities
+    
+    """
+    __tablename__ = "occupancy_hourly"
+    parkingspot_id = db.Column(db.Integer, db.ForeignKey('parkingspot.id'), primary_key=True, nullable=False)
+    period_start = db.Column(db.DateTime, primary_key=True, nullable=False)
+    num_values = db.Column(db.Integer, nullable=False)
+    occupation_mean = db.Column(db.Float, nullable=False)
+    occupation_min = db.Column(db.Integer, nullable=False)
+    occupation_max = db.Column(db.Integer, nullable=False)
+    rate_mean = db.Column(db.Float, nullable=True)
+
+class OccupancyDaily(db.Model):
+    """
+    A class used to represent daily aggregated occupancies in the database
+
+    Same columns as 'occupancy_hourly', period_start is the start of the day.
+    
+    """
+    __tablename__ = "occupancy_daily"
+    parkingspot_id = db.Column(db.Integer, db.ForeignKey('parkingspot.id'), primary_key=True, nullable=False)
+    period_start = db.Column(db.DateTime, primary_key=True, nullable=False)
+    num_values = db.Column(db.Integer, nullable=False)
+    occupation_mean = db.Column(db.Float, nullable=False)
+    occupation_min = db.Column(db.Integer, nullable=False)
+    occupation_max = db.Column(db.Integer, nullable=False)
+    rate_mean = db.Column(db.Float, nullable=True)
+
+class OccupancyProfile(db.Model):
+    """
+    A class used to represent the typical week of a parking spot in the database
+
+    Sums instead of means, so new occupancies can be added incrementally.
+
+
+    Attributes
+    ----------
+    __tablename__ : str
+        the name of the table
+    parkingspot_id : int
+        foreign key - reference to table 'parkingspot' - part of the primary key
+    season : int
+        0 = winter (dec-feb), 1 = spring, 2 = summer, 3 = autumn - part of the primary key
+    weekday : int
+        monday = 0, sunday = 6 - part of the primary key
+    slot : int
+        quarter hour of the day, 0 = 00:00 to 95 = 23:45 - part of the primary key
+    num_values : int
+        number of occupancies in the slot
+    occupation_sum : float
+        sum of the occupancies
+    num_rates : int
+        number of occupancies with a known capacity
+    rate_sum : float
+        sum of occupation / max_occupation
+    
+    """
+    __tablename__ = "occupancy_profile"
+    parkingspot_id = db.Column(db.Integer, db.ForeignKey('parkingspot.id'), primary_key=True, nullable=False)
+    season = db.Column(db.SmallInteger, primary_key=True, nullable=False)
+    weekday = db.Column(db.SmallInteger, primary_key=True, nullable=False)
+    slot = db.Column(db.SmallInteger, primary_key=True, nullable=False)
+    num_values = db.Column(db.Integer, nullable=False)
+    occupation_sum = db.Column(db.Float, nullable=False)
+    num_rates = db.Column(db.Integer, nullable=False)
+    rate_sum = db.Column(db.Float, nullable=False)
+
+class OccupancyRollupState(db.Model):
+    """
+    A class used to remember up to which day the rollups of a parking spot are final
+
+
+    Attributes
+    ----------
+    __tablename__ : str
+        the name of the table
+    parkingspot_id : int
+        foreign key - reference to table 'parkingspot' - primary key of the table
+    refreshed_until : date
+        start of the first day recomputed by the next refresh, the profile contains all days before
+    updated : date
+        time of the last refresh
+    
+    """
+    __tablename__ = "occupancy_rollup_state"
+    parkingspot_id = db.Column(db.Integer, db.ForeignKey('parkingspot.id'), primary_key=True, nullable=False)
+    refreshed_until = db.Column(db.DateTime, nullable=False)
+    updated = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,115 @@
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from project.utils import historicOccupanciesToDataframe
+
+# cache file next to the csv exports, one per data directory
+CACHE_FILE_NAME = ".historic_occupancies.npz"
+
+# hot in-process copies: resolved directory -> (signature, dataframe, json)
+_hot_cache = dict()
+_lock = threading.Lock()
+# one lock per directory, so parsing one directory does not block the others
+_directory_locks = dict()
+
+
+def sourceSignature(path):
+    """ describes the csv files of a directory by path, size and mtime
+    Returns: list of strings, changes whenever a source file changes
+    """
+    signature = []
+    for file in sorted(Path(path).glob("*.csv")):
+        stat = file.stat()
+        signature.append("{}|{}|{}".format(file.resolve(), stat.st_size, stat.st_mtime_ns))
+    return signature
+
+
+def getHistoricOccupancies(path):
+    """ returns the parsed historic occupancies of a directory \n
+        served from memory, then from the cache file next to the data and
+        only parsed again when a source file has changed \n
+        the returned dataframe is shared and must not be modified
+    Returns: dataframe with historic occupancies from parkingspots
+    """
+    return _getEntry(path)[1]
+
+
+def getHistoricOccupanciesJson(path):
+    """ returns the historic occupancies of a directory serialized as json
+    Returns: json string with one object per timestamp
+    """
+    directory = Path(path).resolve()
+    signature, df, json = _getEntry(directory)
+    if json is None:
+        json = df.to_json(orient='index')
+        with _lock:
+            entry = _hot_cache.get(directory)
+            if entry is not None and entry[0] == signature:
+                _hot_cache[directory] = (signature, df, json)
+    return json
+
+
+def _getEntry(path):
+    directory = Path(path).resolve()
+    signature = sourceSignature(directory)
+    with _lock:
+        entry = _hot_cache.get(directory)
+        if entry is not None and entry[0] == signature:
+            return entry
+        directory_lock = _directory_locks.setdefault(directory, threading.Lock())
+    with directory_lock:
+        # another thread may have parsed the directory while this one was waiting
+        with _lock:
+            entry = _hot_cache.get(directory)
+        if entry is not None and entry[0] == signature:
+            return entry
+        df = _readCacheFile(directory, signature)
+        if df is None:
+            df = historicOccupanciesToDataframe(directory)
+            _writeCacheFile(directory, signature, df)
+        entry = (signature, df, None)
+        with _lock:
+            _hot_cache[directory] = entry
+        return entry
+
+
+def _readCacheFile(directory, signature):
+    """ loads the cached dataframe if it was built from the same source files
+    Returns: dataframe or None
+    """
+    cache_file = directory / CACHE_FILE_NAME
+    try:
+        with np.load(cache_file, allow_pickle=False) as data:
+            if list(data["signature"]) != signature:
+                return None
+            columns = [str(column) for column in data["columns"]]
+            df = pd.DataFrame({column: data["c{}".format(i)] for i, column in enumerate(columns)},
+                              index=pd.DatetimeIndex(data["index"]), columns=columns)
+            return df
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _writeCacheFile(directory, signature, df):
+    """ stores every column as its own array, written atomically
+    """
+    if not isinstance(df.index, pd.DatetimeIndex) or (df.dtypes == object).any():
+        return
+    cache_file = directory / CACHE_FILE_NAME
+    tmp_file = directory / (CACHE_FILE_NAME + ".{}.tmp".format(os.getpid()))
+    arrays = {"c{}".format(i): df.iloc[:, i].values for i in range(len(df.columns))}
+    try:
+        with open(tmp_file, "wb") as file:
+            np.savez(file, signature=np.array(signature, dtype=str), index=df.index.values,
+                     columns=np.array(list(df.columns), dtype=str), **arrays)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print("Error: could not write occupancy cache {}: {}".format(cache_file, e))
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
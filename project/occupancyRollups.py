@@ -0,0 +1,150 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import and_, func, true
+
+from project import app, db
+from project.bulk import dataframe_records
+from project.models import (HistoricOccupancy, OccupancyDaily, OccupancyHourly, OccupancyProfile,
+                            OccupancyRollupState)
+
+SEASONS = ["winter", "spring", "summer", "autumn"]
+
+ROLLUPS = {"hourly": (OccupancyHourly, "H"), "daily": (OccupancyDaily, "D")}
+
+
+def refresh_occupancy_rollups(full=False):
+    """ recomputes the rollups of all historic occupancies since the last refresh \n
+        every parking spot remembers its own refreshed day. Its hourly and daily
+        buckets are recomputed from the raw rows from that day on, so rows written
+        late or updated in place are picked up as long as their datetime is not
+        older than ROLLUP_OVERLAP_HOURS before the newest occupancy of the same
+        parking spot, also when its feed stalled and is backfilled later. The
+        weekday profiles only contain the days before that overlap, which are
+        added once. Older rows written afterwards need a full refresh
+    Returns: number of processed historic occupancies
+    """
+    state_table = OccupancyRollupState.__table__
+    overlap = pd.Timedelta(hours=app.config["ROLLUP_OVERLAP_HOURS"])
+    with db.engine.begin() as connection:
+        if full:
+            for model in [OccupancyHourly, OccupancyDaily, OccupancyProfile, OccupancyRollupState]:
+                connection.execute(model.__table__.delete())
+        refreshed = dict(connection.execute(db.select([
+            state_table.c.parkingspot_id, state_table.c.refreshed_until])).fetchall())
+        spots = connection.execute(db.select([
+            HistoricOccupancy.parkingspot_id, func.max(HistoricOccupancy.datetime)]).group_by(
+            HistoricOccupancy.parkingspot_id)).fetchall()
+
+        num_rows = 0
+        for parkingspot_id, last in spots:
+            # whole days, so the daily buckets can be recomputed as well
+            start = refreshed.get(parkingspot_id)
+            until = (pd.Timestamp(last) - overlap).floor("D")
+            if start is not None:
+                until = max(until, pd.Timestamp(start))
+            until = until.to_pydatetime()
+            is_touched = HistoricOccupancy.datetime >= start if start is not None else true()
+            raw = pd.DataFrame(connection.execute(db.select([
+                HistoricOccupancy.datetime, HistoricOccupancy.occupation,
+                HistoricOccupancy.max_occupation]).where(and_(
+                    HistoricOccupancy.parkingspot_id == parkingspot_id, is_touched))).fetchall(),
+                columns=["datetime", "occupation", "max_occupation"])
+            raw["datetime"] = pd.to_datetime(raw["datetime"])
+
+            if start is None:
+                # a parking spot without state is rebuilt completely
+                for model in [OccupancyHourly, OccupancyDaily, OccupancyProfile]:
+                    connection.execute(model.__table__.delete().where(
+                        model.__table__.c.parkingspot_id == parkingspot_id))
+            for name, (model, freq) in ROLLUPS.items():
+                table = model.__table__
+                if start is not None:
+                    connection.execute(table.delete().where(and_(
+                        table.c.parkingspot_id == parkingspot_id, table.c.period_start >= start)))
+                buckets = aggregate_occupancies(raw, freq).assign(parkingspot_id=parkingspot_id)
+                if not buckets.empty:
+                    connection.execute(table.insert(), dataframe_records(buckets))
+
+            _add_to_profile(connection, parkingspot_id, raw.loc[raw["datetime"] < until])
+            connection.execute(state_table.delete().where(state_table.c.parkingspot_id == parkingspot_id))
+            connection.execute(state_table.insert(), [
+                {"parkingspot_id": parkingspot_id, "refreshed_until": until, "updated": datetime.now()}])
+            num_rows += len(raw)
+    return num_rows
+
+
+def aggregate_occupancies(raw, freq):
+    """ aggregates 15 minute occupancies into buckets of the given pandas frequency \n
+        raw needs the columns datetime, occupation and max_occupation
+    Returns: dataframe with the columns of the hourly and daily rollup tables
+    """
+    valid = raw.loc[raw["occupation"] >= 0]
+    capacity = valid["max_occupation"].where(valid["max_occupation"] > 0)
+    grouped = pd.DataFrame({
+        "period_start": valid["datetime"].dt.floor(freq),
+        "occupation": valid["occupation"],
+        "rate": valid["occupation"] / capacity}).groupby("period_start")
+    buckets = grouped["occupation"].agg(["count", "mean", "min", "max"])
+    buckets.columns = ["num_values", "occupation_mean", "occupation_min", "occupation_max"]
+    buckets["rate_mean"] = grouped["rate"].mean()
+    return buckets.reset_index()
+
+
+def profile_increments(raw):
+    """ sums of the occupancies per season, weekday and quarter hour
+    Returns: dataframe with the columns of the profile table except parkingspot_id
+    """
+    valid = raw.loc[raw["occupation"] >= 0]
+    timestamps = valid["datetime"].dt
+    rate = valid["occupation"] / valid["max_occupation"].where(valid["max_occupation"] > 0)
+    grouped = pd.DataFrame({
+        "season": (timestamps.month % 12) // 3,
+        "weekday": timestamps.dayofweek,
+        "slot": timestamps.hour * 4 + timestamps.minute // 15,
+        "occupation": valid["occupation"].astype(float),
+        "rate": rate}).groupby(["season", "weekday", "slot"])
+    increments = pd.DataFrame({
+        "num_values": grouped["occupation"].count(),
+        "occupation_sum": grouped["occupation"].sum(),
+        "num_rates": grouped["rate"].count(),
+        "rate_sum": grouped["rate"].sum()})
+    return increments
+
+
+def _add_to_profile(connection, parkingspot_id, raw):
+    increments = profile_increments(raw)
+    if increments.empty:
+        return
+    table = OccupancyProfile.__table__
+    keys = ["season", "weekday", "slot"]
+    existing = pd.DataFrame(connection.execute(db.select([
+        table.c.season, table.c.weekday, table.c.slot, table.c.num_values, table.c.occupation_sum,
+        table.c.num_rates, table.c.rate_sum]).where(table.c.parkingspot_id == parkingspot_id)).fetchall(),
+        columns=keys + list(increments.columns)).set_index(keys)
+    profile = increments.add(existing, fill_value=0)
+    connection.execute(table.delete().where(table.c.parkingspot_id == parkingspot_id))
+    profile = profile.reset_index().assign(parkingspot_id=parkingspot_id)
+    profile[["num_values", "num_rates"]] = profile[["num_values", "num_rates"]].astype("int64")
+    connection.execute(table.insert(), dataframe_records(profile))
+
+
+def profile_to_dict(rows):
+    """ formats profile rows of one parking spot as 7x96 arrays per season
+    Returns: dict season -> {"occupation": 7x96 means, "rate": 7x96 means}, null without values
+    """
+    profiles = dict()
+    for season, weekday, slot, num_values, occupation_sum, num_rates, rate_sum in rows:
+        profile = profiles.setdefault(SEASONS[season], {
+            "occupation": np.full((7, 96), np.nan), "rate": np.full((7, 96), np.nan)})
+        if num_values:
+            profile["occupation"][weekday, slot] = occupation_sum / num_values
+        if num_rates:
+            profile["rate"][weekday, slot] = rate_sum / num_rates
+    return {season: {name: _nan_to_none(values) for name, values in profile.items()}
+            for season, profile in profiles.items()}
+
+
+def _nan_to_none(values):
+    return [[None if np.isnan(value) else round(float(value), 4) for value in row] for row in values]
@@ -0,0 +1,98 @@
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, or_
+
+from project import app, db
+from project.bulk import insert_dataframe
+from project.models import Prediction, PredictionRun
+
+
+def create_prediction_run():
+    """ starts a new, unpublished version of the predictions
+    Returns: id of the new prediction run
+    """
+    run = PredictionRun(created=datetime.now())
+    db.session.add(run)
+    db.session.commit()
+    return run.id
+
+
+def write_predictions(run_id, df):
+    """ bulk inserts predictions into an unpublished prediction run \n
+        df needs the columns datetime, occupation, rmse and parkingspot_id
+    Returns: number of written rows
+    """
+    df = df.assign(run_id=run_id)
+    num_rows, seconds = insert_dataframe(df, Prediction.__table__)
+    return num_rows
+
+
+def publish_prediction_run(run_id, collect=True):
+    """ makes a prediction run visible to all readers in one transaction \n
+        older runs are deleted in a background thread afterwards
+    """
+    db.session.query(PredictionRun).filter(PredictionRun.id == run_id).update(
+        {PredictionRun.published: datetime.now()}, synchronize_session=False)
+    db.session.commit()
+    if collect:
+        thread = threading.Thread(target=_collect_in_app_context, daemon=True)
+        thread.start()
+
+
+def current_prediction_run_id():
+    """ returns the id of the latest published prediction run
+    Returns: id or None if no run has been published yet
+    """
+    return db.session.query(func.max(PredictionRun.id)).filter(
+        PredictionRun.published.isnot(None)).scalar()
+
+
+def current_prediction_run():
+    """ the id of the latest published prediction run as a scalar subquery \n
+        filtering by it resolves the run in the same statement that reads the predictions,
+        so a run published and collected in between can not leave the result empty
+    Returns: scalar subquery
+    """
+    return db.session.query(func.max(PredictionRun.id)).filter(
+        PredictionRun.published.isnot(None)).as_scalar()
+
+
+def is_current_prediction():
+    """ filter condition for the predictions of the latest published run \n
+        predictions without a run (e.g. from seed_db) are served until the first run is published
+    Returns: sql expression
+    """
+    run_id = current_prediction_run()
+    return or_(Prediction.run_id == run_id, and_(run_id.is_(None), Prediction.run_id.is_(None)))
+
+
+def collect_prediction_runs():
+    """ deletes the predictions and runs replaced by the current run \n
+        published runs older than the current one are deleted at once, unpublished
+        ones only after PREDICTION_RUN_GRACE seconds, as a job may still be writing them
+    Returns: number of deleted predictions
+    """
+    current_run_id = current_prediction_run_id()
+    if current_run_id is None:
+        return 0
+    abandoned = datetime.now() - timedelta(seconds=app.config["PREDICTION_RUN_GRACE"])
+    run_ids = [run_id for (run_id,) in db.session.query(PredictionRun.id).filter(
+        PredictionRun.id < current_run_id,
+        or_(PredictionRun.published.isnot(None), PredictionRun.created < abandoned))]
+    num_rows_deleted = db.session.query(Prediction).filter(
+        or_(Prediction.run_id.in_(run_ids), Prediction.run_id.is_(None))).delete(synchronize_session=False)
+    db.session.query(PredictionRun).filter(PredictionRun.id.in_(run_ids)).delete(synchronize_session=False)
+    db.session.commit()
+    return num_rows_deleted
+
+
+def _collect_in_app_context():
+    with app.app_context():
+        try:
+            collect_prediction_runs()
+        except Exception as e:
+            db.session.rollback()
+            print("Error: could not delete old predictions: {}".format(e))
+        finally:
+            db.session.remove()
@@ -0,0 +1,47 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from project import app, db
+from project.models import Parkingspot
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """
+    A base class for tests against an empty SQLite database
+
+    Every test gets its own database file in a temporary directory with all
+    tables of the models and one parking spot per name in parkingspot_names
+    (ids in that order). The app context stays pushed during the test.
+    """
+
+    parkingspot_names = []
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(Path(self.tmp_dir.name) / "test.db")
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+        for name in self.parkingspot_names:
+            db.session.add(Parkingspot(name=name, max_occupancy=100, lat=50.0, lon=8.0, open="0-24h",
+                                       parkingspot_type="Parkhaus", height_limit="2 m", handicapped_spots="1",
+                                       women_spots="1", parent_child_spots="1", address="Musterstrasse 22",
+                                       url="www.test.com"))
+        db.session.commit()
+        self.client = app.test_client()
+
+    # executed after each test
+    def tearDown(self):
+        db.session.remove()
+        db.get_engine(app).dispose()
+        self.app_context.pop()
+        app.config['SQLALCHEMY_DATABASE_URI'] = self.database_uri
+        self.tmp_dir.cleanup()
@@ -0,0 +1,88 @@
+import unittest
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import text
+
+from project import db
+from project.bulk import insert_dataframe, upsert_dataframe
+from project.migrations import migrate
+from project.models import HistoricOccupancy, Job
+from project.tests.databaseTestCase import DatabaseTestCase
+
+
+class BulkTests(DatabaseTestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        super().setUp()
+        self.table = HistoricOccupancy.__table__
+
+###############
+#### tests ####
+###############
+
+    print("### Performing Bulk Tests ###")
+
+    def occupancies(self, occupation, periods=4):
+        return pd.DataFrame({"datetime": pd.date_range("2020-05-01", periods=periods, freq="15min"),
+                             "occupation": occupation, "max_occupation": 100, "parkingspot_id": 1})
+
+    def stored(self):
+        with db.engine.connect() as connection:
+            return [tuple(row) for row in connection.execute(text(
+                "SELECT datetime, occupation FROM historic_occupancy ORDER BY datetime, id"))]
+
+    def test_upsert(self):
+        self.assertEqual(upsert_dataframe(self.occupancies(10), self.table, ["parkingspot_id", "datetime"]), (4, 0))
+        self.assertEqual(upsert_dataframe(self.occupancies(20, periods=6), self.table,
+                                          ["parkingspot_id", "datetime"]), (2, 4))
+        self.assertEqual([occupation for timestamp, occupation in self.stored()], [10] * 4 + [20] * 2)
+
+        self.assertEqual(upsert_dataframe(self.occupancies(30, periods=6), self.table,
+                                          ["parkingspot_id", "datetime"], update=True), (0, 6))
+        self.assertEqual([occupation for timestamp, occupation in self.stored()], [30] * 6)
+
+    def test_upsert_duplicate_keys(self):
+        # the last row of a duplicate key is used, also for rows that already exist
+        upsert_dataframe(self.occupancies(10, periods=1), self.table, ["parkingspot_id", "datetime"])
+        df = pd.concat([self.occupancies([1, 2], periods=2), self.occupancies([3, 4], periods=2)],
+                       ignore_index=True)
+        self.assertEqual(upsert_dataframe(df, self.table, ["parkingspot_id", "datetime"], update=True), (1, 3))
+        self.assertEqual([occupation for timestamp, occupation in self.stored()], [3, 4])
+
+        df = pd.concat([self.occupancies(5, periods=3), self.occupancies(6, periods=3)], ignore_index=True)
+        self.assertEqual(upsert_dataframe(df, self.table, ["parkingspot_id", "datetime"]), (1, 5))
+        self.assertEqual([occupation for timestamp, occupation in self.stored()], [3, 4, 6])
+
+    def test_migrate(self):
+        # a database from before the unique indexes, with duplicate rows and pending jobs
+        with db.engine.begin() as connection:
+            connection.execute(text("DROP INDEX uq_historic_occupancy_parkingspot_id_datetime"))
+            connection.execute(text("DROP INDEX uq_job_name_pending"))
+        insert_dataframe(pd.concat([self.occupancies(1), self.occupancies(2, periods=2)], ignore_index=True),
+                         self.table)
+        now = datetime.now()
+        for name in ["predict", "predict", "weather_update"]:
+            db.session.add(Job(name=name, status="running", created=now))
+        db.session.commit()
+
+        applied = migrate()
+        self.assertIn("deleted 2 duplicate rows from historic_occupancy", applied)
+        self.assertIn("created index uq_historic_occupancy_parkingspot_id_datetime", applied)
+        self.assertIn("failed 1 duplicate pending jobs", applied)
+        self.assertIn("created index uq_job_name_pending", applied)
+        # the first row of every key is kept
+        self.assertEqual([occupation for timestamp, occupation in self.stored()], [1] * 4)
+        self.assertEqual([job.status for job in db.session.query(Job).order_by(Job.id)],
+                         ["failed", "running", "running"])
+
+        self.assertEqual(migrate(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
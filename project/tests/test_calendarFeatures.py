@@ -0,0 +1,111 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+from project.calendarFeatures import CalendarFeatureStore, build_calendar_features, calendarWeeks, \
+    calcCalendarWeek, isweihnachten
+
+
+class CalendarFeatureTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name) / "calendar_features.json"
+        self.ferienRlp = pd.DataFrame({"start": pd.to_datetime(["2020-04-09", "2020-07-06"]),
+                                       "end": pd.to_datetime(["2020-04-17", "2020-08-14"])})
+        self.ferienHe = pd.DataFrame({"start": pd.to_datetime(["2020-04-06"]),
+                                      "end": pd.to_datetime(["2020-04-18"])})
+        self.feiertageRlp = pd.DataFrame({"id": [1, 2, 3], "date": pd.to_datetime(
+            ["2020-04-10", "2020-04-13", "2020-12-25"])})
+        self.feiertageHe = pd.DataFrame({"id": [1, 2], "date": pd.to_datetime(["2020-04-10", "2020-06-11"])})
+
+    # executed after each test
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+###############
+#### tests ####
+###############
+
+    print("### Performing Calendar Feature Tests ###")
+
+    def sources(self):
+        return self.ferienRlp, self.ferienHe, self.feiertageRlp, self.feiertageHe
+
+    def test_calendarWeeks(self):
+        timestamps = pd.date_range("2014-12-20", "2027-01-10", freq="13H")
+        self.assertEqual(list(calendarWeeks(timestamps)), [calcCalendarWeek(timestamp) for timestamp in timestamps])
+
+    def test_build_calendar_features(self):
+        timestamps = pd.date_range("2020-03-30", "2020-12-31 23:45", freq="15min")
+        features = build_calendar_features(timestamps, *self.sources())
+        self.assertEqual(list(features["Uhrzeit"][:3]), [0, 15, 30])
+        self.assertEqual(list(features["Weihnachten"]), [isweihnachten(timestamp) for timestamp in timestamps])
+        self.assertEqual(features.loc["2020-04-08 12:00", "bisFeiertagRlp"], 2)
+        self.assertEqual(features.loc["2020-04-14 12:00", "nachFeiertagRlp"], 1)
+        self.assertEqual(features.loc["2020-04-17 00:00", "SchulferienRlp"], 1)
+        self.assertEqual(features.loc["2020-04-17 00:15", "SchulferienRlp"], 0)
+        self.assertEqual(features["Wochentag"].dtype, "int8")
+
+    def test_store(self):
+        store = CalendarFeatureStore(self.path, years_ahead=1)
+        start, end = pd.Timestamp("2020-04-06 08:10"), pd.Timestamp("2020-04-13")
+        features = store.features(start, end, *self.sources())
+        expected = build_calendar_features(pd.date_range("2020-04-06 08:00", end, freq="15min"), *self.sources())
+        pd.testing.assert_frame_equal(features, expected, check_names=False)
+
+        # unchanged tables and another store on the same file reuse the materialized features
+        self.assertEqual(store.refresh(start, end, *self.sources()), [])
+        self.assertEqual(CalendarFeatureStore(self.path, years_ahead=1).refresh(start, end, *self.sources()), [])
+
+        # only the columns of the changed table are recomputed
+        self.feiertageHe = pd.DataFrame({"id": [1], "date": pd.to_datetime(["2020-04-09"])})
+        self.assertEqual(store.refresh(start, end, *self.sources()), ["bisFeiertagHe", "nachFeiertagHe"])
+        features = store.features(start, end, *self.sources())
+        self.assertEqual(features.loc["2020-04-08 12:00", "bisFeiertagHe"], 1)
+        self.assertEqual(len(list(self.path.parent.glob("*.npy"))), 1)
+
+        # a range outside of the materialized years is rebuilt
+        later = pd.Timestamp.today().normalize() + pd.Timedelta(days=3 * 366)
+        features = store.features(later, later + pd.Timedelta(days=7), *self.sources())
+        self.assertEqual(len(features), 7 * 96 + 1)
+        self.assertEqual(features.index[0], later)
+
+    def test_concurrent_refresh(self):
+        store = CalendarFeatureStore(self.path, years_ahead=1)
+        start, end = pd.Timestamp("2020-04-06"), pd.Timestamp("2020-04-13")
+        errors = []
+
+        def read():
+            try:
+                for i in range(20):
+                    features = store.features(start, end, *self.sources())
+                    self.assertEqual(len(features), 7 * 96 + 1)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=read) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        # a second store on the same file, like another worker process
+        other = CalendarFeatureStore(self.path, years_ahead=1)
+        for day in range(1, 11):
+            other.refresh(start, end, self.ferienRlp, self.ferienHe, self.feiertageRlp, pd.DataFrame(
+                {"id": [1], "date": pd.to_datetime(["2020-04-{:02d}".format(day)])}))
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(list(self.path.parent.glob("*.tmp")), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
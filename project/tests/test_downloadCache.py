@@ -0,0 +1,81 @@
+import tempfile
+import unittest
+
+from project.downloadCache import DownloadCache
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or dict()
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(self.status_code)
+
+
+class FakeSession(object):
+    """ serves one file with an etag and records the request headers
+    """
+
+    def __init__(self, content, etag):
+        self.content = content
+        self.etag = etag
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.requests.append(headers)
+        if headers.get("If-None-Match") == self.etag:
+            return FakeResponse(304)
+        return FakeResponse(200, self.content, {"ETag": self.etag})
+
+
+class DownloadCacheTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.url = "http://opendata.dwd.de/stundenwerte_TU_03137_akt.zip"
+
+    # executed after each test
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+###############
+#### tests ####
+###############
+
+    print("### Performing Download Cache Tests ###")
+
+    def test_conditional_requests(self):
+        session = FakeSession(b"first", '"1"')
+        cache = DownloadCache(self.tmp_dir.name, session=session)
+        path, sha256 = cache.fetch(self.url)
+
+        self.assertEqual(path.read_bytes(), b"first")
+        self.assertEqual(cache.fetch(self.url), (path, sha256))
+        self.assertEqual(session.requests, [dict(), {"If-None-Match": '"1"'}])
+
+        session.content, session.etag = b"second", '"2"'
+        path, new_sha256 = cache.fetch(self.url)
+        self.assertEqual(path.read_bytes(), b"second")
+        self.assertNotEqual(new_sha256, sha256)
+
+    def test_offline(self):
+        cache = DownloadCache(self.tmp_dir.name, offline=True, session=None)
+        with self.assertRaises(FileNotFoundError):
+            cache.fetch(self.url)
+
+        DownloadCache(self.tmp_dir.name, session=FakeSession(b"mirror", '"1"')).fetch(self.url)
+        path, sha256 = cache.fetch(self.url)
+        self.assertEqual(path.read_bytes(), b"mirror")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+import io
+import threading
+import time
+import unittest
+import zipfile
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import numpy as np
+import pandas as pd
+import requests
+
+from project import download_cache
+from project.dwdForecast import _parse_values, convert_xml_to_pandas, open_forecast_kml
+
+KML = b"""<?xml version="1.0" encoding="ISO-8859-1" standalone="yes"?>
+<kml:kml xmlns:dwd="https://opendata.dwd.de/weather/lib/pointforecast_dwd_extension_V1_0.xsd" xmlns:kml="http://www.opengis.net/kml/2.2">
+    <kml:Document>
+        <kml:ExtendedData>
+            <dwd:ProductDefinition>
+                <dwd:Issuer>Deutscher Wetterdienst</dwd:Issuer>
+                <dwd:ProductID>MOSMIX</dwd:ProductID>
+                <dwd:GeneratingProcess>DWD MOSMIX hourly, Version 1.0</dwd:GeneratingProcess>
+                <dwd:IssueTime>2020-05-01T03:00:00.000Z</dwd:IssueTime>
+                <dwd:ForecastTimeSteps>
+                    <dwd:TimeStep>2020-05-01T04:00:00.000Z</dwd:TimeStep>
+                    <dwd:TimeStep>2020-05-01T05:00:00.000Z</dwd:TimeStep>
+                    <dwd:TimeStep>2020-05-01T06:00:00.000Z</dwd:TimeStep>
+                    <dwd:TimeStep>2020-05-01T07:00:00.000Z</dwd:TimeStep>
+                </dwd:ForecastTimeSteps>
+            </dwd:ProductDefinition>
+        </kml:ExtendedData>
+        <kml:Placemark>
+            <kml:name>10637</kml:name>
+            <kml:description>FRANKFURT/M-FLUGHAFEN</kml:description>
+            <kml:ExtendedData>
+                <dwd:Forecast dwd:elementName="TTT">
+                    <dwd:value>     280.15     281.25     -     -</dwd:value>
+                </dwd:Forecast>
+            </kml:ExtendedData>
+            <kml:Point>
+                <kml:coordinates>8.6,50.05,111.0</kml:coordinates>
+            </kml:Point>
+        </kml:Placemark>
+        <kml:Placemark>
+            <kml:name>K584</kml:name>
+            <kml:description>MAINZ-LERCHENBERG</kml:description>
+            <kml:ExtendedData>
+                <dwd:Forecast dwd:elementName="TTT">
+                    <dwd:value>     -     273.15     -1.50     -</dwd:value>
+                </dwd:Forecast>
+                <dwd:Forecast dwd:elementName="RR1c">
+                    <dwd:value>     0.00     0.10     -     0.30</dwd:value>
+                </dwd:Forecast>
+                <dwd:Forecast dwd:elementName="FF">
+                    <dwd:value>     1.00     2.00     3.00     4.00</dwd:value>
+                </dwd:Forecast>
+            </kml:ExtendedData>
+            <kml:Point>
+                <kml:coordinates>8.15,49.97,195.0</kml:coordinates>
+            </kml:Point>
+        </kml:Placemark>
+    </kml:Document>
+</kml:kml>
+"""
+
+
+def kmz():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip:
+        zip.writestr("MOSMIX_L_2020050103_K584.kml", KML)
+    return buffer.getvalue()
+
+
+class KmzHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.endswith("/stalled.kmz"):
+            time.sleep(1)
+        content = kmz()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DwdForecastTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), KmzHandler)
+        self.url = "http://127.0.0.1:{}/MOSMIX_L_LATEST_K584.kmz".format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    # executed after each test
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+###############
+#### tests ####
+###############
+
+    print("### Performing DWD Forecast Tests ###")
+
+    def test_convert_xml_to_pandas(self):
+        df, station_df = convert_xml_to_pandas(io.BytesIO(KML), return_station_data=True)
+
+        self.assertEqual(list(df.columns), ["date_start", "TTT", "station_id", "product_id",
+                                            "generating_process", "date_issued", "RR1c", "FF"])
+        self.assertEqual(list(df["station_id"]), ["10637"] * 4 + ["K584"] * 4)
+        np.testing.assert_array_equal(df["TTT"], [280.15, 281.25, np.nan, np.nan, np.nan, 273.15, -1.5, np.nan])
+        self.assertEqual(df["date_start"].iloc[-1], pd.Timestamp("2020-05-01T07:00:00Z"))
+        self.assertEqual(df["date_issued"].iloc[0], pd.Timestamp("2020-05-01T03:00:00Z"))
+        self.assertEqual(list(station_df["station_id"]), ["10637", "K584"])
+        self.assertEqual(list(station_df["geo_lat"]), [50.05, 49.97])
+
+    def test_filters(self):
+        df = convert_xml_to_pandas(io.BytesIO(KML), station_ids=["K584"], parameters=["TTT", "RR1c"])
+
+        self.assertEqual(list(df.columns), ["date_start", "TTT", "RR1c", "station_id", "product_id",
+                                            "generating_process", "date_issued"])
+        np.testing.assert_array_equal(df["RR1c"], [0.0, 0.1, np.nan, 0.3])
+
+    def test_parse_values(self):
+        np.testing.assert_array_equal(_parse_values("  -  -  -  1.50 -   2 -"),
+                                      [np.nan, np.nan, np.nan, 1.5, np.nan, 2.0, np.nan])
+        np.testing.assert_array_equal(_parse_values(" -  - "), [np.nan, np.nan])
+        self.assertEqual(_parse_values("1 2").dtype, float)
+
+    def test_station_data_only(self):
+        df, station_df = convert_xml_to_pandas(io.BytesIO(KML), return_station_data=True, return_forecasts=False)
+
+        self.assertIsNone(df)
+        self.assertEqual(list(station_df["station_id"]), ["10637", "K584"])
+        self.assertEqual(list(station_df["station_name"]), ["FRANKFURT/M-FLUGHAFEN", "MAINZ-LERCHENBERG"])
+        self.assertEqual(list(station_df["height"]), [111.0, 195.0])
+
+    def test_open_forecast_kml(self):
+        # in memory and spilled to a temporary file
+        for max_size in [10 ** 6, 1]:
+            with open_forecast_kml(self.url, max_size=max_size) as kml_file:
+                df = convert_xml_to_pandas(kml_file, station_ids=["K584"])
+            self.assertEqual(list(df["FF"]), [1.0, 2.0, 3.0, 4.0])
+
+    def test_open_forecast_kml_timeout(self):
+        timeout = download_cache.timeout
+        download_cache.timeout = 0.2
+        try:
+            with self.assertRaises(requests.Timeout):
+                with open_forecast_kml(self.url.replace("MOSMIX_L_LATEST_K584.kmz", "stalled.kmz")):
+                    pass
+        finally:
+            download_cache.timeout = timeout
+
+
+if __name__ == "__main__":
+    unittest.main()
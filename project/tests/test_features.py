@@ -0,0 +1,204 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from project.views import shoppingdaystonextfeiertag, shoppingdaysafterfeiertag, isschulferien, fillMissingValues, \
+    drop_constant_rows_from_df, ConstantRunDetector, historicLagFeatures, historicshift, historicshift2
+
+
+def reference_shoppingdays(day, feiertage, after):
+    """ per-timestamp implementation the vectorized functions have to match
+    """
+    diffs = []
+    for feiertag in feiertage.date:
+        if after:
+            diff = np.busday_count(feiertag.date(), day.date(), weekmask='Mon Tue Wed Thu Fri Sat')
+        else:
+            diff = np.busday_count(day.date(), feiertag.date(), weekmask='Mon Tue Wed Thu Fri Sat')
+        diffs.append(diff)
+    try:
+        return min([d for d in diffs if d >= 0])
+    except ValueError:
+        return 100
+
+
+def reference_fillMissingValues(timeseries, column):
+    """ per-timestamp implementation the vectorized imputation has to match
+    """
+    copydf = timeseries.astype(float)
+    for index, row in timeseries.iterrows():
+        if row[column] == -999:
+            values = []
+            for weeks in [-4, -3, -2, -1, 1, 2, 3, 4]:
+                try:
+                    value = timeseries.loc[index + pd.Timedelta(days=7 * weeks)][column]
+                except KeyError:
+                    continue
+                if value > -1:
+                    values.append(value)
+            if values:
+                copydf.loc[index, column] = np.mean(values)
+    return copydf
+
+
+def reference_constant_rows(df, column, number_of_constant_rows):
+    """ row by row implementation the run-length detection has to match
+    """
+    to_delete = []
+    indices = []
+    values = list(df[column])
+    for h, index in enumerate(df.index):
+        if h < len(values) - 1 and values[h] == values[h + 1]:
+            to_delete.append(index)
+        else:
+            if len(to_delete) > number_of_constant_rows:
+                indices.extend(to_delete)
+            to_delete = []
+    return indices
+
+
+def reference_historicshift(df, column, lagsize, shifttime, timestap):
+    """ shift-and-add implementation the lag features have to match
+    """
+    newdf = pd.DataFrame(index=df.index, data=0, columns=['hist'])
+    for i in range(0, lagsize):
+        newdf['hist'] = newdf['hist'] + df[column].shift(shifttime+(timestap*i))
+    newdf['hist'] = newdf['hist']/lagsize
+    newdf.dropna(inplace=True)
+    return newdf
+
+
+class FeatureTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        # includes sundays (2020-04-12, 2020-05-31, 2020-11-01) and an unsorted duplicate
+        self.feiertage = pd.DataFrame({"date": pd.to_datetime([
+            "2020-01-01", "2020-04-10", "2020-04-12", "2020-04-13", "2020-05-01",
+            "2020-05-31", "2020-06-01", "2020-11-01", "2020-12-25", "2020-12-26", "2020-04-10"])})
+        self.timestamps = pd.date_range("2019-12-20", "2021-01-05", freq='420min')
+
+    # executed after each test
+    def tearDown(self):
+        pass
+
+###############
+#### tests ####
+###############
+
+    print("### Performing Feature Tests ###")
+
+    def test_shoppingdaystonextfeiertag(self):
+        expected = [reference_shoppingdays(day, self.feiertage, after=False) for day in self.timestamps]
+        result = shoppingdaystonextfeiertag(self.timestamps, self.feiertage)
+        self.assertEqual(list(result), expected)
+
+    def test_shoppingdaysafterfeiertag(self):
+        expected = [reference_shoppingdays(day, self.feiertage, after=True) for day in self.timestamps]
+        result = shoppingdaysafterfeiertag(self.timestamps, self.feiertage)
+        self.assertEqual(list(result), expected)
+
+    def test_without_feiertage(self):
+        feiertage = pd.DataFrame({"date": pd.to_datetime([])})
+        self.assertEqual(list(shoppingdaystonextfeiertag(self.timestamps[:3], feiertage)), [100, 100, 100])
+        self.assertEqual(list(shoppingdaysafterfeiertag(self.timestamps[:3], feiertage)), [100, 100, 100])
+
+    def test_isschulferien(self):
+        # overlapping, nested and unsorted vacations
+        ferien = pd.DataFrame({"start": pd.to_datetime(["2020-07-06 00:00:00", "2020-04-06 00:00:00", "2020-04-09 00:00:00", "2020-10-12 12:00:00"]),
+                               "end": pd.to_datetime(["2020-08-14", "2020-04-18", "2020-04-17", "2020-10-23"])})
+        expected = pd.Series(0, index=self.timestamps)
+        for index, row in ferien.iterrows():
+            expected.loc[row['start']:row['end']] = 1
+        self.assertEqual(list(isschulferien(self.timestamps, ferien)), list(expected))
+        self.assertEqual(list(isschulferien(self.timestamps[:2], ferien.iloc[:0])), [0, 0])
+
+    def test_fillMissingValues(self):
+        rng = np.random.RandomState(0)
+        index = pd.date_range("2020-01-06", periods=96 * 7 * 6, freq='15min')
+        df = pd.DataFrame({"Bleiche": rng.randint(0, 100, len(index)),
+                           "Cinestar": rng.randint(0, 100, len(index))}, index=index)
+        df[rng.rand(*df.shape) < 0.3] = -999
+
+        # regular grid and a grid with missing timestamps
+        for timeseries in [df, df.drop(index[rng.rand(len(index)) < 0.05])]:
+            expected = reference_fillMissingValues(timeseries, "Bleiche")
+            result = fillMissingValues(timeseries, "Bleiche")
+            np.testing.assert_allclose(result["Bleiche"], expected["Bleiche"])
+            self.assertTrue((result["Cinestar"] == timeseries["Cinestar"]).all())
+
+        result = fillMissingValues(df)
+        np.testing.assert_allclose(result["Cinestar"], reference_fillMissingValues(df, "Cinestar")["Cinestar"])
+
+    def test_drop_constant_rows_from_df(self):
+        rng = np.random.RandomState(0)
+        index = pd.date_range("2020-01-06", periods=2000, freq='15min')
+        # short random values, so runs of every length occur
+        df = pd.DataFrame({"Bleiche": rng.randint(0, 2, len(index)),
+                           "Cinestar": rng.randint(0, 3, len(index))}, index=index)
+        df.iloc[-10:, 0] = 7
+
+        indices, result = drop_constant_rows_from_df(df, "Bleiche", 3)
+        expected = reference_constant_rows(df, "Bleiche", 3)
+        self.assertEqual(indices, expected)
+        self.assertTrue((result.loc[expected, "Bleiche"] == -999).all())
+        self.assertEqual((result["Bleiche"] == -999).sum(), len(expected))
+        self.assertTrue((result["Cinestar"] == df["Cinestar"]).all())
+        self.assertTrue(index[-2] in indices)
+
+        indices, result = drop_constant_rows_from_df(df, number_of_constant_rows=2)
+        for column in df.columns:
+            self.assertEqual(list(indices[column]), reference_constant_rows(df, column, 2))
+
+    def test_ConstantRunDetector(self):
+        detector = ConstantRunDetector(number_of_constant_rows=2)
+        flags = [detector.update("Bleiche", value) for value in [1, 5, 5, 5, 5, 5, 2, 2]]
+        self.assertEqual(flags, [False, False, False, False, True, True, False, False])
+        # the state is kept per parking spot
+        self.assertFalse(detector.update("Cinestar", 5))
+        self.assertFalse(detector.update("Bleiche", 2))
+        self.assertTrue(detector.update("Bleiche", 2))
+
+    def test_historicLagFeatures(self):
+        rng = np.random.RandomState(0)
+        index = pd.date_range("2020-01-06", periods=96 * 7 * 5, freq='15min')
+        df = pd.DataFrame({"Bleiche": rng.randint(0, 400, len(index)),
+                           "Cinestar": rng.randint(0, 300, len(index))}, index=index)
+
+        features = historicLagFeatures(df, [1, 96, 672], windows=[1, 3], step=672)
+        self.assertEqual(features.shape, (len(df), 2 * 3 * 2))
+        self.assertTrue((features.dtypes == np.float32).all())
+        for column in df.columns:
+            for lag in [1, 96, 672]:
+                for window in [1, 3]:
+                    expected = reference_historicshift(df, column, window, lag, 672)["hist"]
+                    result = features["{}_lag{}_w{}".format(column, lag, window)]
+                    self.assertEqual(result.isna().sum(), len(df) - len(expected))
+                    np.testing.assert_allclose(result.dropna(), expected, rtol=1e-6)
+
+        # duplicate lags and windows give one column each
+        features = historicLagFeatures(df, [96, 1, 96], windows=[3, 1, 3], step=672, columns=["Bleiche"])
+        self.assertEqual(list(features.columns), ["Bleiche_lag96_w1", "Bleiche_lag96_w3",
+                                                  "Bleiche_lag1_w1", "Bleiche_lag1_w3"])
+
+        # a missing value only affects the features that contain it
+        missing = df.astype(float)
+        missing.iloc[1000, 0] = np.nan
+        features = historicLagFeatures(missing, [1], windows=[3], step=672, columns=["Bleiche"])["Bleiche_lag1_w3"]
+        self.assertEqual(list(features.isna().to_numpy().nonzero()[0]), list(range(1345)) + [1673, 2345])
+
+        expected = reference_historicshift(df, "Bleiche", 2, 336, 336)
+        pd.testing.assert_series_equal(historicshift(df, "Bleiche")["histBelegung"], expected["hist"],
+                                       check_names=False)
+        pd.testing.assert_series_equal(historicshift2(df, "Cinestar", 3, shifttime=96, timestap=672)["histCinestar"],
+                                       reference_historicshift(df, "Cinestar", 3, 96, 672)["hist"],
+                                       check_names=False)
+
+
+if __name__ == "__main__":
+    unittest.main()
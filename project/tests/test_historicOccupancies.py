@@ -0,0 +1,73 @@
+import unittest
+
+import pandas as pd
+
+from project import app
+from project.bulk import insert_dataframe
+from project.models import HistoricOccupancy
+from project.tests.databaseTestCase import DatabaseTestCase
+from project.views import has_historic_filters
+
+
+class HistoricOccupancyTests(DatabaseTestCase):
+
+    parkingspot_names = ["Bleiche", "Cinestar"]
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        super().setUp()
+        insert_dataframe(pd.DataFrame({
+            "datetime": list(pd.date_range("2020-05-01", periods=3, freq="15min")) * 2,
+            "occupation": [1, 2, 3, 4, 5, 6], "max_occupation": [100] * 3 + [200] * 3,
+            "parkingspot_id": [1] * 3 + [2] * 3}), HistoricOccupancy.__table__)
+
+###############
+#### tests ####
+###############
+
+    print("### Performing Historic Occupancy Tests ###")
+
+    def test_filters(self):
+        response = self.client.get('/historicOccupancy?spot=Cinestar&from=2020-05-01T00:15:00')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.get_json(), {"occupancies": {"Cinestar": {
+            "2020-05-01T00:15:00": 5, "2020-05-01T00:30:00": 6}}, "next": None})
+
+        response = self.client.get('/historicMaxOccupancy?to=2020-05-01T00:15:00')
+        self.assertEqual(response.get_json()["occupancies"], {"Bleiche": {"2020-05-01T00:00:00": 100},
+                                                              "Cinestar": {"2020-05-01T00:00:00": 200}})
+
+    def test_pagination(self):
+        pages = []
+        url = '/historicOccupancy?limit=4'
+        while url is not None:
+            page = self.client.get(url).get_json()
+            pages.append(page["occupancies"])
+            url = '/historicOccupancy?limit=4&cursor=' + page["next"] if page["next"] is not None else None
+
+        self.assertEqual(pages, [
+            {"Bleiche": {"2020-05-01T00:00:00": 1, "2020-05-01T00:15:00": 2, "2020-05-01T00:30:00": 3},
+             "Cinestar": {"2020-05-01T00:00:00": 4}},
+            {"Cinestar": {"2020-05-01T00:15:00": 5, "2020-05-01T00:30:00": 6}}])
+
+    def test_invalid_parameters(self):
+        for query in ["limit=0", "limit=x", "from=yesterday", "cursor=1", "cursor=x_2020-05-01T00:00:00"]:
+            response = self.client.get('/historicOccupancy?' + query)
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn("invalid query parameter", response.get_json()["message"])
+
+    def test_unrelated_parameters(self):
+        # e.g. cache busters are answered from the csv exports like requests without parameters
+        for query, expected in [("", False), ("_=1589000000", False), ("spot=Bleiche", True), ("limit=10", True),
+                                ("cursor=1_2020-05-01T00:00:00", True), ("from=2020-05-01&_=1", True)]:
+            with app.test_request_context('/historicOccupancy?' + query):
+                self.assertEqual(has_historic_filters(), expected, query)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from project import app, db
+from project.jobs import FAILED, FINISHED, QUEUED, RUNNING, enqueue_job
+from project.models import Job
+from project.tests.databaseTestCase import DatabaseTestCase
+
+
+class JobTests(DatabaseTestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        super().setUp()
+        self.release = threading.Event()
+
+    # executed after each test
+    def tearDown(self):
+        self.release.set()
+        super().tearDown()
+
+###############
+#### tests ####
+###############
+
+    print("### Performing Job Tests ###")
+
+    def blocking_job(self):
+        self.release.wait(10)
+        return 3
+
+    def wait_for(self, job_id, status, timeout=10):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            db.session.expire_all()
+            job = db.session.query(Job).get(job_id)
+            if job.status == status:
+                return job
+            time.sleep(0.05)
+        self.fail("job {} did not reach status {}".format(job_id, status))
+
+    def add_job(self, name, status, created, heartbeat, worker="otherhost:1"):
+        job = Job(name=name, status=status, created=created, worker=worker, heartbeat=heartbeat)
+        db.session.add(job)
+        db.session.commit()
+        return job.id
+
+    def test_coalescing(self):
+        job_id = enqueue_job("test", self.blocking_job).id
+        self.wait_for(job_id, RUNNING)
+        self.assertEqual(enqueue_job("test", self.blocking_job).id, job_id)
+        other_job_id = enqueue_job("other", lambda: 0).id
+        self.assertNotEqual(other_job_id, job_id)
+        self.wait_for(other_job_id, FINISHED)
+
+        self.release.set()
+        job = self.wait_for(job_id, FINISHED)
+        self.assertEqual(job.rows, 3)
+        new_job_id = enqueue_job("test", lambda: 0).id
+        self.assertNotEqual(new_job_id, job_id)
+        self.wait_for(new_job_id, FINISHED)
+
+    def test_pending_job_of_another_process(self):
+        now = datetime.now()
+        job_id = self.add_job("test", QUEUED, now, now)
+        self.assertEqual(enqueue_job("test", lambda: 0).id, job_id)
+
+        # enforced by the database, not only by enqueue_job
+        db.session.add(Job(name="test", status=QUEUED, created=now))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+    def test_dead_worker(self):
+        now = datetime.now()
+        job_id = self.add_job("test", RUNNING, now - timedelta(minutes=5), now - timedelta(minutes=2))
+        new_job_id = enqueue_job("test", lambda: 0).id
+
+        self.assertNotEqual(new_job_id, job_id)
+        job = db.session.query(Job).get(job_id)
+        self.assertEqual(job.status, FAILED)
+        self.assertEqual(job.message, "worker otherhost:1 stopped")
+        self.wait_for(new_job_id, FINISHED)
+
+    def test_timeout(self):
+        now = datetime.now()
+        created = now - timedelta(seconds=app.config["JOB_TIMEOUT"] + 1)
+        job_id = self.add_job("test", RUNNING, created, now)
+        new_job_id = enqueue_job("test", lambda: 0).id
+
+        self.assertNotEqual(new_job_id, job_id)
+        self.assertEqual(db.session.query(Job).get(job_id).message, "timed out")
+        self.wait_for(new_job_id, FINISHED)
+
+    def test_failing_job(self):
+        def fail():
+            raise ValueError("no data")
+        job = self.wait_for(enqueue_job("test", fail).id, FAILED)
+        self.assertEqual(job.message, "no data")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import contextlib
+import io
+import re
+import unittest
+
+from flask import Flask, Response, stream_with_context
+from sqlalchemy import create_engine, text
+
+from project.metrics import RequestMetrics
+
+
+def sample(metrics, name):
+    """ value of one sample line of the rendered metrics
+    """
+    match = re.search("^" + re.escape(name) + r" (\S+)$", metrics.render(), re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+class MetricsTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        self.metrics = RequestMetrics(slow_request_seconds=10)
+        self.app = Flask(__name__)
+        self.metrics.init_app(self.app)
+
+        @self.app.route('/items/<int:item_id>')
+        def show_item(item_id):
+            with self.engine.connect() as connection:
+                connection.execute(text("SELECT 1")).fetchall()
+                connection.execute(text("SELECT :id"), {"id": item_id}).fetchall()
+            return "x" * 250
+
+        @self.app.route('/stream')
+        def stream():
+            def generate():
+                for i in range(3):
+                    with self.engine.connect() as connection:
+                        yield str(connection.execute(text("SELECT 1")).scalar()) * 100
+            return Response(stream_with_context(generate()))
+
+        self.client = self.app.test_client()
+
+    # executed after each test
+    def tearDown(self):
+        self.engine.dispose()
+
+###############
+#### tests ####
+###############
+
+    print("### Performing Metrics Tests ###")
+
+    def test_requests(self):
+        for item_id in [1, 2, 3]:
+            self.assertEqual(self.client.get('/items/{}'.format(item_id)).status_code, 200)
+        self.client.get('/missing')
+        labels = '{method="GET",route="/items/<int:item_id>"'
+
+        self.assertEqual(sample(self.metrics, 'http_requests_total' + labels + ',status="200"}'), 3)
+        self.assertEqual(sample(self.metrics, 'http_requests_total{method="GET",route="unmatched",status="404"}'), 1)
+        self.assertEqual(sample(self.metrics, 'http_requests_in_flight' + labels + '}'), 0)
+        self.assertEqual(sample(self.metrics, 'http_request_duration_seconds_count' + labels + '}'), 3)
+        self.assertEqual(sample(self.metrics, 'http_request_duration_seconds_bucket' + labels + ',le="+Inf"}'), 3)
+        self.assertEqual(sample(self.metrics, 'http_response_size_bytes_bucket' + labels + ',le="100"}'), 0)
+        self.assertEqual(sample(self.metrics, 'http_response_size_bytes_bucket' + labels + ',le="1000"}'), 3)
+        self.assertEqual(sample(self.metrics, 'http_response_size_bytes_sum' + labels + '}'), 750)
+        self.assertEqual(sample(self.metrics, 'http_request_db_queries_total' + labels + '}'), 6)
+        self.assertGreater(sample(self.metrics, 'http_request_db_query_seconds_total' + labels + '}'), 0)
+        self.assertGreaterEqual(sample(self.metrics, 'db_queries_total'), 6)
+
+    def test_streamed_response(self):
+        response = self.client.get('/stream')
+        self.assertEqual(len(response.get_data()), 300)
+        labels = '{method="GET",route="/stream"}'
+
+        self.assertEqual(sample(self.metrics, 'http_response_size_bytes_sum' + labels), 300)
+        self.assertEqual(sample(self.metrics, 'http_request_db_queries_total' + labels), 3)
+        self.assertEqual(sample(self.metrics, 'http_requests_in_flight' + labels), 0)
+
+    def test_queries_outside_of_requests(self):
+        with self.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        self.assertGreaterEqual(sample(self.metrics, 'db_queries_total'), 1)
+        self.assertNotIn("http_request_db_queries_total{", self.metrics.render())
+
+    def test_init_app_twice(self):
+        # the engine events are listened to once, also for a second app
+        self.metrics.init_app(Flask("second"))
+        with self.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        self.assertEqual(sample(self.metrics, 'db_queries_total'), 1)
+
+    def test_failed_statement(self):
+        with self.engine.connect() as connection:
+            with self.assertRaises(Exception):
+                connection.execute(text("SELECT * FROM missing_table"))
+            self.assertEqual(connection.connection.info[self.metrics._key], [])
+            connection.execute(text("SELECT 1"))
+        self.assertEqual(sample(self.metrics, 'db_queries_total'), 1)
+
+    def test_slow_request_log(self):
+        self.metrics.slow_request_seconds = 1e-9
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.client.get('/items/1')
+        log = output.getvalue()
+        self.assertIn("slow request GET /items/<int:item_id> (200)", log)
+        self.assertIn("2 queries", log)
+        self.assertIn("1x", log)
+        self.assertIn("SELECT ?", log)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+import joblib
+import numpy as np
+
+from project.modelRegistry import ModelRegistry, rmse_grid
+
+
+class ModelRegistryTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.models_dir = Path(self.tmp_dir.name)
+        for name in ["Bleiche", "Cinestar"]:
+            self.dump(name, 1.0)
+
+    # executed after each test
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def dump(self, name, value):
+        for prefix in ["targetenc", "scaler", "", "rmseAll", "leaderAll"]:
+            joblib.dump(np.full(1000, value), self.models_dir / (prefix + name + ".sav"))
+
+###############
+#### tests ####
+###############
+
+    print("### Performing Model Registry Tests ###")
+
+    def test_get_is_cached(self):
+        registry = ModelRegistry(self.models_dir, self.models_dir)
+        models = registry.get("Bleiche")
+
+        self.assertIs(registry.get("Bleiche"), models)
+        self.assertEqual(models.model[0], 1.0)
+        self.assertEqual(registry.names(), ["Bleiche", "Cinestar"])
+
+    def test_reload_on_mtime_change(self):
+        registry = ModelRegistry(self.models_dir, self.models_dir, mmap_mode=None)
+        registry.get("Bleiche")
+        self.dump("Bleiche", 2.0)
+        model_file = self.models_dir / "Bleiche.sav"
+        os.utime(model_file, ns=(0, model_file.stat().st_mtime_ns + 10**9))
+
+        self.assertEqual(registry.get("Bleiche").model[0], 2.0)
+
+    def test_memory_budget(self):
+        registry = ModelRegistry(self.models_dir, self.models_dir, memory_budget=1)
+        registry.preload()
+
+        self.assertEqual(list(registry._entries), ["Cinestar"])
+
+    def test_parallel_cold_loads(self):
+        # both loads have to be inside _load at the same time to pass the barrier
+        barrier = threading.Barrier(2, timeout=10)
+
+        class WaitingRegistry(ModelRegistry):
+            def _load(self, path):
+                if path.name.startswith("targetenc"):
+                    barrier.wait()
+                return super()._load(path)
+
+        registry = WaitingRegistry(self.models_dir, self.models_dir)
+        results = dict()
+        threads = [threading.Thread(target=lambda name=name: results.update({name: registry.get(name)}))
+                   for name in ["Bleiche", "Cinestar"]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertFalse(barrier.broken)
+        self.assertEqual(sorted(results), ["Bleiche", "Cinestar"])
+        self.assertIs(registry.get("Bleiche"), results["Bleiche"])
+
+    def test_rmse_grid(self):
+        # monday without errors at 1 o'clock, sunday missing
+        rmse = {day: [[1.0, 2.0, 3.0, 4.0]] * 24 for day in range(6)}
+        rmse[0] = rmse[0][:1]
+        grid = rmse_grid(rmse)
+
+        self.assertEqual(grid.shape, (7, 24))
+        self.assertAlmostEqual(grid[2, 5], np.sqrt(7.5))
+        self.assertEqual(grid[0, 1], -999)
+        self.assertTrue((grid[6] == -999).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from project import occupancyCache
+from project.occupancyCache import CACHE_FILE_NAME, getHistoricOccupancies, getHistoricOccupanciesJson
+
+CSV = '''"","Bleiche","Cinestar","Gesamtergebnis"
+"KW 1","40","48","88"
+"01.01.2015","30","45","75"
+"00:00","{}","54","1.085"
+"00:15","31","","31"
+'''
+
+
+class OccupancyCacheTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp_dir.name)
+        self.csv_file = self.directory / "2015 Auslastung 15min.csv"
+        self.write_csv(1031)
+
+    # executed after each test
+    def tearDown(self):
+        occupancyCache._hot_cache.pop(self.directory.resolve(), None)
+        self.tmp_dir.cleanup()
+
+###############
+#### tests ####
+###############
+
+    print("### Performing Occupancy Cache Tests ###")
+
+    def write_csv(self, bleiche, mtime_ns=None):
+        self.csv_file.write_text(CSV.format(bleiche), encoding="utf-8")
+        if mtime_ns is not None:
+            os.utime(self.csv_file, ns=(mtime_ns, mtime_ns))
+
+    def test_round_trip(self):
+        df = getHistoricOccupancies(self.directory)
+        self.assertEqual(list(df["Bleiche"]), [1031, 31])
+        self.assertEqual(list(df["Cinestar"]), [54, -999])
+        self.assertTrue((self.directory / CACHE_FILE_NAME).exists())
+        self.assertIs(getHistoricOccupancies(self.directory), df)
+        self.assertIn('"Bleiche":1031', getHistoricOccupanciesJson(self.directory))
+
+        # a new process starts without the hot copy and reuses the cache file: a changed csv with the same
+        # size and mtime is not parsed again
+        occupancyCache._hot_cache.clear()
+        self.write_csv(2031, mtime_ns=self.csv_file.stat().st_mtime_ns)
+        cached = getHistoricOccupancies(self.directory)
+        self.assertIsNot(cached, df)
+        self.assertEqual(list(cached["Bleiche"]), [1031, 31])
+        self.assertEqual(list(cached.index), list(df.index))
+
+    def test_invalidation(self):
+        getHistoricOccupancies(self.directory)
+        mtime_ns = self.csv_file.stat().st_mtime_ns
+
+        # same size, newer mtime
+        self.write_csv(2031, mtime_ns=mtime_ns + 10 ** 9)
+        self.assertEqual(list(getHistoricOccupancies(self.directory)["Bleiche"]), [2031, 31])
+        self.assertIn('"Bleiche":2031', getHistoricOccupanciesJson(self.directory))
+
+        # other size, same mtime, also after a restart
+        occupancyCache._hot_cache.clear()
+        self.write_csv(20310, mtime_ns=mtime_ns + 10 ** 9)
+        self.assertEqual(list(getHistoricOccupancies(self.directory)["Bleiche"]), [20310, 31])
+
+    def test_concurrent_requests(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(getHistoricOccupancies(self.directory)))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # parsed once, every thread gets the same dataframe
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(result is results[0] for result in results))
+
+
+if __name__ == "__main__":
+    unittest.main()
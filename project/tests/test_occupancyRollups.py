@@ -0,0 +1,170 @@
+import unittest
+from datetime import datetime
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+
+from project import app, db
+from project.bulk import upsert_dataframe
+from project.models import HistoricOccupancy, OccupancyHourly, OccupancyProfile
+from project.occupancyRollups import aggregate_occupancies, profile_increments, profile_to_dict, \
+    refresh_occupancy_rollups
+from project.tests.databaseTestCase import DatabaseTestCase
+
+
+class OccupancyRollupTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        # monday 2020-01-06 from 23:00 to tuesday 00:45, one missing value
+        self.raw = pd.DataFrame({
+            "datetime": pd.date_range("2020-01-06 23:00", periods=8, freq="15min"),
+            "occupation": [10, 20, -999, 30, 40, 50, 60, 70],
+            "max_occupation": [100, 100, 100, 100, 100, 100, 0, 100]})
+
+    # executed after each test
+    def tearDown(self):
+        pass
+
+###############
+#### tests ####
+###############
+
+    print("### Performing Occupancy Rollup Tests ###")
+
+    def test_aggregate_hourly(self):
+        buckets = aggregate_occupancies(self.raw, "H")
+
+        self.assertEqual(list(buckets["period_start"]), [pd.Timestamp("2020-01-06 23:00"), pd.Timestamp("2020-01-07 00:00")])
+        self.assertEqual(list(buckets["num_values"]), [3, 4])
+        self.assertEqual(list(buckets["occupation_mean"]), [20.0, 55.0])
+        self.assertEqual(list(buckets["occupation_min"]), [10, 40])
+        self.assertEqual(list(buckets["occupation_max"]), [30, 70])
+        # capacity 0 is left out of the rate
+        self.assertAlmostEqual(buckets["rate_mean"].iloc[1], (0.4 + 0.5 + 0.7) / 3)
+
+    def test_aggregate_daily(self):
+        buckets = aggregate_occupancies(self.raw, "D")
+        self.assertEqual(list(buckets["num_values"]), [3, 4])
+
+    def test_profile(self):
+        increments = profile_increments(self.raw)
+
+        self.assertEqual(increments.loc[(0, 0, 92), "num_values"], 1)
+        self.assertEqual(increments.loc[(0, 1, 2), "num_rates"], 0)
+        self.assertNotIn((0, 0, 94), increments.index)
+
+        rows = [key + tuple(values) for key, values in zip(increments.index, increments.values)]
+        profile = profile_to_dict(rows)
+        self.assertEqual(list(profile), ["winter"])
+        self.assertEqual(np.shape(profile["winter"]["occupation"]), (7, 96))
+        self.assertEqual(profile["winter"]["occupation"][1][3], 70.0)
+        self.assertIsNone(profile["winter"]["rate"][1][2])
+        self.assertIsNone(profile["winter"]["occupation"][0][94])
+
+
+class OccupancyRollupRefreshTests(DatabaseTestCase):
+
+    parkingspot_names = ["testPS", "Bleiche"]
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        super().setUp()
+        app.config['ROLLUP_OVERLAP_HOURS'] = 48
+
+###############
+#### tests ####
+###############
+
+    print("### Performing Occupancy Rollup Refresh Tests ###")
+
+    def ingest(self, start, periods, occupation=10, parkingspot_id=1):
+        df = pd.DataFrame({"datetime": pd.date_range(start, periods=periods, freq="15min"),
+                           "occupation": occupation, "max_occupation": 100, "parkingspot_id": parkingspot_id})
+        upsert_dataframe(df, HistoricOccupancy.__table__, ["parkingspot_id", "datetime"], update=True)
+
+    def profile_values(self, parkingspot_id=1):
+        return db.session.query(func.sum(OccupancyProfile.num_values)).filter(
+            OccupancyProfile.parkingspot_id == parkingspot_id).scalar()
+
+    def hourly_mean(self, period_start):
+        return db.session.query(OccupancyHourly.occupation_mean).filter(
+            OccupancyHourly.period_start == pd.Timestamp(period_start).to_pydatetime()).scalar()
+
+    def test_refresh(self):
+        self.ingest("2020-01-06", 4 * 96)
+        self.assertEqual(refresh_occupancy_rollups(), 4 * 96)
+        self.assertEqual(db.session.query(OccupancyHourly).count(), 4 * 24)
+        # the last two days are still in the overlap and not yet in the profile
+        self.assertEqual(self.profile_values(), 96)
+
+        # updates within the overlap reach the buckets
+        self.ingest("2020-01-08 10:00", 1, occupation=50)
+        refresh_occupancy_rollups()
+        self.assertEqual(self.hourly_mean("2020-01-08 10:00"), 20.0)
+        self.assertEqual(self.profile_values(), 96)
+
+        # every day is added to the profile once
+        self.ingest("2020-01-10", 96)
+        refresh_occupancy_rollups()
+        refresh_occupancy_rollups()
+        self.assertEqual(self.profile_values(), 2 * 96)
+        self.assertEqual(db.session.query(OccupancyHourly).count(), 5 * 24)
+
+        refresh_occupancy_rollups(full=True)
+        self.assertEqual(self.profile_values(), 2 * 96)
+        self.assertEqual(self.hourly_mean("2020-01-08 10:00"), 20.0)
+
+    def test_backfilled_spot(self):
+        for parkingspot_id in [1, 2]:
+            self.ingest("2020-01-06", 2 * 96, parkingspot_id=parkingspot_id)
+        refresh_occupancy_rollups()
+        # the feed of the second parking spot stalls while the first one continues
+        self.ingest("2020-01-08", 4 * 96)
+        refresh_occupancy_rollups()
+
+        self.ingest("2020-01-08", 4 * 96, occupation=20, parkingspot_id=2)
+        refresh_occupancy_rollups()
+        hourly = db.session.query(OccupancyHourly).filter(OccupancyHourly.parkingspot_id == 2)
+        self.assertEqual(hourly.count(), 6 * 24)
+        self.assertEqual(hourly.filter(OccupancyHourly.occupation_mean == 20).count(), 4 * 24)
+        self.assertEqual(self.profile_values(parkingspot_id=2), 3 * 96)
+        self.assertEqual(self.profile_values(parkingspot_id=1), 3 * 96)
+
+    def test_aggregate_range(self):
+        self.ingest("2020-01-06", 4 * 96)
+        refresh_occupancy_rollups()
+
+        response = self.client.get('/occupancy/aggregate?resolution=hourly&from=2020-01-08')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()["aggregates"]["testPS"]), 2 * 24)
+        response = self.client.get('/occupancy/aggregate?resolution=daily&to=2020-01-08')
+        self.assertEqual(list(response.get_json()["aggregates"]["testPS"]), ["2020-01-06T00:00:00",
+                                                                             "2020-01-07T00:00:00"])
+        response = self.client.get('/occupancy/aggregate?resolution=hourly&from=2020-01-01&to=2020-03-01')
+        self.assertEqual(response.status_code, 400)
+
+    def test_aggregate_utc_offset(self):
+        self.ingest("2020-01-06", 4 * 96)
+        refresh_occupancy_rollups()
+
+        # mixed with a naive upper bound and with the default upper bound
+        start = quote(datetime(2020, 1, 8).astimezone().isoformat())
+        for query in ['&to=2020-01-10', '']:
+            response = self.client.get('/occupancy/aggregate?resolution=hourly&from=' + start + query)
+            self.assertEqual(response.status_code, 200, query)
+            self.assertEqual(len(response.get_json()["aggregates"]["testPS"]), 2 * 24, query)
+
+
+if __name__ == "__main__":
+    unittest.main()
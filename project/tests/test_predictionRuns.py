@@ -0,0 +1,82 @@
+import unittest
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from project import db
+from project.models import Prediction, PredictionRun
+from project.predictionRuns import collect_prediction_runs, create_prediction_run, is_current_prediction, \
+    publish_prediction_run, write_predictions
+from project.tests.databaseTestCase import DatabaseTestCase
+
+
+class PredictionRunTests(DatabaseTestCase):
+
+    parkingspot_names = ["testPS"]
+
+###############
+#### tests ####
+###############
+
+    print("### Performing Prediction Run Tests ###")
+
+    def write_run(self, occupation):
+        run_id = create_prediction_run()
+        write_predictions(run_id, pd.DataFrame({"datetime": pd.date_range("2020-05-01", periods=4, freq="15min"),
+                                                "occupation": occupation, "rmse": 1.0, "parkingspot_id": 1}))
+        return run_id
+
+    def test_publish_and_collect_between_statements(self):
+        publish_prediction_run(self.write_run(10), collect=False)
+        statement = db.session.query(Prediction.run_id, Prediction.occupation).filter(
+            is_current_prediction()).statement
+
+        # a newer run is published and the old one collected before the predictions are read
+        new_run_id = self.write_run(20)
+        publish_prediction_run(new_run_id, collect=False)
+        self.assertEqual(collect_prediction_runs(), 4)
+
+        rows = db.session.connection().execute(statement).fetchall()
+        self.assertEqual(rows, [(new_run_id, 20)] * 4)
+
+    def test_collect_keeps_runs_being_written(self):
+        old_run_id = self.write_run(10)
+        publish_prediction_run(old_run_id, collect=False)
+        # started before the current run, e.g. by a job restarted after JOB_TIMEOUT
+        writing_run_id = self.write_run(20)
+        abandoned_run_id = self.write_run(30)
+        db.session.query(PredictionRun).filter(PredictionRun.id == abandoned_run_id).update(
+            {PredictionRun.created: datetime.now() - timedelta(days=2)}, synchronize_session=False)
+        current_run_id = self.write_run(40)
+        publish_prediction_run(current_run_id, collect=False)
+
+        self.assertEqual(collect_prediction_runs(), 8)
+        self.assertEqual(sorted(run_id for (run_id,) in db.session.query(Prediction.run_id).distinct()),
+                         [writing_run_id, current_run_id])
+        self.assertEqual(db.session.query(PredictionRun).count(), 2)
+
+    def test_predictions_without_run(self):
+        # e.g. seeded predictions are served until the first run is published
+        db.session.add(Prediction(datetime=datetime(2020, 5, 1, 7, 15), occupation=98, rmse=10, parkingspot_id=1))
+        db.session.commit()
+        predictions = self.client.get('/parkingspots').get_json()["testPS"]["predictions"]
+        self.assertEqual(predictions, {"2020-05-01T07:15:00": {"occupation": 98, "rmse": 10.0}})
+
+        publish_prediction_run(self.write_run(20), collect=False)
+        predictions = self.client.get('/parkingspots').get_json()["testPS"]["predictions"]
+        self.assertEqual(len(predictions), 4)
+        self.assertNotIn("2020-05-01T07:15:00", predictions)
+
+    def test_show_parkingspots(self):
+        self.write_run(10)
+        response = self.client.get('/parkingspots')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["testPS"]["predictions"], dict())
+
+        publish_prediction_run(self.write_run(20), collect=False)
+        predictions = self.client.get('/parkingspots').get_json()["testPS"]["predictions"]
+        self.assertEqual(predictions["2020-05-01T00:45:00"], {"occupation": 20, "rmse": 1.0})
+
+
+if __name__ == "__main__":
+    unittest.main()
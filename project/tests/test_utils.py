@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+from project.utils import historicOccupanciesToDataframe, weatherObservationsToDataframe
+
+
+class UtilsTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.occupancies_dir = Path(self.tmp_dir.name)
+        with open(self.occupancies_dir / "2019 Auslastung 15min.csv", "w") as file:
+            file.write('"","Bleiche","Cinestar","Gesamtergebnis"\n'
+                       '"KW 1","40","1.166","1.206"\n'
+                       '"01.01.2019","30","105","135"\n'
+                       '"00:00","31","1.076","1.107"\n'
+                       '"00:15","","76","76"\n'
+                       '"02.01.2019","59","173","232"\n'
+                       '"00:00","24","58","82"\n'
+                       '"Gesamtergebnis","133","60","193"\n')
+        with open(self.occupancies_dir / "2018 Auslastung 15min.csv", "w") as file:
+            file.write('"","Bleiche","Gesamtergebnis"\n'
+                       '"31.12.2018","30","30"\n'
+                       '"23:45","12","12"\n')
+
+    # executed after each test
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+###############
+#### tests ####
+###############
+
+    print("### Performing Utils Tests ###")
+
+    def test_historicOccupanciesToDataframe(self):
+        df = historicOccupanciesToDataframe(self.occupancies_dir)
+
+        self.assertEqual(list(df.columns), ["Bleiche", "Cinestar"])
+        self.assertEqual(list(df.index), [pd.Timestamp("2018-12-31 23:45"), pd.Timestamp("2019-01-01 00:00"),
+                                          pd.Timestamp("2019-01-01 00:15"), pd.Timestamp("2019-01-02 00:00")])
+        self.assertEqual(list(df["Bleiche"]), [12, 31, -999, 24])
+        # missing parkingspot in older files is filled with -999
+        self.assertEqual(list(df["Cinestar"]), [-999, 1076, 76, 58])
+
+    def test_weatherObservationsToDataframe(self):
+        # 02:00 missing in the temperature data, precipitation starts an hour later
+        df_temp = pd.DataFrame({"STATIONS_ID": 3137, "QN_9": 3, "TT_TU": [1.5, 2.5, 3.5], "RF_TU": [80.0, 85.0, 90.0]},
+                               index=pd.to_datetime(["2020-01-01 00:00", "2020-01-01 01:00", "2020-01-01 03:00"]))
+        df_precip = pd.DataFrame({"STATIONS_ID": 3137, "QN_8": 3, "  R1": [0.1, 0.2, 0.3]},
+                                 index=pd.to_datetime(["2020-01-01 01:00", "2020-01-01 02:00", "2020-01-01 03:00"]))
+        df = weatherObservationsToDataframe(df_temp, df_precip)
+
+        self.assertEqual(list(df["datetime"]), list(pd.date_range("2020-01-01 00:00", "2020-01-01 03:00", freq='H')))
+        self.assertEqual(list(df["temperature"]), [1.5, 2.5, -999, 3.5])
+        self.assertEqual(list(df["humidity"]), [80.0, 85.0, -999, 90.0])
+        self.assertEqual(list(df["precipation_last_hour"]), [-999, 0.1, 0.2, 0.3])
+        self.assertTrue(weatherObservationsToDataframe(df_temp.iloc[:0], df_precip).empty)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -46,7 +46,8 @@ class ViewTests(unittest.TestCase):
 
     def test_predict_endpoint(self):
         response = self.app.get('/predict', follow_redirects=True)
-        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.status_code, 202)
+        self.assertIn("job", response.get_json())
     
     def test_historicOccupancy_endpoint(self):
         response = self.app.get('/historicOccupancy', follow_redirects=True)
@@ -58,8 +59,17 @@ class ViewTests(unittest.TestCase):
 
     def test_updateWeather_endpoint(self):
         response = self.app.get('/weather/updateDb', follow_redirects=True)
-        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.status_code, 202)
+        self.assertIn("job", response.get_json())
     
     def test_getWeatherForecasts_endpoint(self):
         response = self.app.get('/weather/getForecasts', follow_redirects=True)
+        self.assertEqual(response.status_code, 202)
+        self.assertIn("job", response.get_json())
+
+    def test_job_endpoint(self):
+        response = self.app.get('/predict', follow_redirects=True)
+        job_id = response.get_json()["job"]
+        response = self.app.get('/jobs/{}'.format(job_id), follow_redirects=True)
         self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["id"], job_id)
@@ -0,0 +1,55 @@
+import unittest
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from project.weatherStations import StationCatalogue, nearestStations
+
+Spot = namedtuple("Spot", ["id", "lat", "lon"])
+
+
+class WeatherStationTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.catalogue = StationCatalogue(pd.DataFrame({
+            "station_id": ["K584", "10637", "10513", "10147"],
+            "station_name": ["MAINZ-LERCHENBERG", "FRANKFURT/M-FLUGHAFEN", "KOELN/BONN", "HAMBURG-FUHLSBUETTEL"],
+            "lat": [49.99, 50.05, 50.87, 53.63],
+            "lon": [8.22, 8.6, 7.16, 9.99]}))
+
+    # executed after each test
+    def tearDown(self):
+        pass
+
+###############
+#### tests ####
+###############
+
+    print("### Performing Weather Station Tests ###")
+
+    def test_nearest(self):
+        station_ids, distances = self.catalogue.nearest(50.11, 8.68, k=2)
+
+        self.assertEqual(list(station_ids), ["10637", "K584"])
+        # haversine distance from Frankfurt city to the airport
+        lat1, lon1, lat2, lon2 = np.radians([50.11, 8.68, 50.05, 8.6])
+        expected = 2 * 6371.0 * np.arcsin(np.sqrt(
+            np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2))
+        self.assertAlmostEqual(distances[0], expected, places=6)
+        self.assertTrue(np.all(np.diff(distances) > 0))
+
+    def test_nearestStations(self):
+        spots = [Spot(1, 50.0, 8.27), Spot(2, 53.55, 10.0), Spot(3, 50.94, 6.96)]
+
+        self.assertEqual(nearestStations(self.catalogue, spots), {1: "K584", 2: "10147", 3: "10513"})
+        self.assertEqual(nearestStations(self.catalogue, []), dict())
+
+
+if __name__ == "__main__":
+    unittest.main()
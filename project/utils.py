@@ -1,25 +1,41 @@
-import io
-import requests
+import threading
 import zipfile
 import pandas as pd
+from collections import OrderedDict
 from pathlib import Path
-import csv
-from datetime import datetime
+
+from project import download_cache
+
+# parsed dwd archives by (content sha256, seperator), least recently used first
+PARSED_FRAMES_MAX = 8
+_parsed_frames = OrderedDict()
+_parsed_lock = threading.Lock()
 
 
 def zipfileToDataframe(url, seperator):
-    """ extracts a file from a .zip archive and transforms it to dataframe
+    """ extracts a file from a .zip archive and transforms it to dataframe \n
+        the archive is served from the download cache and parsed once per content
     Returns: pandas dataframe object
     """
-    r = requests.get(url)
-    with zipfile.ZipFile(io.BytesIO(r.content)) as zip:
+    content_file, sha256 = download_cache.fetch(url)
+    key = (sha256, seperator)
+    with _parsed_lock:
+        df = _parsed_frames.get(key)
+        if df is not None:
+            _parsed_frames.move_to_end(key)
+            return df.copy()
+    with zipfile.ZipFile(content_file) as zip:
         files = zip.namelist()
         matchingFile = [file for file in files if "produkt" in file]
         with zip.open(matchingFile[0]) as file:
             df = pd.read_csv(file, sep=seperator,
                              index_col="MESS_DATUM", parse_dates=False)
             df.index = pd.to_datetime(df.index, format="%Y%m%d%H")
-            return df
+    with _parsed_lock:
+        _parsed_frames[key] = df
+        while len(_parsed_frames) > PARSED_FRAMES_MAX:
+            _parsed_frames.popitem(last=False)
+    return df.copy()
 
 
 def concatenateHistoricRecentData(df_hist, df_recent):
@@ -40,58 +56,77 @@ def concatenateHistoricRecentData(df_hist, df_recent):
     df_concat = df_concat.fillna(value=-999)
     return df_concat
 
+
+def weatherObservationsToDataframe(df_temp, df_precip):
+    """ aligns hourly dwd temperature and precipitation data on their timestamps \n
+        missing hours in the range of the temperature data get the value -999
+    Returns: dataframe with the columns of the historic weather table
+    """
+    if df_temp.empty:
+        return pd.DataFrame(columns=["datetime", "temperature", "humidity", "precipation_last_hour"])
+    idx = pd.date_range(start=df_temp.index[0], end=df_temp.index[-1], freq='H')
+    # columns by position: STATIONS_ID, QN_9, TT_TU, RF_TU and STATIONS_ID, QN_8, R1
+    df_weather = pd.DataFrame({
+        "datetime": idx,
+        "temperature": df_temp.iloc[:, 2].reindex(idx).values,
+        "humidity": df_temp.iloc[:, 3].reindex(idx).values,
+        "precipation_last_hour": df_precip.iloc[:, 2].reindex(idx).values})
+    return df_weather.fillna(value=-999)
+
+
 def historicOccupanciesToDataframe(path):
     """ read historic occupancies and save them as a pandas dataframe
     Returns: dataframe with historic occupancies from parkingspots
     """
     occupancies_dir = Path(path)
-    files = occupancies_dir.glob("*.csv")
-    occupancy_dict = dict()
-    for file in files:
-        with open(file, "r") as csv_file:
-            csv_reader = csv.reader(csv_file, delimiter=',')
-            line_count = 0
-            date = ""
-            timestamp = ""
-            for row in csv_reader:
-                # handle header
-                if line_count == 0:
-                    # get parkingspot names
-                    names = list(filter(lambda x: (x != "Gesamtergebnis" and x != "") , row))
-                    line_count += 1
-                # handle remaining rows
-                else:
-                    # ignore this rows
-                    if ("KW" in row[0]):
-                        pass
-                    else:
-                        # get date in format DD.MM.YYYY
-                        try:
-                            datetime.strptime(row[0],"%d.%m.%Y")
-                            date = row[0]
-                            continue
-                        except:
-                            pass
-                        try:
-                            # get single timestamp in format YYYY-MM-DD HH:MM:SS
-                            timestamp = datetime.strptime((date + row[0]),"%d.%m.%Y%H:%M")
-                            parking_dict = dict()
-                            for name in names:
-                                index = names.index(name)
-                                occupancy = row[index + 1]
-                                if ("." in occupancy):
-                                    occupancy = occupancy.replace(".","")
-                                if (occupancy == ""):
-                                    occupancy = -999
-                                try:
-                                    occupancy = int(occupancy)
-                                except:
-                                    pass
-                                parking_dict.update({name:occupancy})
-                            occupancy_dict.update({timestamp: parking_dict})
-                        except:
-                            pass
-
-    df = pd.DataFrame.from_dict(occupancy_dict, orient='index')
+    files = sorted(occupancies_dir.glob("*.csv"))
+    frames = [occupancyCsvToDataframe(file) for file in files]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, sort=False)
+    # keep the last reading of duplicate timestamps (e.g. daylight saving time)
+    df = df.loc[~df.index.duplicated(keep='last')].sort_index()
     df = df.fillna(-999)
     return df
+
+
+def occupancyCsvToDataframe(file):
+    """ parses a single yearly occupancy export in one pass \n
+        the first column holds calendar week rows (KW), date rows (DD.MM.YYYY)
+        and time rows (HH:MM) belonging to the last date row
+    Returns: dataframe with the occupancies of one file indexed by timestamp
+    """
+    raw = pd.read_csv(file, sep=',', header=None, dtype=str,
+                      keep_default_na=False, encoding='utf-8')
+    # get parkingspot names
+    header = raw.iloc[0]
+    names = [name for name in header.iloc[1:] if name != "Gesamtergebnis" and name != ""]
+    raw = raw.iloc[1:]
+
+    first = raw.iloc[:, 0]
+    # ignore calendar week rows
+    raw = raw.loc[~first.str.contains("KW", regex=False)]
+    first = raw.iloc[:, 0]
+    is_date = pd.to_datetime(first, format="%d.%m.%Y", errors='coerce').notna()
+    dates = first.where(is_date).ffill()
+    timestamps = pd.to_datetime(dates + first, format="%d.%m.%Y%H:%M", errors='coerce')
+    is_time = ~is_date & timestamps.notna()
+
+    values = raw.loc[is_time].iloc[:, 1:len(names) + 1]
+    values.columns = names
+    values.index = pd.DatetimeIndex(timestamps[is_time].values)
+    for name in names:
+        values[name] = _occupancyColumnToNumeric(values[name])
+    return values
+
+
+def _occupancyColumnToNumeric(column):
+    """ strips thousands separators and marks empty cells with -999
+    Returns: integer column, cells which are no integers are kept as strings
+    """
+    column = column.str.replace(".", "", regex=False)
+    column = column.mask(column == "", "-999")
+    numeric = pd.to_numeric(column, errors='coerce')
+    if numeric.notna().all():
+        return numeric.astype('int64')
+    return column.where(numeric.isna(), numeric.astype(object))
@@ -1,20 +1,32 @@
-from flask import Flask, jsonify
-from project import app
-from .models import Parkingspot, HistoricOccupancy, HistoricWeather, ForecastWeather, Prediction, VacationRLP, VacationHE, HolidayRLP, HolidayHE, db
+from flask import Flask, Response, jsonify, request, stream_with_context, url_for
+from project import app, model_registry, calendar_features, request_metrics
+from .models import Parkingspot, HistoricOccupancy, HistoricWeather, ForecastWeather, Prediction, VacationRLP, VacationHE, HolidayRLP, HolidayHE, Job, OccupancyProfile, db
 import pandas as pd
 import numpy as np
 from datetime import datetime
 import datetime as datetime2
 from dateutil.relativedelta import relativedelta
+from sqlalchemy import and_, func, or_
 from pathlib import Path
 import glob
 import io
+from concurrent.futures import ThreadPoolExecutor
+import json
 import joblib
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 from category_encoders.target_encoder import TargetEncoder
 from sklearn.preprocessing import MinMaxScaler
-from project.utils import zipfileToDataframe, concatenateHistoricRecentData, historicOccupanciesToDataframe
+from project.utils import zipfileToDataframe, concatenateHistoricRecentData, historicOccupanciesToDataframe, weatherObservationsToDataframe
 from project.dwdForecast import getForecastsAsDataframe
+from project.occupancyCache import getHistoricOccupanciesJson
+from project.jobs import enqueue_job, job_to_dict
+from project.bulk import insert_dataframe, upsert_dataframe
+from project.weatherStations import getStationCatalogue, nearestStations
+from project.occupancyRollups import ROLLUPS, SEASONS, profile_to_dict, refresh_occupancy_rollups
+from project.calendarFeatures import calcCalendarWeek, shoppingdaystonextfeiertag, shoppingdaysafterfeiertag, \
+    isschulferien, isweihnachten
+from project.metrics import CONTENT_TYPE
+from project.predictionRuns import create_prediction_run, write_predictions, publish_prediction_run, is_current_prediction
 
 
 @app.route("/")
@@ -33,56 +45,48 @@ def show_parkingspots():
     """
     parking_dict = dict()
 
-    # Query Objects from DB
-    parkingspots = Parkingspot.query.all()
+    # Core queries return plain tuples instead of ORM objects:
+    # one for the parkingspots, one for the latest published predictions
+    parkingspots = db.session.connection().execute(db.session.query(
+        Parkingspot.id, Parkingspot.name, Parkingspot.lat, Parkingspot.lon, Parkingspot.open,
+        Parkingspot.max_occupancy, Parkingspot.parkingspot_type, Parkingspot.height_limit,
+        Parkingspot.handicapped_spots, Parkingspot.women_spots, Parkingspot.parent_child_spots,
+        Parkingspot.address, Parkingspot.url).order_by(Parkingspot.id).statement)
+    predictions = db.session.connection().execute(db.session.query(
+        Prediction.parkingspot_id, Prediction.datetime, Prediction.occupation, Prediction.rmse).filter(
+            is_current_prediction()).order_by(
+                Prediction.parkingspot_id, Prediction.datetime).statement).fetchall()
 
     # format to expected Output
-    for parkingspot in parkingspots:
-        name = parkingspot.name
-        max_occupancy = parkingspot.max_occupancy
-        lat = parkingspot.lat
-        lon = parkingspot.lon
-        open = parkingspot.open
-        parkingspot_type = parkingspot.parkingspot_type
-        height_limit = parkingspot.height_limit
-        handicapped_spots = parkingspot.handicapped_spots
-        women_spots = parkingspot.women_spots
-        parent_child_spots = parkingspot.parent_child_spots
-        address = parkingspot.address
-        url = parkingspot.url
-        predictions = parkingspot.predictions
+    prediction_dicts = dict()
+    for (parkingspot_id, name, lat, lon, open, max_occupancy, parkingspot_type, height_limit,
+         handicapped_spots, women_spots, parent_child_spots, address, url) in parkingspots:
         prediction_dict = dict()
+        prediction_dicts[parkingspot_id] = prediction_dict
+        parking_dict[name] = {
+            "lat": lat,
+            "lon": lon,
+            "openingHours": open,
+            "spots": max_occupancy,
+            "type": parkingspot_type,
+            "heightLimit": height_limit,
+            "handicappedSpots": handicapped_spots,
+            "womenSpots": women_spots,
+            "parentChildSpots": parent_child_spots,
+            "address": address,
+            "url": url,
+            "predictions": prediction_dict
+        }
 
-        for prediction in predictions:
-            timestamp = prediction.datetime.strftime("%Y-%m-%dT%H:%M:%S")
-            occupation = prediction.occupation
-            rmse = prediction.rmse
-            predictionData = {
-                timestamp: {
-                    "occupation": occupation,
-                    "rmse": rmse
-                }
-            }
-            prediction_dict.update(predictionData)
-
-        parkingspotData = {
-            name:
-                {
-                    "lat": lat,
-                    "lon": lon,
-                    "openingHours": open,
-                    "spots": max_occupancy,
-                    "type": parkingspot_type,
-                    "heightLimit": height_limit,
-                    "handicappedSpots": handicapped_spots,
-                    "womenSpots": women_spots,
-                    "parentChildSpots": parent_child_spots,
-                    "address": address,
-                    "url": url,
-                    "predictions": prediction_dict
-                }
+    current_id = None
+    for parkingspot_id, timestamp, occupation, rmse in predictions:
+        if parkingspot_id != current_id:
+            current_id = parkingspot_id
+            prediction_dict = prediction_dicts.get(parkingspot_id, dict())
+        prediction_dict[timestamp.isoformat(timespec='seconds')] = {
+            "occupation": occupation,
+            "rmse": rmse
         }
-        parking_dict.update(parkingspotData)
     return jsonify(parking_dict)
 
 
@@ -91,18 +95,17 @@ def predict():
     """ Prediction endpoint.
 
         Returns:
-            saves predictions in the database
+            id of the background job which saves predictions in the database
     """
-    num_rows_added = 0
-   # remove all records
-    try:
-        num_rows_deleted = db.session.query(Prediction).delete()
-        db.session.commit()
-    except:
-        db.session.rollback()
+    return enqueue_job_response("predict", run_predictions)
+
+
+def run_predictions():
+    """ predicts the occupancy of all parkingspots, runs as background job.
 
-    models_dir = Path("data/models/Joblib_ohneWetterUndHistData")
-    rmse_dir = Path("data/models/Joblib_mitWetterUndHistData")
+        Returns:
+            number of predictions saved in the database
+    """
     # Query Objects from DB
     parkingspots = Parkingspot.query.all()
     vacationRlp = pd.read_sql(db.session.query(
@@ -120,101 +123,107 @@ def predict():
     forecast_Weather = pd.read_sql(db.session.query(
         ForecastWeather).statement, db.session.bind)
 
-    for parkingspot in parkingspots:
-        name = parkingspot.name
-        try:
-        
-            targetencoder = joblib.load(Path.joinpath(
-                models_dir, ("targetenc" + name + ".sav")))
-            scalerload = joblib.load(Path.joinpath(
-                models_dir, ("scaler" + name + ".sav")))
-            modelload = joblib.load(Path.joinpath(
-                models_dir, (name + ".sav")))
-            rmseload = joblib.load(Path.joinpath(
-                rmse_dir, ("rmseAll" + name + ".sav")))
-            leaderload = joblib.load(Path.joinpath(
-                rmse_dir, ("leaderAll" + name + ".sav")))
-
-            feature_df = create_feature_df(
-                vacationRlp, vacationHe, holidayRlp, holidayHe)
-
-            # target encode
-            feature_df = pd.DataFrame(index=feature_df.index, data=targetencoder.transform(
-                feature_df), columns=feature_df.columns)
-            # min max scale
-            feature_df = pd.DataFrame(index=feature_df.index, data=scalerload.transform(
-                feature_df), columns=feature_df.columns)
-
-            # predict with loaded model
-            predictedBelegung = modelload.predict(feature_df)
-            predictedBelegung = pd.DataFrame(
-                index=feature_df.index, data=(predictedBelegung).astype('int'))
-            # add predictions to database
-            for index, row in predictedBelegung.iterrows():
-                # monday = 0, sunday =6
-                dayOfWeek = index.dayofweek
-                hourOfDay = index.hour
-                date = index.strftime("%Y-%m-%d %H:%M:%S")
-                # rmse only for full hours
-                try:
-                    rmse = rmseload[dayOfWeek][hourOfDay]
-                    rmse = np.square(rmse)
-                    rmse = np.mean(rmse)
-                    rmse = np.sqrt(rmse)
-                except:
-                    rmse = -999
-                occupation = row[0]
-                prediction = Prediction(datetime=date,
-                                        occupation=occupation, rmse=rmse, parkingspot_id=parkingspot.id)
-                db.session.add(prediction)
-                num_rows_added += 1
-            db.session.commit()
+    # calendar features are the same for every parking spot
+    feature_df = create_feature_df(
+        vacationRlp, vacationHe, holidayRlp, holidayHe)
 
+    # encode, scale and predict all parking spots in parallel
+    with ThreadPoolExecutor(max_workers=app.config["PREDICT_WORKERS"]) as executor:
+        futures = [(parkingspot, executor.submit(predict_parkingspot, parkingspot.name, feature_df))
+                   for parkingspot in parkingspots]
+
+    frames = []
+    for parkingspot, future in futures:
+        try:
+            predictedBelegung, rmsegrid = future.result()
+            # rmse only for full hours, monday = 0, sunday =6
+            rmse = rmsegrid[predictedBelegung.index.dayofweek, predictedBelegung.index.hour]
+            frames.append(pd.DataFrame({
+                "datetime": predictedBelegung.index,
+                "occupation": predictedBelegung[0].values,
+                "rmse": rmse,
+                "parkingspot_id": parkingspot.id}))
         except Exception as e:
             print(e)
 
-    return jsonify({"messege": "added {} records to database".format(num_rows_added)})
+    # write all predictions into a new version and switch readers to it at once
+    num_rows_added = 0
+    if frames:
+        run_id = create_prediction_run()
+        num_rows_added = write_predictions(run_id, pd.concat(frames, ignore_index=True))
+        publish_prediction_run(run_id)
+
+    return num_rows_added
+
 
 @app.route('/historicOccupancy')
 def get_historic_occupancies():
     """ Endpoint for historic occupancies.
 
+        Query parameters (optional):
+            spot: name of a parkingspot, can be repeated
+            from: first timestamp (inclusive) in ISO format
+            to: last timestamp (exclusive) in ISO format
+            limit: maximum number of records per page
+            cursor: value of 'next' from the previous page
+
         Returns:
-            historic occupancies as json
+            historic occupancies as json, filtered and paginated queries are
+            streamed from the database
     """
+    if has_historic_filters():
+        return stream_historic_occupancies(HistoricOccupancy.occupation)
     occupancies_dir = Path("data/parkingspot_occupancy")
-    df = historicOccupanciesToDataframe(occupancies_dir)
-    return df.to_json(orient='index')
+    return getHistoricOccupanciesJson(occupancies_dir)
 
 
 @app.route('/historicMaxOccupancy')
 def get_historic_max_occupancies():
     """ Endpoint for historic maximum occupancies.
 
+        Query parameters (optional):
+            same as /historicOccupancy
+
         Returns:
-            historic maximum occupancies as json
+            historic maximum occupancies as json, filtered and paginated queries
+            are streamed from the database
     """
+    if has_historic_filters():
+        return stream_historic_occupancies(HistoricOccupancy.max_occupation)
     maxoccupancies_dir = Path("data/parkingspot_maxoccupancy")
-    df = historicOccupanciesToDataframe(maxoccupancies_dir)
-    return df.to_json(orient='index')
+    return getHistoricOccupanciesJson(maxoccupancies_dir)
 
 
 @app.route('/weather/updateDb')
 def update_weather_database():
     """ Endpoint for updating weather data in the historic weather table.
+        With ?overwrite=1 already stored hours are replaced by the current dwd values.
+        Both variants share the job name, a trigger while an update is pending joins that job.
 
         Returns:
-            saves historic weather data in the database
+            id of the background job which saves historic weather data in the database
+    """
+    if request.args.get("overwrite") == "1":
+        return enqueue_job_response("weather_update", lambda: run_weather_update(overwrite=True))
+    return enqueue_job_response("weather_update", run_weather_update)
+
+
+def run_weather_update(overwrite=False):
+    """ adds new historic weather data, runs as background job.
+
+        Returns:
+            number of records saved in the database and a message with the
+            number of inserted and skipped (or overwritten) hours
     """
     # current date
     today = datetime.now()
 
     # Data from dwd opendata
     station_id = "03137"  # Mainz-Lerchenberg
-    zip_file_url_temperature_recent = "http://opendata.dwd.de/climate_environment/CDC/observations_germany/climate/hourly/air_temperature/recent/stundenwerte_TU_" 
-    + station_id + "_akt.zip"
-    zip_file_url_precipitation_recent = "http://opendata.dwd.de/climate_environment/CDC/observations_germany/climate/hourly/precipitation/recent/stundenwerte_RR_" 
-    + station_id + "_akt.zip"
+    zip_file_url_temperature_recent = ("http://opendata.dwd.de/climate_environment/CDC/observations_germany/climate/hourly/air_temperature/recent/stundenwerte_TU_"
+                                       + station_id + "_akt.zip")
+    zip_file_url_precipitation_recent = ("http://opendata.dwd.de/climate_environment/CDC/observations_germany/climate/hourly/precipitation/recent/stundenwerte_RR_"
+                                         + station_id + "_akt.zip")
 
     df_temp = zipfileToDataframe(
         url=zip_file_url_temperature_recent, seperator=";")
@@ -222,46 +231,17 @@ def update_weather_database():
         url=zip_file_url_precipitation_recent, seperator=";")
 
     # get last timestamp in database
-    resultset = db.session.query(HistoricWeather).order_by(
-        HistoricWeather.datetime.desc()).first()
-    try:
-        last_timestamp = (resultset.datetime).strftime("%Y-%m-%dT%H:%M:%S")
-    except:
-        last_timestamp = (datetime.today() - relativedelta(years=1)
-                          ).strftime("%Y-%m-%dT%H:%M:%S")
-
-    # resize dataframes with new weather data
-    df_temp = df_temp.loc[last_timestamp:today]
-    df_precip = df_precip.loc[last_timestamp:today]
-
-    # fill missing timestamps in range of the data and assign value '-999.0'
-    begin = df_temp.iloc[0].name
-    end = df_temp.iloc[-1].name
-    idx = pd.date_range(start=begin, end=end, freq='H')
-    idx_df = pd.DataFrame(index=idx)
-    df_temp = idx_df.join(df_temp)
-    df_temp = df_temp.fillna(value=-999)
-    df_precip = idx_df.join(df_precip)
-    df_precip = df_precip.fillna(value=-999)
-
-    num_rows_added = 0
+    last_timestamp = db.session.query(func.max(HistoricWeather.datetime)).scalar()
+    if last_timestamp is None:
+        last_timestamp = datetime.today() - relativedelta(years=1)
 
-    # add new records to database
-    for record, ((index_temp, row_temp), (index_precip, row_precip)) in enumerate(zip(df_temp.iterrows(), df_precip.iterrows())):
-        timestamp = index_temp
-        temperature = row_temp[2]
-        humidity = row_temp[3]
-        precipation_last_hour = row_precip[2]
-        historic_weather = HistoricWeather(
-            datetime=timestamp, temperature=temperature, humidity=humidity, precipation_last_hour=precipation_last_hour)
-        try:
-            db.session.add(historic_weather)
-            db.session.commit()
-            num_rows_added += 1
-        except:
-            db.session.rollback()
+    df_weather = weatherObservationsToDataframe(
+        df_temp.loc[last_timestamp:today], df_precip.loc[last_timestamp:today])
+    num_rows_added, num_rows_skipped = upsert_dataframe(
+        df_weather, HistoricWeather.__table__, "datetime", update=overwrite)
 
-    return jsonify({"message": "successfully updated {} records".format(num_rows_added)})
+    return num_rows_added, "inserted {} records, {} {} existing records".format(
+        num_rows_added, "overwrote" if overwrite else "skipped", num_rows_skipped)
 
 
 @app.route('/weather/getForecasts')
@@ -269,290 +249,507 @@ def update_weather_forecast_database():
     """ Endpoint for updating weather data in the forecast weather table.
 
         Returns:
-            saves weather forecasts in the database
+            id of the background job which saves weather forecasts in the database
     """
-    # remove all recorda from prediction table
+    return enqueue_job_response("weather_forecast", run_weather_forecast_update)
+
+
+def run_weather_forecast_update():
+    """ replaces the weather forecasts of the stations nearest to the parking spots, runs as background job.
+
+        Returns:
+            number of records saved in the database
+    """
+    # every station is downloaded once, no matter how many parking spots use it
+    station_ids = sorted(set(forecast_stations().values())) or [app.config["FORECAST_DEFAULT_STATION"]]
+    with ThreadPoolExecutor(max_workers=app.config["FORECAST_WORKERS"]) as executor:
+        futures = [(station_id, executor.submit(getForecastsAsDataframe, station_id, app.config["FORECAST_SPOOL_MAX_SIZE"]))
+                   for station_id in station_ids]
+        frames = []
+        for station_id, future in futures:
+            forecasts = future.result()
+            frames.append(pd.DataFrame({
+                "station_id": station_id,
+                "datetime": forecasts.index.tz_localize(None),
+                "temperature": forecasts['TTT'].values,
+                "precipation_last_hour": forecasts['RR1c'].values}))
+    df_forecasts = pd.concat(frames, ignore_index=True)
+    df_forecasts = df_forecasts.drop_duplicates(["station_id", "datetime"]).fillna(value=-999)
+
+    # remove all records from forecast table
     try:
         num_rows_deleted = db.session.query(ForecastWeather).delete()
         db.session.commit()
     except:
         db.session.rollback()
-        return jsonify({"message": "error when clearing records in table forecast_weather"})
+        raise RuntimeError("error when clearing records in table forecast_weather")
 
-    forecasts = getForecastsAsDataframe()
-    num_rows_added = 0
-    for index, row in forecasts.iterrows():
-        forecast = ForecastWeather(
-            datetime=index, temperature=row['TTT'], precipation_last_hour=row['RR1c'])
-        db.session.add(forecast)
-        try:
-            db.session.commit()
-            num_rows_added += 1
-        except:
-            db.session.rollback()
-    return jsonify({"message": "successfully updated {} records".format(num_rows_added)})
+    num_rows_added, seconds = insert_dataframe(df_forecasts, ForecastWeather.__table__)
+    return num_rows_added
 
 
-    ############################
-    #### utility functions #####
-    ############################
+def forecast_stations():
+    """ maps every parking spot to its nearest MOSMIX station
 
-def create_feature_df(ferienRlp, ferienHe, feiertageRlp, feiertageHe):
-    now = datetime.today()
-    now = datetime.strptime(
-        str(now.year) + str(now.month)+str(now.day), '%Y%m%d')
-    days = pd.date_range(now, now+relativedelta(days=7), freq='15min')
+        Returns:
+            dict with the station id of every parking spot id
+    """
+    parkingspots = Parkingspot.query.all()
+    catalogue = getStationCatalogue(app.config["WEATHER_STATIONS_FILE"])
+    return nearestStations(catalogue, parkingspots)
 
-    interpolated_complete_data = pd.DataFrame(index=days)
 
-    # ### weekdays (Mo=0; So=6)
-    interpolated_complete_data['Wochentag'] = interpolated_complete_data.index.dayofweek
+@app.route('/occupancy/aggregate')
+def get_occupancy_aggregates():
+    """ Endpoint for pre-aggregated historic occupancies.
 
-    # ### daytime in minutes
-    interpolated_complete_data['Uhrzeit'] = interpolated_complete_data.index.hour * \
-        60.0 + interpolated_complete_data.index.minute
+        Query parameters (optional):
+            resolution: 'hourly', 'daily' (default) or 'profile'
+            spot: name of a parkingspot, can be repeated
+            from: first period (inclusive) in ISO format, hourly and daily only
+            to: last period (exclusive) in ISO format, hourly and daily only, the range is limited to
+                AGGREGATE_HOURLY_DAYS or AGGREGATE_DAILY_DAYS, which is also used if from or to is missing
+            season: 'winter', 'spring', 'summer' or 'autumn', profile only
 
-    kwseries = pd.Series(interpolated_complete_data.index, name='KW',
-                         index=interpolated_complete_data.index).apply(calcCalendarWeek)
-    interpolated_complete_data['KW'] = kwseries
+        Returns:
+            mean, min, max and mean occupancy rate per parkingspot and period, or
+            the mean occupation and rate of every weekday (monday first) and
+            quarter hour per parkingspot and season (7x96 arrays)
+    """
+    resolution = request.args.get('resolution', 'daily')
+    spots = request.args.getlist('spot')
+    season = request.args.get('season')
+    try:
+        if resolution not in ROLLUPS and resolution != 'profile':
+            raise ValueError("resolution has to be 'hourly', 'daily' or 'profile'")
+        if season is not None and season not in SEASONS:
+            raise ValueError("season has to be one of " + ", ".join(SEASONS))
+        start = parse_datetime_arg('from')
+        end = parse_datetime_arg('to')
+        if resolution != 'profile':
+            max_range = datetime2.timedelta(days=app.config[
+                "AGGREGATE_HOURLY_DAYS" if resolution == 'hourly' else "AGGREGATE_DAILY_DAYS"])
+            if end is None:
+                end = start + max_range if start is not None else datetime.now()
+            if start is None:
+                start = end - max_range
+            if end - start > max_range:
+                raise ValueError("from and to must not be more than {} days apart".format(max_range.days))
+    except ValueError as e:
+        return jsonify({"message": "invalid query parameter: {}".format(e)}), 400
+
+    if resolution == 'profile':
+        table = OccupancyProfile.__table__
+        columns = [table.c.season, table.c.weekday, table.c.slot, table.c.num_values,
+                   table.c.occupation_sum, table.c.num_rates, table.c.rate_sum]
+    else:
+        table = ROLLUPS[resolution][0].__table__
+        columns = [table.c.period_start, table.c.occupation_mean, table.c.occupation_min,
+                   table.c.occupation_max, table.c.rate_mean, table.c.num_values]
+    query = db.session.query(Parkingspot.name, *columns).select_from(table).join(
+        Parkingspot, table.c.parkingspot_id == Parkingspot.id)
+    if spots:
+        query = query.filter(Parkingspot.name.in_(spots))
+    if resolution == 'profile':
+        if season is not None:
+            query = query.filter(table.c.season == SEASONS.index(season))
+        query = query.order_by(Parkingspot.name, table.c.season)
+    else:
+        query = query.filter(table.c.period_start >= start, table.c.period_start < end)
+        query = query.order_by(Parkingspot.name, table.c.period_start)
+    rows = db.session.connection().execute(query.statement).fetchall()
+
+    aggregates = dict()
+    if resolution == 'profile':
+        rows_by_spot = dict()
+        for row in rows:
+            rows_by_spot.setdefault(row[0], []).append(tuple(row[1:]))
+        aggregates = {name: profile_to_dict(spot_rows) for name, spot_rows in rows_by_spot.items()}
+    else:
+        for name, period_start, mean, minimum, maximum, rate, num_values in rows:
+            aggregates.setdefault(name, dict())[period_start.isoformat(timespec='seconds')] = {
+                "mean": round(mean, 4), "min": minimum, "max": maximum,
+                "rate": round(rate, 4) if rate is not None else None, "count": num_values}
+    return jsonify({"resolution": resolution, "aggregates": aggregates})
 
-    # ### month
-    interpolated_complete_data['Monat'] = interpolated_complete_data.index.month
 
-    # ### holidays
-    #
+@app.route('/occupancy/updateRollups')
+def update_occupancy_rollups():
+    """ Endpoint for the occupancy ingest, refreshes the rollups of /occupancy/aggregate.
 
-    feiertageRlp_df = feiertageRlp
-    feiertageHe_df = feiertageHe
+        Returns:
+            id of the background job which recomputes the rollups touched since the last refresh
+    """
+    return enqueue_job_response("occupancy_rollups", refresh_occupancy_rollups)
 
-    feiertagseries_rlp = pd.Series(interpolated_complete_data.index, name='Feiertage',
-                                   index=interpolated_complete_data.index).apply(shoppingdaystonextfeiertag, args=(feiertageRlp,))
-    feiertagseries_he = pd.Series(interpolated_complete_data.index, name='Feiertage',
-                                  index=interpolated_complete_data.index).apply(shoppingdaystonextfeiertag, args=(feiertageHe,))
-    interpolated_complete_data['bisFeiertagRlp'] = feiertagseries_rlp
-    interpolated_complete_data['bisFeiertagHe'] = feiertagseries_he
 
-    after_feiertagseries_01 = pd.Series(interpolated_complete_data.index, name='Feiertage',
-                                        index=interpolated_complete_data.index).apply(shoppingdaysafterfeiertag, args=(feiertageRlp,))
-    after_feiertagseries_02 = pd.Series(interpolated_complete_data.index, name='Feiertage',
-                                        index=interpolated_complete_data.index).apply(shoppingdaysafterfeiertag, args=(feiertageHe,))
-    interpolated_complete_data['nachFeiertagRlp'] = after_feiertagseries_01
-    interpolated_complete_data['nachFeiertagHe'] = after_feiertagseries_02
+@app.route('/metrics')
+def show_metrics():
+    """ Endpoint for Prometheus.
 
-    # ### vacations
+        Returns:
+            latency, response size and SQL query metrics of this process per route
+    """
+    return Response(request_metrics.render(), content_type=CONTENT_TYPE)
 
-    interpolated_complete_data['SchulferienRlp'] = 0
-    for sf in ferienRlp.iterrows():
-        interpolated_complete_data['SchulferienRlp'].loc[sf[1]
-                                                         ['start']:sf[1]['end']] = 1
 
-    interpolated_complete_data['SchulferienHe'] = 0
-    for sf in ferienHe.iterrows():
-        interpolated_complete_data['SchulferienHe'].loc[sf[1]
-                                                        ['start']:sf[1]['end']] = 1
+@app.route('/jobs/<int:job_id>')
+def show_job(job_id):
+    """ Endpoint for the state of background jobs.
 
-    # ### Christmas
-    weihnachtsseries = pd.Series(interpolated_complete_data.index, name='Weihnachten',
-                                 index=interpolated_complete_data.index).apply(isweihnachten)
-    interpolated_complete_data['Weihnachten'] = weihnachtsseries
+        Returns:
+            status, timings and number of written records of a job as json
+    """
+    job = db.session.query(Job).get(job_id)
+    if job is None:
+        return jsonify({"message": "job {} not found".format(job_id)}), 404
+    return jsonify(job_to_dict(job))
 
-    return interpolated_complete_data
 
-def calcCalendarWeek(df):
-    """ calculates actual calender week.
+    ############################
+    #### utility functions #####
+    ############################
+
+def enqueue_job_response(name, function):
+    """ enqueues a background job, concurrent triggers share one job.
+
+        Returns:
+            json with the job id and the url of its status, HTTP 202
     """
-    now = df.date()
-    kw = datetime2.date(now.year, now.month, now.day).isocalendar()[1]
-    return kw
+    job = enqueue_job(name, function)
+    return jsonify({"job": job.id, "status": job.status, "url": url_for('show_job', job_id=job.id)}), 202
 
 
-# ### working days till next holiday
-oldDay = ''
-olddiffs = ''
+def predict_parkingspot(name, feature_df):
+    """ predicts the occupancy of one parking spot, runs in a worker thread.
 
-def shoppingdaystonextfeiertag(df, feiertage):
-    """ calculates workingdays till next holiday.
+        Returns:
+            predicted occupancies as dataframe and the 7x24 rmse grid of the parking spot
     """
-    global oldDay
-    global olddiffs
-    diffs = []
-    if df.date() == oldDay:
-        try:
-            return min([d for d in olddiffs if d >= 0])
-        except:
-            return 100  # if no holiday found
-    else:
-        for feiertag in feiertage.date:
-            diff = np.busday_count(
-                df.date(), feiertag.date(), weekmask='Mon Tue Wed Thu Fri Sat')
-            diffs.append(diff)
-        oldDay = df.date()
-        olddiffs = diffs
-    try:
-        return min([d for d in diffs if d >= 0])
-    except:
-        return 100  # if no holiday found
+    # artifacts are loaded once per worker and reused across requests
+    targetencoder, scalerload, modelload, rmsegrid, leaderload = model_registry.get(name)
+
+    # target encode
+    feature_df = pd.DataFrame(index=feature_df.index, data=targetencoder.transform(
+        feature_df.copy()), columns=feature_df.columns)
+    # min max scale
+    feature_df = pd.DataFrame(index=feature_df.index, data=scalerload.transform(
+        feature_df), columns=feature_df.columns)
 
+    # predict with loaded model
+    predictedBelegung = modelload.predict(feature_df)
+    predictedBelegung = pd.DataFrame(
+        index=feature_df.index, data=(predictedBelegung).astype('int'))
+    return predictedBelegung, rmsegrid
 
-# ## weekdays after holiday
-oldDay = ''
-olddiffs = ''
 
+# query parameters of /historicOccupancy and /historicMaxOccupancy answered from the database
+HISTORIC_FILTERS = ("spot", "from", "to", "limit", "cursor")
 
-def shoppingdaysafterfeiertag(df, feiertage):
-    """ calculates workingdays after last holiday.
+
+def has_historic_filters():
+    """ tells if a historic occupancy request filters or paginates, other parameters like cache busters are ignored
+    Returns: bool
     """
-    global oldDay
-    global olddiffs
-    diffs = []
-    if df.date() == oldDay:
-        try:
-            return min([d for d in olddiffs if d >= 0])
-        except:
-            return 100  # wenn kein Feiertag gefunden
-    else:
-        for feiertag in feiertage.date:
-            diff = np.busday_count(
-                feiertag.date(), df.date(), weekmask='Mon Tue Wed Thu Fri Sat')
-            # print('%s bis %s: %i Arbeitstage' % (feiertag, df, diff))
-            diffs.append(diff)
-        oldDay = df.date()
-        olddiffs = diffs
+    return any(name in request.args for name in HISTORIC_FILTERS)
+
+
+def stream_historic_occupancies(column):
+    """ streams one column of historic_occupancy as chunked json \n
+        rows are ordered by parkingspot and timestamp, which matches the index
+        on (parkingspot_id, datetime) and allows keyset pagination
+    Returns: streamed response {"occupancies": {spot: {timestamp: value}}, "next": cursor}
+    """
+    spots = request.args.getlist('spot')
     try:
-        return min([d for d in diffs if d >= 0])
-    except:
-        return 100  # wenn kein Feiertag gefunden
+        start = parse_datetime_arg('from')
+        end = parse_datetime_arg('to')
+        limit = request.args.get('limit')
+        if limit is not None:
+            limit = int(limit)
+            if limit < 1:
+                raise ValueError("limit has to be positive")
+        cursor = request.args.get('cursor')
+        if cursor is not None:
+            cursor_id, cursor_timestamp = cursor.split("_", 1)
+            cursor_id = int(cursor_id)
+            cursor_timestamp = datetime.strptime(cursor_timestamp, "%Y-%m-%dT%H:%M:%S")
+    except ValueError as e:
+        return jsonify({"message": "invalid query parameter: {}".format(e)}), 400
+
+    query = db.session.query(HistoricOccupancy.parkingspot_id, Parkingspot.name, HistoricOccupancy.datetime, column).join(
+        Parkingspot, HistoricOccupancy.parkingspot_id == Parkingspot.id)
+    if spots:
+        query = query.filter(Parkingspot.name.in_(spots))
+    if start is not None:
+        query = query.filter(HistoricOccupancy.datetime >= start)
+    if end is not None:
+        query = query.filter(HistoricOccupancy.datetime < end)
+    if cursor is not None:
+        query = query.filter(or_(HistoricOccupancy.parkingspot_id > cursor_id,
+                                 and_(HistoricOccupancy.parkingspot_id == cursor_id,
+                                      HistoricOccupancy.datetime > cursor_timestamp)))
+    query = query.order_by(HistoricOccupancy.parkingspot_id, HistoricOccupancy.datetime)
+    if limit is not None:
+        # one additional row tells if there is a next page
+        query = query.limit(limit + 1)
+    query = query.execution_options(stream_results=True).yield_per(1000)
+
+    def generate():
+        chunk = ['{"occupancies": {']
+        current_id = None
+        last = None
+        next_cursor = None
+        num_rows = 0
+        for parkingspot_id, name, timestamp, value in query:
+            if limit is not None and num_rows == limit:
+                next_cursor = "{}_{}".format(last[0], last[1].strftime("%Y-%m-%dT%H:%M:%S"))
+                break
+            if parkingspot_id != current_id:
+                if current_id is not None:
+                    chunk.append('}, ')
+                chunk.append(json.dumps(name) + ': {')
+                current_id = parkingspot_id
+            else:
+                chunk.append(', ')
+            chunk.append('"{}": {}'.format(timestamp.strftime("%Y-%m-%dT%H:%M:%S"), value))
+            last = (parkingspot_id, timestamp)
+            num_rows += 1
+            if len(chunk) >= 2000:
+                yield "".join(chunk)
+                chunk = []
+        if current_id is not None:
+            chunk.append('}')
+        chunk.append('}, "next": ' + json.dumps(next_cursor) + '}')
+        yield "".join(chunk)
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def parse_datetime_arg(name):
+    """ parses an optional ISO formatted query parameter, values with a UTC offset are converted to the naive
+    local time of the stored occupancies
+    Returns: datetime or None
+    """
+    value = request.args.get(name)
+    if value is None:
+        return None
+    value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
 
-def isweihnachten(series):
-    """ flags december as christmas month.
+
+def create_feature_df(ferienRlp, ferienHe, feiertageRlp, feiertageHe):
+    """ calendar features of the next 7 days in 15 minute steps, sliced from the calendar feature store.
     """
-    if series.month == 12:
-        return 1
-    else:
-        return 0
+    now = datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
+    interpolated_complete_data = calendar_features.features(
+        now, now+relativedelta(days=7), ferienRlp, ferienHe, feiertageRlp, feiertageHe)
 
+    # dtypes the models were trained with
+    interpolated_complete_data = interpolated_complete_data.astype('int64')
+    interpolated_complete_data['Uhrzeit'] = interpolated_complete_data['Uhrzeit'].astype(float)
+    return interpolated_complete_data
 
-def fillMissingValues(timeseries, column):
+
+def fillMissingValues(timeseries, column=None):
     """
     Fills all zero values(=-999) with the mean value of the previous 4 weeks 
-    on the same weekday at the same time of day.
+    and the following 4 weeks on the same weekday at the same time of day.
 
-    If no values are found, the values of the following 4 weeks are used.
+    column can be a single column, a list of columns or None for all columns.
+    Values without a valid (> -1) value in these 8 weeks stay -999.
     """
+    if column is None:
+        columns = list(timeseries.columns)
+    elif isinstance(column, (list, tuple, pd.Index)):
+        columns = list(column)
+    else:
+        columns = [column]
     copydf = timeseries.copy()
-    for index, row in timeseries.iterrows():
-        if row[column] == -999:
-            count_valid_weeks = 0
-            sum_belegung = 0
-            week_minus1 = index - datetime.timedelta(days=7)
-            week_minus2 = index - datetime.timedelta(days=14)
-            week_minus3 = index - datetime.timedelta(days=21)
-            week_minus4 = index - datetime.timedelta(days=28)
-            try:
-                belegung_week_minus1 = timeseries.loc[week_minus1][column]
-                if belegung_week_minus1 > -1:
-                    count_valid_weeks += 1
-                    sum_belegung += belegung_week_minus1
-            except:
-                pass
-            try:
-                belegung_week_minus2 = timeseries.loc[week_minus2][column]
-                if belegung_week_minus2 > -1:
-                    count_valid_weeks += 1
-                    sum_belegung += belegung_week_minus2
-            except:
-                pass
-            try:
-                belegung_week_minus3 = timeseries.loc[week_minus3][column]
-                if belegung_week_minus3 > -1:
-                    count_valid_weeks += 1
-                    sum_belegung += belegung_week_minus3
-            except:
-                pass
-            try:
-                belegung_week_minus4 = timeseries.loc[week_minus4][column]
-                if belegung_week_minus4 > -1:
-                    count_valid_weeks += 1
-                    sum_belegung += belegung_week_minus4
-            except:
-                pass
-            week_plus1 = index + datetime.timedelta(days=7)
-            week_plus2 = index + datetime.timedelta(days=14)
-            week_plus3 = index + datetime.timedelta(days=21)
-            week_plus4 = index + datetime.timedelta(days=28)
-            try:
-                belegung_week_plus1 = timeseries.loc[week_plus1][column]
-                if belegung_week_plus1 > -1:
-                    count_valid_weeks += 1
-                    sum_belegung += belegung_week_plus1
-            except:
-                pass
-            try:
-                belegung_week_plus2 = timeseries.loc[week_plus2][column]
-                if belegung_week_plus2 > -1:
-                    count_valid_weeks += 1
-                    sum_belegung += belegung_week_plus2
-            except:
-                pass
-            try:
-                belegung_week_plus3 = timeseries.loc[week_plus3][column]
-                if belegung_week_plus3 > -1:
-                    count_valid_weeks += 1
-                    sum_belegung += belegung_week_plus3
-            except:
-                pass
-            try:
-                belegung_week_plus4 = timeseries.loc[week_plus4][column]
-                if belegung_week_plus4 > -1:
-                    count_valid_weeks += 1
-                    sum_belegung += belegung_week_plus4
-            except:
-                pass
-            if count_valid_weeks > 0:
-                mean_occupancy_4weeks = sum_belegung / count_valid_weeks
-                copydf.loc[index][column] = mean_occupancy_4weeks
-        else:
-            pass
-
+    values = timeseries[columns].to_numpy(dtype=float)
+    missing = values == -999
+    if not missing.any():
+        return copydf
+
+    # the same weekday and time of day in the other weeks
+    is_valid = values > -1
+    valid_values = np.where(is_valid, values, 0)
+    sum_belegung = np.zeros(values.shape)
+    count_valid_weeks = np.zeros(values.shape)
+    index = timeseries.index
+    step = pd.Timedelta(minutes=15)
+    if len(index) > 1 and index.is_monotonic_increasing and (index[-1] - index[0]) == step * (len(index) - 1) \
+            and index.is_unique:
+        # regular 15 minute grid: shifted views instead of lookups
+        for weeks in [1, 2, 3, 4]:
+            periods = weeks * 7 * 96
+            if periods >= len(index):
+                break
+            sum_belegung[periods:] += valid_values[:-periods]
+            count_valid_weeks[periods:] += is_valid[:-periods]
+            sum_belegung[:-periods] += valid_values[periods:]
+            count_valid_weeks[:-periods] += is_valid[periods:]
+    else:
+        # look up the timestamps of the other weeks, missing timestamps are skipped
+        is_first = ~index.duplicated()
+        lookup_index = index[is_first]
+        for weeks in [-4, -3, -2, -1, 1, 2, 3, 4]:
+            positions = lookup_index.get_indexer(index + pd.Timedelta(days=7 * weeks))
+            found = positions >= 0
+            sum_belegung[found] += valid_values[is_first][positions[found]]
+            count_valid_weeks[found] += is_valid[is_first][positions[found]]
+
+    fill = missing & (count_valid_weeks > 0)
+    for i, name in enumerate(columns):
+        if fill[:, i].any():
+            copydf[name] = np.where(fill[:, i], sum_belegung[:, i] / np.maximum(count_valid_weeks[:, i], 1), values[:, i])
     return copydf
 
 
-def drop_constant_rows_from_df(df, column_to_look_at, number_of_constant_rows):
-    h = 0
-    to_delete = []
-    list_of_indices_which_get_deleted = []
+def drop_constant_rows_from_df(df, column_to_look_at=None, number_of_constant_rows=4):
+    """
+    Marks stuck sensors: runs in which a value repeats more than
+    number_of_constant_rows times in a row are set to -999, except for the
+    last row of the run. A run reaching the end of the dataframe is marked too.
+
+    column_to_look_at can be a single column, a list of columns or None for
+    all columns, every column is checked in the same vectorized pass.
+
+    Returns: index of the marked rows (dict column -> index for several columns)
+             and a copy of the dataframe with the marked values set to -999
+    """
+    single_column = column_to_look_at is not None and not isinstance(column_to_look_at, (list, tuple, pd.Index))
+    columns = [column_to_look_at] if single_column else list(
+        df.columns if column_to_look_at is None else column_to_look_at)
+    values = df[columns].to_numpy()
+    num_rows = len(values)
+
+    # row h belongs to a run if it equals row h+1, runs start where this flips to True
+    padded = np.zeros((num_rows + 1, len(columns)), dtype=np.int8)
+    padded[1:num_rows] = values[1:] == values[:-1]
+    edges = np.diff(padded, axis=0)
+    start_columns, starts = np.nonzero(edges.T == 1)
+    end_columns, ends = np.nonzero(edges.T == -1)
+    is_long = (ends - starts) > number_of_constant_rows
+    marks = np.zeros((num_rows + 1, len(columns)), dtype=np.int32)
+    np.add.at(marks, (starts[is_long], start_columns[is_long]), 1)
+    np.add.at(marks, (ends[is_long], end_columns[is_long]), -1)
+    is_constant = np.cumsum(marks, axis=0)[:num_rows] > 0
 
-    for index, row in df.iterrows():
-        if (h < len(df.free)-1):
-            if row[column_to_look_at] == df[column_to_look_at][h+1]:
-                to_delete.append(index)
-            else:
-                if (len(to_delete) > number_of_constant_rows):
-                    list_of_indices_which_get_deleted.extend(to_delete)
-                to_delete = []
-        h += 1
     df_return = df.copy()
+    indices = dict()
+    for i, column in enumerate(columns):
+        indices[column] = df.index[is_constant[:, i]]
+        if is_constant[:, i].any():
+            df_return[column] = np.where(is_constant[:, i], -999, values[:, i])
+    if single_column:
+        return list(indices[column_to_look_at]), df_return
+    return indices, df_return
 
-    for each in list_of_indices_which_get_deleted:
-        df_return.loc[each][column_to_look_at] = -999
-    return list_of_indices_which_get_deleted, df_return
+
+class ConstantRunDetector(object):
+    """
+    Online counterpart of drop_constant_rows_from_df for readings that arrive one by one
+
+    Keeps the last value and the number of repeats of every parking spot, so
+    each new reading is checked in O(1) without rescanning the history. A
+    reading is flagged as soon as its value has been repeated more than
+    number_of_constant_rows times; earlier readings of the run are not
+    flagged retroactively.
+
+    Methods
+    -------
+    update(spot, value)
+        adds a reading, returns True if it belongs to a stuck run
+    """
+
+    def __init__(self, number_of_constant_rows=4):
+        self.number_of_constant_rows = number_of_constant_rows
+        self._state = dict()
+
+    def update(self, spot, value):
+        """ adds the next reading of a parking spot
+        Returns: True if the value has been repeated more than number_of_constant_rows times
+        """
+        last_value, repeats = self._state.get(spot, (None, 0))
+        repeats = repeats + 1 if value == last_value else 0
+        self._state[spot] = (value, repeats)
+        return repeats > self.number_of_constant_rows
+
+
+def historicLagFeatures(df, lags, windows=(1,), step=1, columns=None, dtype=np.float32, dropna=False):
+    """
+    Lag features of many parking spots at once
+
+    For every column, lag and window the feature is the mean of the values
+    lag, lag + step, ..., lag + (window - 1) * step rows earlier (lags and
+    step in 15 minute rows, e.g. lag=672 and step=672 averages the same
+    quarter hour of the previous weeks). A feature is NaN if one of its
+    values is missing. Every feature is the difference of two shifted slices
+    of one cumulative sum over the rows step apart, so the memory does not
+    grow with the number of lags or the window size.
+
+    Returns: dataframe with one column '<column>_lag<lag>_w<window>' per combination
+    """
+    columns = list(df.columns) if columns is None else list(columns)
+    lags = list(dict.fromkeys(int(lag) for lag in lags))
+    windows = sorted(set(int(window) for window in windows))
+    if min(lags) < 0 or windows[0] < 1:
+        raise ValueError("lags must not be negative and windows must be positive")
+    values = df[columns].to_numpy(dtype=np.float64)
+    num_rows = len(values)
+    missing = np.isnan(values)
+
+    # sums[padding + i] = values[i] + values[i - step] + ..., zeros before the first row,
+    # accumulated in float64 so the differences keep the precision of dtype
+    padding = max(lags) + windows[-1] * step
+    sums = _strided_cumsum(np.where(missing, 0.0, values), step, padding)
+    num_missing = _strided_cumsum(missing.astype(np.float64), step, padding)
+
+    data = np.empty((num_rows, len(columns), len(lags), len(windows)), dtype=dtype)
+    for l, lag in enumerate(lags):
+        end = padding - lag
+        for w, window in enumerate(windows):
+            start = end - window * step
+            means = (sums[end:end + num_rows] - sums[start:start + num_rows]) / window
+            means[num_missing[end:end + num_rows] > num_missing[start:start + num_rows]] = np.nan
+            # windows reaching before the first row
+            means[:lag + (window - 1) * step] = np.nan
+            data[:, :, l, w] = means
+
+    names = ["{}_lag{}_w{}".format(column, lag, window)
+             for column in columns for lag in lags for window in windows]
+    features = pd.DataFrame(data.reshape(num_rows, -1), index=df.index, columns=names)
+    if dropna:
+        features.dropna(inplace=True)
+    return features
+
+
+def _strided_cumsum(values, step, padding):
+    """ cumulative sums of the rows step apart, preceded by padding rows of zeros
+    Returns: array with padding + len(values) rows
+    """
+    num_rows = padding + len(values)
+    num_blocks = -(-num_rows // step)
+    sums = np.zeros((num_blocks * step,) + values.shape[1:])
+    sums[num_blocks * step - len(values):] = values
+    # row i of block b is row b * step + i, so the cumsum over the blocks adds up every step-th row
+    np.cumsum(sums.reshape((num_blocks, step) + values.shape[1:]), axis=0,
+              out=sums.reshape((num_blocks, step) + values.shape[1:]))
+    return sums[num_blocks * step - num_rows:]
 
 
 def historicshift(df, column='Belegung', lagsize=2, T=999, shifttime=336, dropna=True, timestap=336):
-    newdf = pd.DataFrame(index=df.index, data=0, columns=['histBelegung'])
-    for i in range(0, lagsize):
-        newdf['histBelegung'] = newdf['histBelegung'] + \
-            df[column].shift(shifttime+(timestap*i))
-    newdf['histBelegung'] = newdf['histBelegung']/lagsize
-    newdf.dropna(inplace=True)
+    newdf = historicshift2(df, column, lagsize, T, shifttime, dropna, timestap)
+    newdf.columns = ['histBelegung']
     return newdf
 
 
 def historicshift2(df, column='Belegung', lagsize=2, T=999, shifttime=336, dropna=True, timestap=336):
-    name = 'hist'+column
-    newdf = pd.DataFrame(index=df.index, data=0, columns=[name])
-    for i in range(0, lagsize):
-        newdf[name] = newdf[name] + df[column].shift(shifttime+(timestap*i))
-    newdf[name] = newdf[name]/lagsize
-    newdf.dropna(inplace=True)
+    # float64 keeps the features of the trained models unchanged
+    newdf = historicLagFeatures(df, [shifttime], windows=[lagsize], step=timestap, columns=[column],
+                                dtype=np.float64, dropna=True)
+    newdf.columns = ['hist'+column]
     return newdf
@@ -0,0 +1,84 @@
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0
+
+# loaded catalogues: resolved path -> (mtime, StationCatalogue)
+_catalogues = dict()
+_lock = threading.Lock()
+
+
+class StationCatalogue(object):
+    """
+    A class used to find the nearest weather stations of a location
+
+    The stations are indexed in a KD-tree over their positions on the unit
+    sphere, so a lookup costs O(log n) and the chord distance orders the
+    stations like the great circle distance.
+
+
+    Attributes
+    ----------
+    stations : DataFrame
+        one row per station with the columns station_id, station_name, lat and lon
+
+    Methods
+    -------
+    nearest(lat, lon, k=1)
+        returns the ids of and the distances to the k nearest stations
+    """
+
+    def __init__(self, stations):
+        self.stations = stations.reset_index(drop=True)
+        self._tree = cKDTree(_to_unit_vectors(self.stations["lat"].values, self.stations["lon"].values))
+
+    @classmethod
+    def from_csv(cls, path):
+        """ reads a catalogue with the columns station_id, station_name, lat, lon and height
+        """
+        return cls(pd.read_csv(path, dtype={"station_id": str}))
+
+    def nearest(self, lat, lon, k=1):
+        """ looks up the nearest stations of one or many locations
+        Returns: station ids and distances in km, shaped (n, k) for arrays of locations
+        """
+        k = min(k, len(self.stations))
+        chords, indices = self._tree.query(_to_unit_vectors(lat, lon), k=k)
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chords) / 2, 0, 1))
+        return self.stations["station_id"].values[indices], distances
+
+
+def getStationCatalogue(path):
+    """ returns the station catalogue of a file, read again when the file changes
+    Returns: StationCatalogue
+    """
+    path = Path(path).resolve()
+    mtime = path.stat().st_mtime_ns
+    with _lock:
+        entry = _catalogues.get(path)
+        if entry is None or entry[0] != mtime:
+            entry = (mtime, StationCatalogue.from_csv(path))
+            _catalogues[path] = entry
+        return entry[1]
+
+
+def nearestStations(catalogue, parkingspots):
+    """ maps parking spots to their nearest station
+    Returns: dict with the station id of every parking spot id
+    """
+    if not parkingspots:
+        return dict()
+    lat = np.array([parkingspot.lat for parkingspot in parkingspots], dtype=float)
+    lon = np.array([parkingspot.lon for parkingspot in parkingspots], dtype=float)
+    station_ids, distances = catalogue.nearest(lat, lon)
+    return {parkingspot.id: station_id for parkingspot, station_id in zip(parkingspots, station_ids)}
+
+
+def _to_unit_vectors(lat, lon):
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)